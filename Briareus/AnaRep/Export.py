@@ -0,0 +1,140 @@
+"""Machine-readable export of build report entries.
+
+Unlike the text and HTML summaries, these exporters do not build any
+tables: each report entry is converted and written as it is read, so
+the entire report never needs to be held in memory.
+
+  * JSON Lines: one JSON object per report entry (of any type).
+
+  * CSV: one row per build status entry (StatusReport, PendingStatus,
+    and NewPending); other entries are not written.
+
+The entries can be selected by project and by status, where the status
+is either the status from the report (e.g. "succeeded", "bad_config",
+or a failure count) or the summarized result: "ok", "FAIL", "badcfg",
+or "pending".
+"""
+
+import attr
+import csv
+import json
+from Briareus.Types import *
+from Briareus.BuildSys import buildcfg_name
+
+
+def entry_project(entry):
+    "Returns the project name for this report entry (or None)"
+    if isinstance(entry, NewPending):
+        return entry.bldcfg.projectname
+    if isinstance(entry, Notify):
+        return entry.subject
+    if isinstance(entry, SendEmail):
+        return entry.notification.subject
+    if isinstance(entry, ProjectSummary):
+        return entry.project_name
+    return getattr(entry, 'project', None)
+
+
+def entry_status(entry):
+    """Returns the (status, result) for a build status entry, or (None,
+       None) for any other entry.
+    """
+    if isinstance(entry, StatusReport):
+        return (entry.status,
+                { 'initial_success': 'ok',
+                  'succeeded': 'ok',
+                  'fixed': 'ok',
+                  'bad_config': 'badcfg',
+                }.get(entry.status, 'FAIL'))
+    if isinstance(entry, (PendingStatus, NewPending)):
+        return ('pending', 'pending')
+    return (None, None)
+
+
+def select_entries(entries, projects=None, statuses=None):
+    """Generates the entries that are for one of the projects (if
+       specified) and have one of the statuses or results (if
+       specified).
+    """
+    for entry in entries:
+        if projects and entry_project(entry) not in projects:
+            continue
+        if statuses and not set([ str(s) for s in entry_status(entry)
+                                  if s is not None ]).intersection(statuses):
+            continue
+        yield entry
+
+
+def _build_fields(entry):
+    if isinstance(entry, NewPending):
+        cfg = entry.bldcfg
+        return { 'branchtype': cfg.branchtype,
+                 'branch': cfg.branchname,
+                 'strategy': cfg.strategy,
+                 'buildname': buildcfg_name(cfg),
+                 'bldvars': cfg.bldvars,
+        }
+    return { 'branchtype': entry.branchtype,
+             'branch': entry.branch,
+             'strategy': entry.strategy,
+             'buildname': entry.buildname,
+             'bldvars': entry.bldvars,
+    }
+
+
+def export_record(entry):
+    "Returns a JSON-serializable dict describing the report entry."
+    if isinstance(entry, (StatusReport, PendingStatus, NewPending)):
+        status, result = entry_status(entry)
+        fields = _build_fields(entry)
+        return { 'type': type(entry).__name__,
+                 'project': entry_project(entry),
+                 'status': status,
+                 'result': result,
+                 'branchtype': fields['branchtype'],
+                 'branch': fields['branch'],
+                 'strategy': fields['strategy'],
+                 'buildname': fields['buildname'],
+                 'variables': dict([ (v.varname, v.varvalue) for v in fields['bldvars'] ]),
+        }
+    rec = attr.asdict(entry) if attr.has(type(entry)) else { 'value': entry }
+    rec['type'] = type(entry).__name__
+    return rec
+
+
+def _json_default(obj):
+    if attr.has(type(obj)):
+        return dict(attr.asdict(obj), type=type(obj).__name__)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    return str(obj)
+
+
+def jsonl_export(entries, outf):
+    "Writes each entry to outf as a line of JSON; returns the number written."
+    count = 0
+    for entry in entries:
+        outf.write(json.dumps(export_record(entry), default=_json_default, sort_keys=True))
+        outf.write('\n')
+        count += 1
+    return count
+
+
+csv_columns = [ 'project', 'result', 'status', 'branchtype', 'branch',
+                'strategy', 'buildname', 'variables' ]
+
+def csv_export(entries, outf):
+    """Writes a header and then a CSV row for each build status entry to
+       outf; returns the number of rows written (excluding the header).
+    """
+    writer = csv.writer(outf)
+    writer.writerow(csv_columns)
+    count = 0
+    for entry in entries:
+        if not isinstance(entry, (StatusReport, PendingStatus, NewPending)):
+            continue
+        rec = export_record(entry)
+        rec['variables'] = ' '.join([ '%s=%s' % kv for kv in sorted(rec['variables'].items()) ])
+        writer.writerow([ rec[c] for c in csv_columns ])
+        count += 1
+    return count
@@ -4,6 +4,7 @@ from collections import defaultdict
 from Briareus.KVITable import KVITable
 from Briareus.Types import (StatusReport, PendingStatus, NewPending, Notify)
 from Briareus.BuildSys import buildcfg_name
+from Briareus.AnaRep.ReportIndex import ReportIndex
 from Briareus.AnaRep.TextSummary import tbl_branch, tbl_branch_
 
 _inc = lambda n: n + 1
@@ -88,17 +89,15 @@ def html_summary(repdata, base_builder_url=None):
     subsection_hdrfun = lambda msg: '<br/><h3>' + msg + '</h3>'
     entshow_fun = tcell_entshow(base_builder_url)
 
-    projects = set([ sr.project for sr in repdata if isinstance(sr, StatusReport) ])
+    repidx = ReportIndex.of(repdata)
+    projects = repidx.projects
 
     summary = KVITable(default_factory=int, valuecol_name='Total')
     summary.add(len(projects), Element='Projects')
-    summary.add(len(set([sr.branch for sr in repdata
-                         if isinstance(sr, StatusReport) and sr.branchtype=='pullreq'])), Element='Pull Requests')
+    summary.add(len(repidx.pullreq_branches()), Element='Pull Requests')
 
     projtable = KVITable({
-        'Project': sorted(list(set([ sr.project
-                                     for sr in repdata
-                                     if isinstance(sr, StatusReport) ]))),
+        'Project': sorted(list(projects)),
         'Status': [ 'TOTAL', 'ok', 'FAIL', 'pending' ],
     },
                          valuecol_name='Number',
@@ -131,21 +130,18 @@ def html_summary(repdata, base_builder_url=None):
                                 # 'pending': 'pending',
     }.get(s, 'FAIL')
 
-    for sr in repdata:
+    for sr in repidx:
 
         if isinstance(sr, Notify):
             summary.add(_inc, Element='Notifications')
 
         elif isinstance(sr, PendingStatus):
-            prev = [ r for r in repdata
-                     if isinstance(r, StatusReport)
-                     and r.project == sr.project
-                     and r.buildname == sr.buildname ]
+            prev = repidx.status_report(sr.project, sr.buildname)
             if not prev:
                 summary.add(_inc, Element='Builds')
                 projtable.add(_inc, Project=sr.project, Status="TOTAL")
             else:
-                projtable.add(_dec, Project=sr.project, Status=projtable_sts(prev[0].status))
+                projtable.add(_dec, Project=sr.project, Status=projtable_sts(prev.status))
             projtable.add(_inc, Project=sr.project, Status="pending")
             vars = tuple([ (v.varname, v.varvalue) for v in sr.bldvars ])
 
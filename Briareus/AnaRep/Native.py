@@ -0,0 +1,464 @@
+# Native (pure Python) evaluation of the built_analysis logic.
+#
+# This computes the same report, analysis, action, and do results as
+# the built_analysis.pl logic (reportrules.pl and analysis.pl, using
+# the build configurations of buildcfg.pl) directly from the input
+# descriptions, the build results, the prior report, and the
+# Reporting logic facts.  The build results are indexed by project,
+# branch, and strategy, so each rule is a lookup or a single pass over
+# the results of interest rather than a scan of all of the bldres
+# facts.  The comments identify the corresponding Prolog predicates;
+# any change to that logic must also be made here (the "compare"
+# engine of AnaRep checks that the two produce the same results).
+#
+# The Reporting logic must consist only of facts (see
+# Briareus.Logic.Terms); anything else raises UnsupportedLogic and
+# the logic engine must be used.
+
+import attr
+from collections import defaultdict
+from Briareus.Types import (BldConfig, BldRepoRev, BldVariable, BranchCfg,
+                            CompletelyFailing, NewPending, Notify, PendingStatus,
+                            PostChatMessage, PR_Grouped, PR_Repogroup, PR_Solo,
+                            PR_Status, PRCfg, PRData, PRFailData, SendEmail,
+                            SepHandledVar, StatusReport, VarFailure, logic_result_expr)
+from Briareus.BCGen.Generator import VarMatrix
+from Briareus.BCGen.Native import BuildFacts, NativeBuildConfigs, STRATEGIES, uniq
+from Briareus.Logic.Terms import Atom, Term, UnsupportedLogic, Var, read_facts, unify
+
+
+# Predicates used by the analysis rules that the Reporting logic
+# facts cannot (natively) extend.
+_reserved_predicates = [ 'report', 'analysis', 'action', 'do', 'action_to',
+                         'email', 'chat', 'bldres', 'prior_status', 'project',
+                         'repo', 'subrepo', 'branch', 'branchreq', 'main_branch',
+                         'pullreq', 'submodule', 'varname', 'varvalue' ]
+
+# Notifications for which the project_owner is also emailed (action_to/3)
+_owner_notifications = [ 'main_broken', 'main_good', 'completely_broken',
+                         'main_submodules_broken', 'main_submodules_good' ]
+
+# Notifications for which prior_fact_SendEmail writes the parameters
+# as a list of strings.
+_strlist_notifications = [ 'main_submodules_broken', 'main_submodules_good',
+                           'main_broken', 'main_good' ]
+
+_result_var = Var(('result',))  # never in the Reporting logic
+
+
+@attr.s(frozen=True, slots=True)
+class BldRes(object):
+    "A build result (bldres/12), with the strategy as the logic atom"
+    project     = attr.ib()
+    branchtype  = attr.ib()
+    branch      = attr.ib()
+    strategy    = attr.ib()
+    bldvars     = attr.ib()  # tuple of BldVariable
+    buildname   = attr.ib()
+    nrtotal     = attr.ib()
+    nrsucceeded = attr.ib()
+    nrfailed    = attr.ib()
+    nrscheduled = attr.ib()
+    cfgvalid    = attr.ib()
+    blddesc     = attr.ib()
+
+    @property
+    def good(self):
+        return (self.cfgvalid and self.nrtotal == self.nrsucceeded and
+                self.nrfailed == 0 and self.nrscheduled == 0)
+
+    @property
+    def pending(self):
+        return self.cfgvalid and self.nrscheduled > 0
+
+
+def good_status(status):
+    return status in ['succeeded', 'initial_success', 'fixed']
+
+def bad_status(status):
+    return isinstance(status, int) or status in ['failed', 'badconfig']
+
+def listcmp(vars1, vars2):
+    return all([ v in vars2 for v in vars1 ])
+
+def cmp_blddesc(desc1, desc2):
+    """Returns the pre-eminent build description if the two are
+       equivalent (cmpBldDesc/3), otherwise None.
+    """
+    if desc1 == desc2:
+        return desc1
+    for (solo, group) in [ (desc1, desc2), (desc2, desc1) ]:
+        if (isinstance(solo, PR_Solo) and isinstance(group, PR_Repogroup) and
+            solo.pullreq_id == group.pullreq_id and solo.reponame in group.reponames):
+            return group
+    return None
+
+
+def as_term(value):
+    "Returns the logic term for a report value"
+    if isinstance(value, list):
+        return [ as_term(v) for v in value ]
+    if isinstance(value, BldVariable):
+        return Term('varvalue', [value.project, value.varname, value.varvalue])
+    if isinstance(value, PR_Solo):
+        return Term('pr_type', [Atom('pr_solo'), value.reponame, value.pullreq_id])
+    if isinstance(value, PR_Repogroup):
+        return Term('pr_type', [Atom('pr_repogroup'), value.pullreq_id, list(value.reponames)])
+    if isinstance(value, PR_Grouped):
+        return Term('pr_type', [Atom('pr_grouped'), value.branchname])
+    if isinstance(value, (PRCfg, BranchCfg, PRData, PRFailData)):
+        functor = { PRCfg: 'prcfg', BranchCfg: 'branchcfg',
+                    PRData: 'prdata', PRFailData: 'prfaildata' }[type(value)]
+        return Term(functor, [ as_term(v) for v in attr.astuple(value, recurse=False) ])
+    if isinstance(value, Notify):
+        return Term('notify', [Atom(value.what), value.subject, as_term(value.params)])
+    return value
+
+
+def prior_params(notification):
+    """Returns the parameters of a prior notification as they are
+       matched by the logic, given the prior_fact_SendEmail text for
+       them, or None if they can never match.
+    """
+    params = notification.params
+    if notification.what == 'variable_failing':
+        return BldVariable(params.project, params.varname, params.varvalue)
+    if notification.what in _strlist_notifications:
+        return [ str(n) for n in params ]
+    if (isinstance(params, (PRData, PRFailData)) and
+        any([ isinstance(c, BranchCfg) for c in params.prcfg ])):
+        return None  # BranchCfg is written as a prcfg/2
+    return params
+
+
+def email_address_useable(addr, logic):
+    "True if the address is allowed by the Reporting logic (email_address_useable/1)"
+    text = addr.name if isinstance(addr, Atom) else addr
+    if not isinstance(text, str):
+        return False
+    parts = [ p.strip(' ') for p in text.split('@') ]
+    if len(parts) != 2:
+        return False
+    domain = parts[1]
+    whitelist = logic[('email_domain_whitelist', 1)]
+    matches = lambda facts, value: any([ unify(f[0], value) is not None for f in facts ])
+    return ((not whitelist or matches(whitelist, domain)) and
+            not matches(logic[('email_domain_blacklist', 1)], domain) and
+            not matches(logic[('email_user_blacklist', 1)], addr))
+
+
+def read_reporting_logic(text):
+    """Returns the Reporting logic facts, indexed by (name, arity), or
+       raises UnsupportedLogic.
+    """
+    logic = defaultdict(list)
+    for fact in read_facts(text):
+        if isinstance(fact, Term):
+            if fact.functor in _reserved_predicates:
+                raise UnsupportedLogic('Reporting logic defines %s/%d'
+                                       % (fact.functor, len(fact.args)))
+            logic[(fact.functor, len(fact.args))].append(fact.args)
+    return logic
+
+
+class NativeReport(object):
+    """Computes the built_analysis results for the ResultSets.  The
+       build results (BuildResult) and the prior SendEmail entries
+       must be unique and ordered by their fact text.
+    """
+    def __init__(self, result_sets, build_results, prior_report, prior_emails,
+                 reporting_logic=''):
+        self.logic = read_reporting_logic(reporting_logic)
+        inputs = [ (e.inp_desc, e.repo_info) for e in result_sets if e.inp_desc.RL ]
+        self.facts = BuildFacts(inputs, fact_order=True)
+        self.projects = sorted(self.facts.projects)
+        self.bcgen = dict([ (i.PNAME, NativeBuildConfigs(self.facts, i.PNAME,
+                                                         VarMatrix(i.PNAME, i.VAR, i.VF)))
+                            for (i, _) in inputs ])
+        self.prior_emails = prior_emails
+
+        # bldres/12, indexed by project, by (project, branchtype,
+        # branch), and by (project, branchtype, branch, strategy).
+        self.bldres = defaultdict(list)
+        self.bldres_at = defaultdict(list)
+        self.bldres_strategy = defaultdict(list)
+        for result in build_results:
+            cfg = result.bldconfig
+            r = BldRes(cfg.projectname, cfg.branchtype, cfg.branchname, cfg.strategy.lower(),
+                       tuple([ BldVariable(cfg.projectname, v.varname, v.varvalue)
+                               for v in cfg.bldvars ]),
+                       result.results.buildname,
+                       result.results.nrtotal, result.results.nrsucceeded,
+                       result.results.nrfailed, result.results.nrscheduled,
+                       not result.results.cfgerror, cfg.description)
+            self.bldres[r.project].append(r)
+            self.bldres_at[(r.project, r.branchtype, r.branch)].append(r)
+            self.bldres_strategy[(r.project, r.branchtype, r.branch, r.strategy)].append(r)
+
+        # prior_status/8, indexed by (project, strategy, branchtype,
+        # branch, buildname)
+        self.priors = defaultdict(list)
+        for p in prior_report or []:
+            if isinstance(p, StatusReport):
+                self.priors[(p.project, p.strategy.lower(), p.branchtype,
+                             p.branch, p.buildname)].append(p)
+
+        # The build configurations (build_config2/1) that have no
+        # bldres (missing_bldres/1), by project.
+        self.missing = dict([ (pname, [ c for c in self.bcgen[pname].config_solutions()
+                                        if self._no_bldres(pname, *c) ])
+                              for pname in self.projects ])
+
+        self.complete_failures = set([ p for p in self.projects if self._complete_failure(p) ])
+        self.var_failures = set([ (p, n, v) for p in self.projects
+                                  if p not in self.complete_failures
+                                  for (n, v) in self.facts.projects[p].varvalues
+                                  if self._var_failure(p, n, v) ])
+
+    # ----------------------------------------------------------------------
+    # Helpers (reportrules.pl)
+
+    def _no_bldres(self, pname, branchtype, branch, desc, strategy, blds, bldvars):
+        return not any([ cmp_blddesc(desc, r.blddesc) is not None and listcmp(bldvars, r.bldvars)
+                         for r in self.bldres_strategy[(pname, branchtype, branch, strategy)] ])
+
+    def _reportable(self, pname, strategy, branchtype, branch):
+        "True for the strategy/3 and branch_type/3 of the report rules"
+        return (strategy in self.bcgen[pname].strategies(branch) and
+                self.facts.branch_type(branchtype, branch))
+
+    def _complete_failure(self, pname):
+        return not any([ r.good or r.pending or not r.cfgvalid for r in self.bldres[pname] ] +
+                       self.missing[pname])
+
+    def _var_failure(self, pname, varname, varvalue):
+        var = BldVariable(pname, varname, varvalue)
+        return not any([ (r.good or r.pending or not r.cfgvalid) and var in r.bldvars
+                         for r in self.bldres[pname] ] +
+                       [ var in c[-1] for c in self.missing[pname] ])
+
+    def _not_a_var_failure(self, pname, bldvars):
+        return not any([ (pname, v.varname, v.varvalue) in self.var_failures
+                         for v in bldvars if v.project == pname ])
+
+    def _matching_priors(self, r):
+        "Generates the (prior, BldDesc) for prior status matching the bldres"
+        for p in self.priors[(r.project, r.strategy, r.branchtype, r.branch, r.buildname)]:
+            desc = cmp_blddesc(r.blddesc, p.blddesc)
+            if desc is not None and listcmp(r.bldvars, p.bldvars):
+                yield (p, desc)
+
+    # ----------------------------------------------------------------------
+    # report/1
+
+    def _status(self, status, r, desc=None):
+        return StatusReport(status, r.project, logic_result_expr.get(r.strategy, r.strategy),
+                            r.branchtype, r.branch, r.buildname, list(r.bldvars),
+                            r.blddesc if desc is None else desc)
+
+    def _bldres_reports(self, r):
+        if r.good:
+            priors = list(self._matching_priors(r))
+            for (p, desc) in priors:
+                if good_status(p.status):
+                    yield self._status('succeeded', r, desc)
+                if bad_status(p.status):
+                    yield self._status('fixed', r, desc)
+            if not priors:
+                yield self._status('initial_success', r)
+        if r.cfgvalid and r.nrscheduled == 0 and r.nrfailed > 0:
+            yield self._status(r.nrfailed, r)
+        if not r.cfgvalid:
+            yield self._status(logic_result_expr['badconfig'], r)
+        if r.pending:
+            yield PendingStatus(r.project, logic_result_expr.get(r.strategy, r.strategy),
+                                r.branchtype, r.branch, r.buildname, list(r.bldvars),
+                                r.blddesc)
+            for (p, desc) in self._matching_priors(r):
+                yield self._status(p.status, r, desc)
+
+    def pr_statuses(self):
+        """Returns the PR_Status for each pr_status/8 solution (with the
+           same multiplicity).
+        """
+        r = []
+        for pname in self.projects:
+            for (prtype, cfg, branch) in self.facts.pr_configs(self.facts.projects[pname].in_project):
+                if not isinstance(prtype, PR_Grouped):
+                    r.append(self._pr_status(prtype, branch, pname, cfg))
+        # n.b. pr_config/3 for a pr_grouped is the PRCfg for the repos
+        # of all projects, which is then reported for each project.
+        all_repos = set([ repo for p in self.facts.projects.values() for repo in p.in_project ])
+        for (prtype, cfg, branch) in self.facts.pr_configs(all_repos):
+            if isinstance(prtype, PR_Grouped):
+                r.extend([ self._pr_status(prtype, branch, pname, cfg)
+                           for pname in self.projects ])
+        return r
+
+    def _pr_status(self, prtype, branch, pname, cfg):
+        results = [ r for r in self.bldres_at[(pname, 'pullreq', branch)]
+                    if cmp_blddesc(prtype, r.blddesc) is not None ]
+        return PR_Status(prtype, branch, pname,
+                         [ PRCfg(*e[1:]) if e[0] == 'prcfg' else BranchCfg(*e[1:])
+                           for e in cfg ],
+                         [ r.buildname for r in results if r.good ],
+                         ([ r.buildname for r in results
+                            if r.cfgvalid and r.nrscheduled == 0 and r.nrfailed > 0 ] +
+                          [ r.buildname for r in results if not r.cfgvalid ]),
+                         [ r.buildname for r in results if r.pending ],
+                         len([ c for c in self.missing[pname]
+                               if c[0] == 'pullreq' and c[1] == branch ]))
+
+    def reports(self, pr_statuses):
+        "Returns the unique report/1 results"
+        r = []
+        for pname in self.projects:
+            for res in self.bldres[pname]:
+                if self._reportable(pname, res.strategy, res.branchtype, res.branch):
+                    r.extend(self._bldres_reports(res))
+            for (branchtype, branch, desc, strategy, blds, bldvars) in self.missing[pname]:
+                if self._reportable(pname, strategy, branchtype, branch):
+                    r.append(NewPending(BldConfig(pname, branchtype, branch,
+                                                  STRATEGIES[strategy], desc,
+                                                  [ BldRepoRev(*b) for b in blds ],
+                                                  bldvars)))
+            if pname in self.complete_failures:
+                r.append(CompletelyFailing(pname))
+        r.extend([ VarFailure(*v) for v in sorted(self.var_failures) ])
+        r.extend(pr_statuses)
+        # n.b. report/1 results are a set; PR_Status is not hashable
+        return list(dict([ (repr(e), e) for e in r ]).values())
+
+    # ----------------------------------------------------------------------
+    # analysis/1 (analysis.pl)
+
+    def analysis(self):
+        r = []
+        for (pname, varname, varvalue) in sorted(self.var_failures):
+            others = [ v for (n, v) in self.facts.projects[pname].varvalues
+                       if n == varname and v != varvalue ]
+            failing = [ v for v in others if (pname, varname, v) in self.var_failures ]
+            if others and len(failing) < len(others):
+                r.append(SepHandledVar(pname, varname, varvalue))
+        return r
+
+    # ----------------------------------------------------------------------
+    # action/1 (analysis.pl)
+
+    def _main_branch_status(self, pname, main):
+        "Returns the (no_pending_branch, no_branch_badconfig) for the main branch"
+        results = self.bldres_at[(pname, 'regular', main)]
+        return (not any([ r.pending for r in results ] +
+                        [ c[0] == 'regular' and c[1] == main for c in self.missing[pname] ]),
+                all([ r.cfgvalid for r in results ]))
+
+    def _main_branch_actions(self, pname):
+        bcgen = self.bcgen[pname]
+        main = self.facts.main_branch(self.facts.projects[pname].proj_repo)
+        if main is None or pname in self.complete_failures:
+            return []
+        no_pending, no_badconfig = self._main_branch_status(pname, main)
+        if not (no_pending and no_badconfig):
+            return []
+        results = self.bldres_at[(pname, 'regular', main)]
+        failing = lambda r: (r.cfgvalid and r.nrfailed > 0 and
+                             self._not_a_var_failure(pname, r.bldvars))
+        no_failing = not any([ failing(r) for r in results ])
+        success = any([ r.good for r in results ])
+        r = []
+        if bcgen.useable_submodules(main):
+            broken = [ b.buildname for b in results if b.strategy == 'submodules' and failing(b) ]
+            if broken:
+                r.append(Notify('main_submodules_broken', pname, sorted(set(broken))))
+            if no_failing and success:
+                r.append(Notify('main_submodules_good', pname, main))
+        if not bcgen.has_gitmodules(main):
+            if no_failing and success:
+                r.append(Notify('main_good', pname, main))
+            broken = [ b.buildname for b in self.bldres[pname]
+                       if b.strategy == 'standard' and failing(b) ]
+            if broken:
+                r.append(Notify('main_broken', pname, broken))
+        return r
+
+    def actions(self, pr_statuses, analysis):
+        "Returns the action/1 results (with the logic multiplicity)"
+        separate = set([ (a.project, a.var_name, a.var_value) for a in analysis ])
+        r = [ Notify('completely_broken', p, len(self.bldres[p]))
+              for p in self.projects
+              if p in self.complete_failures and self.bldres[p] ]
+        r.extend([ Notify('variable_failing', p, BldVariable(p, n, v))
+                   for (p, n, v) in sorted(self.var_failures) if (p, n, v) in separate ])
+        main_actions = [ self._main_branch_actions(p) for p in self.projects ]
+        for what in [ 'main_submodules_broken', 'main_submodules_good', 'main_good', 'main_broken' ]:
+            r.extend([ a for acts in main_actions for a in acts if a.what == what ])
+        for s in pr_statuses:
+            # n.b. both when pending and when not started
+            r.extend([ Notify('pr_projstatus_pending', s.project, PRData(s.prtype, s.prcfg))
+                       for cond in [ s.pending, s.unstarted > 0 ] if cond ])
+        r.extend([ Notify('pr_projstatus_good', s.project, PRData(s.prtype, s.prcfg))
+                   for s in pr_statuses
+                   if s.passing and not s.failing and not s.pending and s.unstarted == 0 ])
+        r.extend([ Notify('pr_projstatus_fail', s.project,
+                          PRFailData(s.prtype, s.prcfg, s.passing, s.failing))
+                   for s in pr_statuses
+                   if s.failing and not s.pending and s.unstarted == 0 ])
+        return r
+
+    # ----------------------------------------------------------------------
+    # do/1 (analysis.pl)
+
+    def _action_to(self, dowhat, notification):
+        "Returns the sorted unique targets of the notification (action_to/3)"
+        term = None
+        targets = []
+        for (what, target, pattern) in self.logic[('enable', 3)]:
+            if term is None:
+                term = as_term(notification)
+            b = unify(Term('enable', [what, target, pattern]),
+                      Term('enable', [Atom(dowhat), _result_var, term]))
+            if b is not None:
+                targets.append(b.get(_result_var))
+        if dowhat == 'email' and notification.what in _owner_notifications:
+            targets.extend([ b.get(_result_var)
+                             for b in [ unify(Term('owner', list(args)),
+                                              Term('owner', [notification.subject, _result_var]))
+                                        for args in self.logic[('project_owner', 2)] ]
+                             if b is not None ])
+        if dowhat == 'email':
+            targets = [ t for t in targets if email_address_useable(t, self.logic) ]
+        # n.b. setof order: atoms sort before strings
+        return [ t.name if isinstance(t, Atom) else t
+                 for t in sorted(uniq([ t for t in targets if isinstance(t, (str, Atom)) ]),
+                                 key=lambda t: (0, t.name) if isinstance(t, Atom) else (1, t)) ]
+
+    def _prior_sent(self, notification):
+        "Returns the sent_to of the first prior email for the notification (do_new/3)"
+        for p in self.prior_emails:
+            if (p.notification.what == notification.what and
+                p.notification.subject == notification.subject and
+                prior_params(p.notification) == notification.params):
+                return p.sent_to
+        return []
+
+    def do(self, actions):
+        r = []
+        for notification in actions:
+            users = self._action_to('email', notification)
+            if users:
+                r.append(SendEmail(users, notification, self._prior_sent(notification)))
+        for notification in actions:
+            channels = self._action_to('chat', notification)
+            if channels:
+                r.append(PostChatMessage(channels, notification, []))
+        return r
+
+    def results(self):
+        "Returns the report, analysis, action, and do results"
+        pr_statuses = self.pr_statuses()
+        reports = self.reports(pr_statuses)
+        if not reports:
+            return []  # the setof fails
+        analysis = self.analysis()
+        actions = self.actions(pr_statuses, analysis)
+        return reports + analysis + actions + self.do(actions)
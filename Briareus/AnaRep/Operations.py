@@ -14,14 +14,34 @@
    The higher-level logic layers can (and should) use the lower-layer
    results.
 
+   When reporting on multiple projects, the logic analysis can
+   optionally be partitioned by project (the partition argument):
+   each project is analyzed (concurrently) with its own facts plus
+   the facts it shares with the other projects (repos, branches, and
+   pull requests), and the partition results are then merged.  By
+   default, a single analysis is run over the facts of all projects.
+
 """
 
 import attr
+import collections
 import functools
 from Briareus import print_each, print_titled
-from Briareus.Types import BuildResult, logic_result_expr, ProjectSummary
-from Briareus.Logic.InpFacts import get_input_facts
-from Briareus.Logic.Evaluation import DeclareFact, Fact, run_logic_analysis
+from Briareus.Types import (BuildResult, logic_result_expr, ProjectSummary, SendEmail,
+                            StatusReport)
+from Briareus.AnaRep.Native import NativeReport
+from Briareus.Logic.InpFacts import get_input_facts, get_other_project_facts
+from Briareus.Logic.Evaluation import (DeclareFact, Fact, fact_formatter, fact_strings,
+                                       varvalues_term, run_logic_analysis,
+                                       run_logic_analyses)
+from Briareus.Logic.Terms import UnsupportedLogic
+
+
+# The engines that can evaluate the analysis and reporting: "prolog"
+# runs the built_analysis logic, "native" computes the same results
+# directly in Python (see Native.py), and "compare" runs both and
+# fails if the results differ.
+engines = [ 'prolog', 'native', 'compare' ]
 
 
 @attr.s
@@ -51,14 +71,34 @@ class ResultSet(object):
     build_cfgs = attr.ib(default=None)
 
 
+def compare_reports(logic_report, native_report):
+    "Raises a RuntimeError if the two report lists differ"
+    # n.b. some report entries are not hashable, so compare their repr
+    logic_items = collections.Counter([ repr(e) for e in logic_report ])
+    native_items = collections.Counter([ repr(e) for e in native_report ])
+    if logic_items != native_items:
+        raise RuntimeError('Native report differs from the logic report'
+                           ' (%d vs %d): missing %s, extra %s'
+                           % (len(native_report), len(logic_report),
+                              str(list((logic_items - native_items).elements())),
+                              str(list((native_items - logic_items).elements()))))
+
+
 class AnaRep(object):
     def __init__(self,
                  actor_system=None,
                  verbose=False,
-                 up_to=None):
+                 up_to=None,
+                 engine='prolog',
+                 partition=False):
+        if engine not in engines:
+            raise ValueError('Unknown analysis and reporting engine (known: %s): %s'
+                             % (', '.join(engines), engine))
         self._actor_system = actor_system
         self.verbose = verbose
         self._up_to = up_to  # None or UpTo
+        self.engine = engine
+        self.partition = partition  # partition the multi-project analysis
 
     def report_on(self, result_sets, prior_report, reporting_logic_defs=''):
         # result_sets is an array of ResultSet from hh.py, each containing:
@@ -85,6 +125,19 @@ class AnaRep(object):
         if self.verbose:
             print_each('CORRELATED BUILD RESULTS', build_results, '**')
 
+        raw = reporting_logic_defs + '\n'.join([each.inp_desc.REP.get('logic', '')
+                                                for each in result_sets])
+
+        if self.engine == 'native' and self._up_to not in ['built_facts', 'raw_built_analysis']:
+            try:
+                return ("report",
+                        [summary] + self.native_report(result_sets, build_results,
+                                                       prior_report, raw))
+            except UnsupportedLogic as err:
+                # Reporting logic beyond simple facts needs the logic engine
+                if self.verbose:
+                    print('## AnaRep native engine not used: %s' % str(err))
+
         declared_facts = [
             # ----------------------------------------------------------------------
             # Facts used for analysis and reporting
@@ -101,23 +154,64 @@ class AnaRep(object):
             Fact('bldres(Prj,BrTy,Br,Stgy,Vars,Bldname,Ttl,Good,Bad,Pend,CfgSts,"old") :- bldres(Prj,BrTy,Br,Stgy,Vars,Bldname,Ttl,Good,Bad,Pend,CfgSts)'),
         ]
 
-        input_facts = functools.reduce(
-            lambda facts, e: facts.union(get_input_facts(e.inp_desc.PNAME,
-                                                         e.inp_desc.RL,
-                                                         e.inp_desc.BL,
-                                                         e.inp_desc.VAR,
-                                                         e.repo_info)),
-            result_sets, set())
+        if self.partitioned(result_sets):
+            parts = self.partition_facts(result_sets, declared_facts,
+                                         build_results, prior_report)
+            rs = run_logic_analyses('partition_analysis',
+                                    [ facts for (_, facts) in parts ],
+                                    raw_logic=raw,
+                                    actor_system=self._actor_system,
+                                    verbose=self.verbose)
+            if self.verbose:
+                for ((pname, _), r) in zip(parts, rs):
+                    print_titled('RAW BUILT ANALYSIS (%s)' % pname, r)
+            report = merge_partition_results(rs)
+        else:
+            report = self.merged_analysis(result_sets, declared_facts,
+                                          build_results, prior_report, raw)
+            if self._up_to in ['built_facts', 'raw_built_analysis']:
+                return report
+
+        if self.engine == 'compare':
+            try:
+                compare_reports(report, self.native_report(result_sets, build_results,
+                                                           prior_report, raw))
+            except UnsupportedLogic as err:
+                if self.verbose:
+                    print('## AnaRep native engine not compared: %s' % str(err))
+        return ("report", [summary] + report)
+
+    def partitioned(self, result_sets):
+        """Returns true if the logic analysis of the result_sets is to be
+           partitioned by project.
+        """
+        return (self.partition and
+                self._up_to not in ['built_facts', 'raw_built_analysis'] and
+                partitionable(result_sets))
+
+    def merged_analysis(self, result_sets, declared_facts, build_results,
+                        prior_report, raw):
+        """Runs a single logic analysis over the facts for all of the
+           result sets.  Returns the report list, or the (up_to,
+           output) tuple if the up_to stops before the report.
+        """
+        input_facts = [ f for e in result_sets
+                        for f in get_input_facts(e.inp_desc.PNAME,
+                                                 e.inp_desc.RL,
+                                                 e.inp_desc.BL,
+                                                 e.inp_desc.VAR,
+                                                 e.repo_info,
+                                                 varfilter=e.inp_desc.VF) ]
 
         prior_facts = mk_prior_facts(prior_report)
         built_facts = mk_built_facts(build_results)
+        # n.b. the facts are each converted to text once here, and
+        # that text is used for removing duplicates, ordering, and
+        # output.
         facts = (declared_facts +
-                 sorted(list(input_facts), key=str) +
-                 sorted(list(prior_facts), key=str) +
-                 sorted(list(built_facts), key=str))
-        raw = reporting_logic_defs + '\n'.join([each.inp_desc.REP.get('logic', '')
-                                                for each in result_sets])
-
+                 fact_strings(input_facts) +
+                 fact_strings(prior_facts) +
+                 fact_strings(built_facts))
         if self.verbose or self._up_to == 'built_facts':
             print_each('BUILT FACTS', facts)
             print(raw)
@@ -133,9 +227,54 @@ class AnaRep(object):
         if self._up_to == 'raw_built_analysis':
             return (self._up_to, r)
 
-        return ("report",
-                [summary] +
-                (eval(r, globals(), logic_result_expr) if r else []))
+        return eval(r, globals(), logic_result_expr) if r else []
+
+    def partition_facts(self, result_sets, declared_facts, build_results, prior_report):
+        """Returns the (project name, facts) for the separate analysis
+           of each project in the result_sets.  The facts for a
+           project are its input facts, the shared facts of the other
+           projects (see get_other_project_facts), and only its own
+           build results and prior reports and emails.
+        """
+        parts = []
+        for e in result_sets:
+            pname = e.inp_desc.PNAME
+            input_facts = (get_input_facts(pname,
+                                           e.inp_desc.RL,
+                                           e.inp_desc.BL,
+                                           e.inp_desc.VAR,
+                                           e.repo_info,
+                                           varfilter=e.inp_desc.VF) +
+                           [ f for o in result_sets if o is not e
+                             for f in get_other_project_facts(o.inp_desc.PNAME,
+                                                              o.inp_desc.RL,
+                                                              o.inp_desc.BL,
+                                                              o.repo_info) ])
+            priors = [ p for p in (prior_report or [])
+                       if prior_project(p) in [None, pname] ]
+            builts = [ r for r in build_results if r.bldconfig.projectname == pname ]
+            parts.append((pname,
+                          declared_facts +
+                          fact_strings(input_facts) +
+                          fact_strings(mk_prior_facts(priors)) +
+                          fact_strings(mk_built_facts(builts))))
+        return parts
+
+    def native_report(self, result_sets, build_results, prior_report, reporting_logic):
+        """Returns the analysis and reporting results computed by the
+           native engine, or raises UnsupportedLogic.
+        """
+        # n.b. as for the logic, the build results and prior emails
+        # are unique and ordered by their fact text.
+        built = dict([ (str(built_fact(r)), r) for r in build_results
+                       if not isinstance(r.results, str) ])
+        emails = dict([ (str(prior_fact_SendEmail(p)), p) for p in (prior_report or [])
+                        if isinstance(p, SendEmail) ])
+        return NativeReport(result_sets,
+                            [ built[k] for k in sorted(built) ],
+                            prior_report,
+                            [ emails[k] for k in sorted(emails) ],
+                            reporting_logic).results()
 
 
     def get_build_results(self, result_set):
@@ -146,15 +285,55 @@ class AnaRep(object):
                  for build in result_set.build_cfgs.cfg_build_configs ]
 
 
+def partitionable(result_sets):
+    """Returns true if the analysis of the result_sets can be
+       partitioned by project: there must be multiple projects, and
+       each must be a distinct (non-dummy) project.
+    """
+    pnames = [ e.inp_desc.PNAME for e in result_sets ]
+    return (len(pnames) > 1 and len(set(pnames)) == len(pnames) and
+            all([ any([ r.project_repo for r in (e.inp_desc.RL or []) ])
+                  for e in result_sets ]))
+
+
+def prior_project(prior):
+    """Returns the project that a prior report entry is specific to, or
+       None if it applies to all projects.
+    """
+    if isinstance(prior, StatusReport):
+        return prior.project
+    if isinstance(prior, SendEmail):
+        return prior.notification.subject
+    return None
+
+
+def merge_partition_results(results):
+    """Merges the partition_analysis output for each project into the
+       results of a single analysis: the reports of all projects,
+       followed by their analyses, their actions, and their do's.  As
+       for the (setof) built_analysis, there are no results unless
+       there is at least one report.
+    """
+    layers = [ eval(r, globals(), logic_result_expr) for r in results ]
+    reports = {}
+    for l in layers:
+        for e in l[0]:
+            reports.setdefault(repr(e), e)
+    if not reports:
+        return []
+    return (list(reports.values()) +
+            [ e for n in [1, 2, 3] for l in layers for e in l[n] ])
+
+
 def mk_prior_facts(prior_report):
-    return set(
+    return (
         [ DeclareFact('prior_status/8'),
           DeclareFact('prior_summary/4'),
         ] +
         list(filter(None, [ prior_fact(p) for p in (prior_report or []) ])))
 
 def mk_built_facts(build_results):
-    return set(
+    return (
         [ DeclareFact('bldres/12'),
           DeclareFact('report/1'),
           DeclareFact('status_report/7'),
@@ -188,33 +367,29 @@ def prior_fact(prior):
              'PR_Status' : prior_ignored,
     }[prior.__class__.__name__](prior)
 
+_prior_summary_fact = fact_formatter('prior_summary', '"%s"', '%s', '%s', '%s')
+_prior_status_fact = fact_formatter('prior_status', '%s', 'project("%s")', '%s', '%s',
+                                    '"%s"', '"%s"', '%s', '%s')
+_bldres_fact = fact_formatter('bldres', '"%s"', '%s', '"%s"', '%s', '%s', '"%s"',
+                              '%s', '%s', '%s', '%s', '%s', '%s')
+
 def prior_fact_ProjectSummary(prior):
-    return Fact(('prior_summary("{p.project_name}"'
-                 ', {p.bldcfg_count}'
-                 ', {p.subrepo_count}'
-                 ', {p.pullreq_count}'
-                 ')'
-    ).format(p=prior))
+    return _prior_summary_fact(prior.project_name,
+                               prior.bldcfg_count,
+                               prior.subrepo_count,
+                               prior.pullreq_count)
 
 def prior_fact_StatusReport(prior):
-    vars = [ 'varvalue("{v.project}", "{v.varname}", "{v.varvalue}")'.format(v=v)
-             for v in prior.bldvars ]
-    return Fact(
-        ('prior_status({p.status}'
-         ', project("{p.project}")'
-         ', {strategy}'
-         ', {p.branchtype}'
-         ', "{p.branch}"'
-         ', "{p.buildname}"'
-         ', {vars}'
-         ', {blddesc}'
-         ')'
-         ).format(p=prior,
-                  strategy=prior.strategy.lower(),
-                  blddesc=(prior.blddesc.as_fact()
-                           if hasattr(prior.blddesc, 'as_fact')
-                           else prior.blddesc),
-                  vars='[ ' + ', '.join(vars) + ' ]'))
+    return _prior_status_fact(prior.status,
+                              prior.project,
+                              prior.strategy.lower(),
+                              prior.branchtype,
+                              prior.branch,
+                              prior.buildname,
+                              varvalues_term(None, tuple(prior.bldvars)),
+                              (prior.blddesc.as_fact()
+                               if hasattr(prior.blddesc, 'as_fact')
+                               else prior.blddesc))
 
 def prior_fact_VarFailure(prior):
     return None
@@ -254,31 +429,20 @@ def prior_fact_SendEmail(prior):
 
 
 def built_fact(result):
-    vars = [ 'varvalue("{r.bldconfig.projectname}", "{v.varname}", "{v.varvalue}")'.format(v=v, r=result)
-             for v in result.bldconfig.bldvars ]
     if isinstance(result.results, str):
         # Builder returned a failure / warning message and not an
         # actual list of results.
         return None
-    return Fact(
-        ('bldres("{r.bldconfig.projectname}"'
-         ', {r.bldconfig.branchtype}'
-         ', "{r.bldconfig.branchname}"'
-         ', {strategy}'
-         ', {vars}'
-         ', "{r.results.buildname}"'
-         ', {r.results.nrtotal}'
-         ', {r.results.nrsucceeded}'
-         ', {r.results.nrfailed}'
-         ', {r.results.nrscheduled}'
-         ', {configStatus}'
-         ', {bldDescription}'
-         ')'
-        ).format(r=result,
-                 vars='[ ' + ', '.join(vars) + ' ]',
-                 strategy=result.bldconfig.strategy.lower(),
-                 configStatus=('configError'
-                               if result.results.cfgerror else 'configValid'),
-                 bldDescription=result.bldconfig.description.as_fact(),
-        )
-    )
+    cfg = result.bldconfig
+    return _bldres_fact(cfg.projectname,
+                        cfg.branchtype,
+                        cfg.branchname,
+                        cfg.strategy.lower(),
+                        varvalues_term(cfg.projectname, tuple(cfg.bldvars)),
+                        result.results.buildname,
+                        result.results.nrtotal,
+                        result.results.nrsucceeded,
+                        result.results.nrfailed,
+                        result.results.nrscheduled,
+                        ('configError' if result.results.cfgerror else 'configValid'),
+                        cfg.description.as_fact())
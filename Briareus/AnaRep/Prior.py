@@ -34,6 +34,14 @@ def get_prior_report(report_fname, with_lock=True):
        None instead of a list.
 
     """
+    repf = lock_report_file(report_fname, with_lock=with_lock)
+    return repf, read_report_from(repf)
+
+def lock_report_file(report_fname, with_lock=True):
+    """Opens (creating if needed) and locks the report file as
+       described for get_prior_report, returning the open file
+       descriptor without reading the report (see read_report_from).
+    """
     if os.path.exists(report_fname):
         repf = open(report_fname, 'r')
     else:
@@ -49,7 +57,7 @@ def get_prior_report(report_fname, with_lock=True):
                 else:
                     print('...waiting for lock on',report_fname,',',trynum,file=sys.stderr)
                     time.sleep(1)
-    return repf, read_report_from(repf)
+    return repf
 
 def read_report_from(repf):
     """Reads the contents of a report from the specified open file
@@ -68,6 +76,23 @@ def read_report_from(repf):
         print('Warning: unable to process prior report data:', str(e), file=sys.stderr)
     return None
 
+def iter_report_from(repf):
+    """Generates each entry of the report read from the specified open
+       file descriptor, reading the file incrementally rather than all
+       at once.  Unlike read_report_from, errors in the report data
+       are raised to the caller.
+    """
+    entry = []
+    for line in repf:
+        if line == '\n':
+            if entry:
+                yield eval(''.join(entry), globals(), {})
+                entry = []
+        else:
+            entry.append(line)
+    if ''.join(entry).strip():
+        yield eval(''.join(entry), globals(), {})
+
 def write_report_output(reportf, report):
     for each in report:
         pprint.pprint(each, stream=reportf)
@@ -0,0 +1,48 @@
+"Index of the entries in a build report for use by the report formatters"
+
+from collections import defaultdict
+from Briareus.Types import StatusReport
+
+
+class ReportIndex(object):
+    """Indexes the report data (as read by Briareus.AnaRep.Prior) in a
+       single pass so that formatters can lookup entries without
+       re-scanning the report.  The original entries remain available
+       (in report order) via the entries attribute.
+    """
+
+    def __init__(self, repdata):
+        self.entries = list(repdata)
+        self.by_type = defaultdict(list)
+        self.by_build = {}  # (project, buildname) -> first StatusReport
+        self.by_branchtype = defaultdict(list)  # branchtype -> [StatusReport]
+        self.projects = set()
+        for entry in self.entries:
+            self.by_type[type(entry)].append(entry)
+            if isinstance(entry, StatusReport):
+                self.by_build.setdefault((entry.project, entry.buildname), entry)
+                self.by_branchtype[entry.branchtype].append(entry)
+                self.projects.add(entry.project)
+
+    @classmethod
+    def of(cls, repdata):
+        "Returns the repdata if it is already a ReportIndex, otherwise indexes it."
+        return repdata if isinstance(repdata, cls) else cls(repdata)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def of_type(self, entry_type):
+        "Returns all entries that are instances of entry_type (grouped by actual type)"
+        return [ e for t, es in self.by_type.items() if issubclass(t, entry_type)
+                 for e in es ]
+
+    def status_report(self, project, buildname):
+        "Returns the StatusReport for this build, or None if there is none"
+        return self.by_build.get((project, buildname), None)
+
+    def pullreq_branches(self):
+        return set([ sr.branch for sr in self.by_branchtype['pullreq'] ])
@@ -1,10 +1,18 @@
 # Core BCGen functionality to process input specification into build configurations
 
 from Briareus import print_titled, print_each
-from Briareus.Types import logic_result_expr
+from Briareus.Types import BldVariable, logic_result_expr
 from Briareus.Logic.Evaluation import DeclareFact, Fact, run_logic_analysis
-from Briareus.Logic.InpFacts import get_input_facts
+from Briareus.Logic.InpFacts import get_input_facts, varfilter_patterns
+from Briareus.BCGen.Native import native_build_configs
 import attr
+import itertools
+
+
+# The build configuration engines: "prolog" runs the build_config
+# logic, "native" computes the same results directly in Python (see
+# Native.py), and "compare" runs both and fails if the results differ.
+engines = [ 'prolog', 'native', 'compare' ]
 
 
 @attr.s(frozen=True)
@@ -14,10 +22,83 @@ class GeneratedConfigs(object):
     cfg_pullreqs = attr.ib(factory=set)  # repo_info['pullreqs']
 
 
+class VarMatrix(object):
+    """The variable value combinations for a project, with the
+       combinations excluded by the input VariableFilter removed.  The
+       combinations are generated on demand rather than stored.
+    """
+    def __init__(self, projectname, variables, varfilter=None):
+        self.projectname = projectname
+        self._names = [ v.variable_name for v in variables ]
+        self._values = [ v.variable_values for v in variables ]
+        self._exclude = [ set(p) for p in varfilter_patterns((varfilter or {}).get('exclude')) ]
+        self._include = [ set(p) for p in varfilter_patterns((varfilter or {}).get('include')) ]
+
+    def allowed(self, combo):
+        "Returns true if the set of (varname, varvalue) is not filtered out"
+        if any([ p.issubset(combo) for p in self._exclude ]):
+            return False
+        return not self._include or any([ p.issubset(combo) for p in self._include ])
+
+    def __iter__(self):
+        # Generates each allowed combination as a list of BldVariable
+        for vals in itertools.product(*self._values):
+            combo = list(zip(self._names, vals))
+            if self.allowed(set(combo)):
+                yield [ BldVariable(self.projectname, n, v) for n, v in combo ]
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class LazyBldConfigs(object):
+    """The build configurations generated without any variables (by the
+       lazy_varcombs logic), which are expanded into a build
+       configuration for each variable combination in the project's
+       VarMatrix as they are iterated over.
+    """
+    def __init__(self, bldcfgs, varmatrix):
+        self._bldcfgs = bldcfgs
+        self._varmatrix = varmatrix
+        self._ncombos = None
+
+    def __iter__(self):
+        for cfg in self._bldcfgs:
+            for bldvars in self._varmatrix:
+                yield attr.evolve(cfg, bldvars=bldvars)
+
+    def __len__(self):
+        if self._ncombos is None:
+            self._ncombos = len(self._varmatrix)
+        return len(self._bldcfgs) * self._ncombos
+
+    def __contains__(self, bldcfg):
+        return (attr.evolve(bldcfg, bldvars=[]) in self._bldcfgs and
+                self._varmatrix.allowed(set([ (v.varname, v.varvalue)
+                                              for v in bldcfg.bldvars ])))
+
+
+def compare_build_configs(logic_bldcfgs, native_bldcfgs):
+    "Raises a RuntimeError if the two lists of build configs differ"
+    missing = [ c for c in logic_bldcfgs if c not in native_bldcfgs ]
+    extra = [ c for c in native_bldcfgs if c not in logic_bldcfgs ]
+    if missing or extra or len(logic_bldcfgs) != len(native_bldcfgs):
+        raise RuntimeError('Native build configs differ from the logic build configs'
+                           ' (%d vs %d): missing %s, extra %s'
+                           % (len(native_bldcfgs), len(logic_bldcfgs),
+                              str(missing), str(extra)))
+
+
 class Generator(object):
-    def __init__(self, actor_system=None, verbose=False):
+    def __init__(self, actor_system=None, verbose=False, lazy_variables=False,
+                 engine='prolog'):
+        if engine not in engines:
+            raise ValueError('Unknown build configuration engine (known: %s): %s'
+                             % (', '.join(engines), engine))
         self._actor_system = actor_system
         self.verbose = verbose
+        self.lazy_variables = lazy_variables
+        self.engine = engine
 
     def generate_build_configs(self, input_descr, repo_info, up_to=None):
         """The core process of generating build_config information from an
@@ -25,11 +106,20 @@ class Generator(object):
            return with the information "up-to" a specific point; this
            is primarily used for diagnostics and testing.
         """
+        varmatrix = VarMatrix(input_descr.PNAME, input_descr.VAR, input_descr.VF)
+        if self.engine == 'native' and up_to not in ['facts', 'raw_logic_output']:
+            return self._generated(
+                native_build_configs(input_descr, repo_info,
+                                     None if self.lazy_variables else varmatrix),
+                varmatrix, repo_info)
         facts = get_input_facts(input_descr.PNAME,
                                 input_descr.RL,
                                 input_descr.BL,
                                 input_descr.VAR,
-                                repo_info)
+                                repo_info,
+                                varfilter=input_descr.VF)
+        if self.lazy_variables and facts:
+            facts.append(Fact('lazy_varcombs'))
         if self.verbose or up_to == 'facts':
             print_each('FACTS', facts)
         if up_to == "facts":
@@ -41,9 +131,19 @@ class Generator(object):
             print_titled('RAW_LOGIC_OUTPUT', r)
         if up_to == "raw_logic_output":
             return (up_to, r)
-        if not r:
+        bldcfgs = eval(r, globals(), logic_result_expr) if r else []
+        if self.engine == 'compare':
+            compare_build_configs(bldcfgs,
+                                  native_build_configs(input_descr, repo_info,
+                                                       None if self.lazy_variables else varmatrix))
+        return self._generated(bldcfgs, varmatrix, repo_info)
+
+    def _generated(self, bldcfgs, varmatrix, repo_info):
+        if not bldcfgs:
             return ([], [])
+        if self.lazy_variables:
+            bldcfgs = LazyBldConfigs(bldcfgs, varmatrix)
         return ("build_configs",
-                GeneratedConfigs(eval(r, globals(), logic_result_expr),
+                GeneratedConfigs(bldcfgs,
                                  repo_info['subrepos'],
                                  repo_info['pullreqs']))
@@ -0,0 +1,363 @@
+# Native (pure Python) generation of build configurations.
+#
+# This computes the same bldcfg results as the build_config.pl logic
+# (buildcfg.pl, pullreqinfo.pl and buildlib.pl) directly from the
+# input description and the gathered repository information, using
+# hash indexes in place of the Prolog fact database.  The comments
+# identify the corresponding Prolog predicates; any change to that
+# logic must also be made here (the "compare" engine of the Generator
+# checks that the two produce the same results).
+
+from Briareus.Types import (BldConfig, BldRepoRev, BranchReq, MainBranch,
+                            PR_Solo, PR_Repogroup, PR_Grouped, logic_result_expr)
+from Briareus.Logic.InpFacts import (check_repo_branches, project_submodules,
+                                     _branch_fact, _pullreq_fact)
+from collections import defaultdict
+
+
+# The translations of the Prolog atoms (as done by logic_result_expr
+# for the Prolog output).
+PROJECT_PRIMARY = logic_result_expr['project_primary']
+STRATEGIES = dict([ (s, logic_result_expr[s]) for s in ['standard', 'heads', 'submodules'] ])
+
+
+def uniq(l):
+    "Removes duplicates from the list, retaining the order (list_to_set)"
+    seen = set()
+    return [ e for e in l if not (e in seen or seen.add(e)) ]
+
+
+class ProjectFacts(object):
+    """The input facts that are specific to a project: project/2,
+       repo/2, subrepo/2, branchreq/2, submodule/5 and varvalue/3.
+    """
+    def __init__(self, input_descr, repo_info):
+        RL = input_descr.RL
+        check_repo_branches(RL, repo_info)
+        project_repo = [ r for r in RL if r.project_repo ][0]
+        self.pname = input_descr.PNAME
+        self.proj_repo = project_repo.repo_name
+        self.repos = set([ r.repo_name for r in RL ])  # repo/2
+        self.subrepos = set([ r.repo_name for r in repo_info['subrepos'] ])  # subrepo/2
+        self.in_project = self.repos | self.subrepos  # repo_in_project/2
+        self.branchreqs = uniq([ b.branch_name for b in input_descr.BL ])  # branchreq/2
+        # submodule/5: indexed by (PullReqID, BranchName) for the project repo
+        submodules = defaultdict(list)
+        for (pr_id, branch, subrepo, subref) in project_submodules(project_repo,
+                                                                   input_descr.BL,
+                                                                   repo_info):
+            submodules[(PROJECT_PRIMARY if pr_id is None else pr_id, branch)].append(
+                (subrepo, subref))
+        # n.b. lookups must not add entries to this index
+        self.submodules = dict(submodules)
+        self.submodule_branches = set([ b for (_, b) in self.submodules ])
+        self.varvalues = uniq([ (v.variable_name, val)  # varvalue/3
+                                for v in input_descr.VAR
+                                for val in v.variable_values ])
+
+    def repo_submodules(self, pr_id, branch):
+        return self.submodules.get((pr_id, branch), [])
+
+
+class BuildFacts(object):
+    """The input facts (as generated by InpFacts.get_input_facts) for
+       one or more projects, indexed for the build configuration
+       generation.  The inputs are a list of (InputDesc, repo_info)
+       for the projects; the branch/2, pullreq/5 and main_branch/2
+       facts of all of the projects are shared.
+
+       If fact_order is true, duplicate branch and pullreq facts are
+       removed and the remainder are ordered by their fact text (as
+       they are when the facts are passed to the logic), otherwise
+       they are in the repo_info order.
+    """
+    def __init__(self, inputs, fact_order=False):
+        self.projects = dict()
+        self.main_branches = dict()
+        branches = []
+        pullreqs = []
+        for (input_descr, repo_info) in inputs:
+            proj = ProjectFacts(input_descr, repo_info)
+            self.projects[proj.pname] = proj
+            for r in input_descr.RL:
+                if r.main_branch != "master":
+                    self.main_branches.setdefault(r.repo_name, r.main_branch)
+            branches.extend(repo_info['branches'])
+            # pullreq/5: (Repo, PR_Ident, PR_Branch, PR_User, PR_Email)
+            pullreqs.extend([ (p.pr_target_repo, p.pr_ident, p.pr_branch, p.pr_user, p.pr_email)
+                              for p in repo_info['pullreqs'] ])
+        if fact_order:
+            branches = sorted(set(branches), key=lambda b: str(_branch_fact(*b)))
+            pullreqs = sorted(set(pullreqs), key=lambda p: str(_pullreq_fact(*p)))
+        # branch/2: indexed by repo and by branch name
+        self.branches = defaultdict(set)
+        self.branch_repos = defaultdict(list)
+        for (repo, branch) in branches:
+            self.branches[repo].add(branch)
+            self.branch_repos[branch].append(repo)
+        # pullreq/5: indexed by PR_Ident and by PR_Branch
+        self.pullreqs = pullreqs
+        self.pullreqs_by_id = defaultdict(list)
+        self.pullreqs_by_branch = defaultdict(list)
+        for pr in self.pullreqs:
+            self.pullreqs_by_id[pr[1]].append(pr)
+            self.pullreqs_by_branch[pr[2]].append(pr)
+        # n.b. lookups must not add entries to these indexes
+        for index in ['branches', 'branch_repos', 'pullreqs_by_id', 'pullreqs_by_branch']:
+            setattr(self, index, dict(getattr(self, index)))
+
+    def repo_branches(self, repo):
+        return self.branches.get(repo, set())
+
+    def branch_pullreqs(self, branch):
+        return self.pullreqs_by_branch.get(branch, [])
+
+    def main_branch(self, repo):
+        "Returns the main branch of the repo (is_main_branch/2) or None"
+        branch = self.main_branches.get(repo, "master")
+        return branch if branch in self.repo_branches(repo) else None
+
+    def is_main_branch(self, repo, branch):
+        return branch == self.main_branch(repo)
+
+    def proj_repo_branch(self, pname, branch):
+        "True if the branch is requested or is the main branch for the project"
+        proj = self.projects[pname]
+        return branch in proj.branchreqs or self.is_main_branch(proj.proj_repo, branch)
+
+    def branch_type(self, branchtype, branch):
+        "True if the branch is of the branchtype (branch_type/3) for any project"
+        if branchtype == 'pullreq':
+            return branch in self.pullreqs_by_branch
+        return any([ self.proj_repo_branch(p, branch) for p in self.projects ])
+
+    # ----------------------------------------------------------------------
+    # PR Configurations (pullreqinfo.pl)
+
+    def pr_configs(self, in_project):
+        """Generates each (pr_type, PRCfg, Branch) for the pull requests
+           (pr_config/3 and branch_for_prtype/2) for the set of repos
+           in the project, where each PRCfg entry is a ('prcfg', Repo,
+           PRNum, Branch, User, Email) or ('branchcfg', Repo, Branch)
+           tuple.  These are generated with the same multiplicity as
+           the logic solutions; a pr_grouped PRCfg may be empty if the
+           project has none of the repos.
+        """
+        on_main = lambda pr: self.is_main_branch(pr[0], pr[2])
+
+        # pr_solo
+        for (repo, prnum) in [ pr[:2] for pr in self.pullreqs if on_main(pr) ]:
+            same = [ pr for pr in self.pullreqs_by_id.get(prnum, [])
+                     if on_main(pr) and pr[2] == self.main_branch(repo) ]
+            if len(same) < 2 and repo in in_project:
+                for pr in self.pullreqs_by_id.get(prnum, []):
+                    if pr[0] == repo:
+                        yield (PR_Solo(repo, prnum), [ ('prcfg',) + pr ],
+                               self.main_branch(repo))
+
+        # pr_repogroup: each group is the PRs with the same PRNum,
+        # (main) Branch, User, and Email.
+        groups = defaultdict(set)
+        for pr in self.pullreqs:
+            if on_main(pr):
+                groups[pr[1:]].add(pr[0])
+        for (prnum, repolist) in [ (key[0], sorted(repos))
+                                   for key, repos in groups.items()
+                                   if len(repos) > 1 ]:
+            prcfgs = defaultdict(set)
+            for pr in self.pullreqs_by_id.get(prnum, []):
+                if on_main(pr) and pr[0] in in_project:
+                    prcfgs[pr[2:]].add(('prcfg',) + pr)
+            for cfg in prcfgs.values():
+                yield (PR_Repogroup(prnum, repolist), sorted(cfg),
+                       self.main_branch(repolist[0]))
+
+        # pr_grouped
+        for branch in sorted(self.pullreqs_by_branch):
+            prs = self.branch_pullreqs(branch)
+            if all([ on_main(pr) for pr in prs ]):
+                continue
+            cfg_pr = [ ('prcfg',) + pr for pr in prs if pr[0] in in_project ]
+            pr_repos = set([ pr[0] for pr in prs ])
+            cfg_br = [ ('branchcfg', repo, branch) for repo in self.branch_repos.get(branch, [])
+                       if repo in in_project and repo not in pr_repos ]
+            yield (PR_Grouped(branch), uniq(cfg_pr + cfg_br), branch)
+
+
+class NativeBuildConfigs(object):
+    """Generates the build configurations for the named project from
+       the BuildFacts.  The variable value combinations are obtained
+       from the varmatrix (a Generator.VarMatrix); if this is None,
+       the build configurations have no variables (as for
+       lazy_varcombs).
+    """
+    def __init__(self, facts, pname, varmatrix=None):
+        self.facts = facts
+        self.project = facts.projects[pname]
+        self._varcombs = list(varmatrix) if varmatrix is not None else [[]]
+        self._strategies = {}
+
+    # ----------------------------------------------------------------------
+    # Build Strategies (buildlib.pl)
+
+    def has_gitmodules(self, branch):
+        f, p = self.facts, self.project
+        return (branch in p.submodule_branches and
+                (f.proj_repo_branch(p.pname, branch) or
+                 any([ pr[0] == p.proj_repo for pr in f.branch_pullreqs(branch) ])))
+
+    def useable_submodules(self, branch):
+        f, p = self.facts, self.project
+        if branch in f.repo_branches(p.proj_repo):
+            return self.has_gitmodules(branch)
+        main = f.main_branch(p.proj_repo)
+        return main is not None and self.has_gitmodules(main)
+
+    def strategies(self, branch):
+        "Returns the strategy/3 names for this branch"
+        if branch not in self._strategies:
+            f, p = self.facts, self.project
+            is_pullreq = f.branch_type('pullreq', branch)
+            is_regular = f.proj_repo_branch(p.pname, branch)
+            r = []
+            if is_pullreq or is_regular:
+                useable = self.useable_submodules(branch)
+                if useable:
+                    r.append('submodules')
+                if ((is_regular and useable) or
+                    (is_pullreq and p.submodules)):
+                    r.append('heads')
+                else:
+                    r.append('standard')
+            self._strategies[branch] = r
+        return self._strategies[branch]
+
+    def pr_configs(self):
+        "Generates each (pr_type, PRCfg, Branch) for the project's pull requests"
+        return self.facts.pr_configs(self.project.in_project)
+
+    # ----------------------------------------------------------------------
+    # Build Configurations (buildcfg.pl)
+
+    def _pr_builds_proj(self, cfg, branch):
+        "Returns the (Proj_PR_ID, ProjBranch) for the cfg, or None"
+        f, p = self.facts, self.project
+        for entry in cfg:
+            if entry[1] == p.proj_repo:
+                return ((entry[2], entry[3]) if entry[0] == 'prcfg' else
+                        (PROJECT_PRIMARY, entry[2]))
+        if branch in f.repo_branches(p.proj_repo):
+            return (PROJECT_PRIMARY, branch)
+        main = f.main_branch(p.proj_repo)
+        return None if main is None else (PROJECT_PRIMARY, main)
+
+    def _rem_build_branch(self, branch, repo):
+        f = self.facts
+        return branch if branch in f.repo_branches(repo) else f.main_branch(repo)
+
+    def _repo_useable(self, proj_pr_id, proj_branch, repo):
+        p = self.project
+        return (repo in p.repos or
+                (repo in p.subrepos and
+                 any([ s == repo for (s, _) in p.repo_submodules(proj_pr_id, proj_branch) ])))
+
+    def _submod_spec_or_branch(self, proj_pr_id, proj_branch, prrepos, branch, repo):
+        refs = [ ref for (s, ref) in self.project.repo_submodules(proj_pr_id, proj_branch)
+                 if s == repo ]
+        if refs and ((branch == proj_branch and proj_pr_id != PROJECT_PRIMARY) or
+                     repo not in prrepos):
+            return refs[0]
+        if repo not in prrepos:
+            return self._rem_build_branch(branch, repo)
+        return None
+
+    def _rem_builds(self, strategy, branch, proj_pr_id, proj_branch, prrepos):
+        "Returns the (Repo, Branch, PR_ID, SrcIdent) for the remaining repos"
+        r = []
+        for repo in sorted(self.project.in_project):
+            if strategy == 'standard':
+                bldbranch = None if repo in prrepos else self._rem_build_branch(branch, repo)
+                srcident = 33
+            elif not self._repo_useable(proj_pr_id, proj_branch, repo):
+                continue
+            elif strategy == 'heads':
+                bldbranch = None if repo in prrepos else self._rem_build_branch(branch, repo)
+                srcident = 32
+            else:
+                bldbranch = self._submod_spec_or_branch(proj_pr_id, proj_branch,
+                                                        prrepos, branch, repo)
+                srcident = 34
+            if bldbranch is not None:
+                r.append((repo, bldbranch, PROJECT_PRIMARY, srcident))
+        return r
+
+    def finish_config(self, cfg, branch):
+        "Generates the (Strategy, BLDS, VARS) for the PR cfg and branch"
+        proj = self._pr_builds_proj(cfg, branch)
+        if proj is None:
+            return
+        prblds = [ (e[1], e[3], e[2], 31) if e[0] == 'prcfg' else
+                   (e[1], e[2], PROJECT_PRIMARY, 30)
+                   for e in cfg ]
+        prrepos = set([ b[0] for b in prblds ])
+        for strategy in self.strategies(branch):
+            remblds = self._rem_builds(strategy, branch, proj[0], proj[1], prrepos)
+            remrepos = set([ b[0] for b in remblds ])
+            blds = tuple(sorted(set([ b for b in prblds if b[0] not in remrepos ] + remblds),
+                                key=lambda b: b[:3]))
+            for bldvars in self._varcombs:
+                yield (strategy, blds, bldvars)
+
+    def _is_branch_reachable(self, strategy, branch):
+        f, p = self.facts, self.project
+        if strategy == 'standard':
+            return any([ r in p.repos for r in f.branch_repos.get(branch, []) ])
+        if strategy == 'submodules':
+            return any([ r in p.repos and r not in p.subrepos
+                         for r in f.branch_repos.get(branch, []) ])
+        return True
+
+    def config_solutions(self):
+        """Generates each (BranchType, Branch, Description, Strategy,
+           BLDS, VARS) build configuration (build_config2/1), with the
+           same multiplicity as the logic solutions.
+        """
+        f, p = self.facts, self.project
+        for (desc, cfg, branch) in self.pr_configs():
+            if cfg:
+                for (strategy, blds, bldvars) in self.finish_config(cfg, branch):
+                    yield ('pullreq', branch, desc, strategy, blds, bldvars)
+
+        regular = [ (b, BranchReq(p.pname, b)) for b in p.branchreqs ]
+        main = f.main_branch(p.proj_repo)
+        if main is not None and main not in p.branchreqs:
+            regular.append((main, MainBranch(p.proj_repo, main)))
+        for (branch, desc) in regular:
+            for (strategy, blds, bldvars) in self.finish_config([], branch):
+                if self._is_branch_reachable(strategy, branch):
+                    yield ('regular', branch, desc, strategy, blds, bldvars)
+
+    def build_configs(self):
+        "Returns the list of unique BldConfig for the project"
+        cfgs = {}
+        for (branchtype, branch, desc, strategy, blds, bldvars) in self.config_solutions():
+            key = (branchtype, branch, repr(desc), strategy, tuple([ b[:3] for b in blds ]),
+                   tuple(sorted([ (v.varname, v.varvalue) for v in bldvars ])))
+            if key not in cfgs:
+                cfgs[key] = BldConfig(self.project.pname, branchtype, branch,
+                                      STRATEGIES[strategy], desc,
+                                      [ BldRepoRev(*b) for b in blds ],
+                                      bldvars)
+        return [ cfgs[k] for k in sorted(cfgs) ]
+
+
+def native_build_configs(input_descr, repo_info, varmatrix=None):
+    """Returns the list of BldConfig for the input description and the
+       repo_info, as would be generated by the build_config logic.
+    """
+    if not input_descr.RL:
+        return []  # dummy run, build nothing
+    if len([ r for r in input_descr.RL if r.project_repo ]) > 1:
+        raise AssertionError("only one 'project' allowed in input specification.")
+    facts = BuildFacts([ (input_descr, repo_info) ])
+    return NativeBuildConfigs(facts, input_descr.PNAME, varmatrix).build_configs()
@@ -2,24 +2,36 @@
 # specifications and repository information.
 
 from Briareus import print_each
+import attr
 import Briareus.Input.Parser as Parser
 import Briareus.BCGen.Generator as Generator
 
 class BCGen(object):
-    def __init__(self, bldsys, actor_system=None, verbose=False, up_to=None):
+    def __init__(self, bldsys, actor_system=None, verbose=False, up_to=None,
+                 lazy_variables=False, selection=None, engine='prolog'):
         self._bldsys = bldsys
         self._actor_system = actor_system
         self.verbose = verbose
         self._up_to = up_to  # None or UpTo
+        self._lazy_variables = lazy_variables
+        self._selection = selection  # None or Selection
+        self._engine = engine  # one of Generator.engines
 
     def generate(self, input_desc, repo_info, bldcfg_fname=None):
         gen = Generator.Generator(actor_system=self._actor_system,
-                                  verbose=self.verbose)
+                                  verbose=self.verbose,
+                                  lazy_variables=self._lazy_variables,
+                                  engine=self._engine)
         (rtype, cfgs) = gen.generate_build_configs(input_desc, repo_info,
                                                    up_to=self._up_to)
         # cfgs : Generator.GeneratedConfigs
         if rtype != "build_configs":   # early up_to abort
             return cfgs
+        if self._selection:
+            selection = self._selection.for_pullreqs(cfgs.cfg_pullreqs)
+            cfgs = attr.evolve(cfgs,
+                               cfg_build_configs=[ c for c in cfgs.cfg_build_configs
+                                                   if selection.has_bldcfg(c) ])
         if self.verbose or self._up_to == "build_configs":
             print_each('BUILD CONFIGS', cfgs.cfg_build_configs)
             print_each('SUBREPOS', cfgs.cfg_subrepos)
@@ -0,0 +1,53 @@
+# Execution backends for the Briareus actors.
+#
+# The "daemon" backend uses the multiprocTCPBase, where each actor
+# runs in a separate process and the VCS actors remain running
+# between hh invocations (retaining their cached forge information).
+#
+# The "inprocess" backend runs all of the actors within the current
+# process and shuts them down (via actor_system_for) at the end of the
+# run.  Requests and responses are passed directly as objects (no JSON
+# encoding) and the logic analysis runs swipl directly instead of via
+# a RunCommand actor.  This avoids the process startup and
+# serialization overhead for one-shot runs, at the cost of losing the
+# cached VCS information.
+
+from thespian.actors import ActorSystem
+import contextlib
+
+
+backends = [ 'daemon', 'inprocess' ]
+
+
+class InProcessActorSystem(ActorSystem):
+    "An ActorSystem running all actors in the current process."
+    def __init__(self):
+        super(InProcessActorSystem, self).__init__('simpleSystemBase',
+                                                   transientUnique=True)
+
+
+def new_actor_system(backend='daemon'):
+    if backend == 'inprocess':
+        return InProcessActorSystem()
+    if backend == 'daemon':
+        return ActorSystem('multiprocTCPBase')
+    raise ValueError('Unknown backend (known: %s), specified: %s' %
+                     (', '.join(backends), backend))
+
+
+def is_inprocess(actor_system):
+    return isinstance(actor_system, InProcessActorSystem)
+
+
+@contextlib.contextmanager
+def actor_system_for(backend='daemon'):
+    """Yields the ActorSystem for a run using the specified backend.
+       An inprocess ActorSystem is shutdown on exit; the daemon
+       ActorSystem is left running for subsequent runs.
+    """
+    asys = new_actor_system(backend)
+    try:
+        yield asys
+    finally:
+        if is_inprocess(asys):
+            asys.shutdown()
@@ -4,3 +4,10 @@ class Builder(object):
     def __init__(self, conf_file, builder_url=None):
         self._conf_file = conf_file
         self._builder_url = builder_url
+
+    def prefetch_build_results(self):
+        """Called (possibly in another thread) to retrieve the build
+           results in advance of the get_build_result calls.  The
+           default is to retrieve them when they are requested.
+        """
+        return None
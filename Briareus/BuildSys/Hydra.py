@@ -120,6 +120,23 @@ class HydraBuilder(BuilderBase.Builder):
                 ]),
         }
 
+    def merge_build_configurations(self, prior_output, output, selection):
+        """The Hydra output is a dictionary of jobsets; the jobsets from
+           the prior output for a branch within the selection are
+           removed and the jobsets in the new output are added.  The
+           branch is identified by the jobset variant input.
+        """
+        jobsets = json.loads(prior_output) if prior_output.strip() else {}
+        jobsets = dict([ (name, jobset) for (name, jobset) in jobsets.items()
+                         if not selection.has_branch(self._jobset_branch(jobset)) ])
+        jobsets.update(json.loads(output))
+        return json.dumps(jobsets, sort_keys=True)
+
+    def _jobset_branch(self, jobset):
+        variant = jobset.get('inputs', {}).get('variant', {}).get('value', '')
+        return ([ part[len('branch='):] for part in variant.split('|')
+                  if part.startswith('branch=') ] + [None])[0]
+
     def _jobset(self, input_desc, bldcfgs, input_cfg, bldcfg):
         jobset_inputs = self._jobset_inputs(input_desc, bldcfgs, bldcfg)
         if 'jobset' in input_cfg and 'inputs' in input_cfg['jobset']:
@@ -176,14 +193,14 @@ class HydraBuilder(BuilderBase.Builder):
         for brr in sorted(bldcfg.blds):  # BuildConfigs.BuildRepoRev
             preq = self._pullreq_for_bldcfg_and_brr(bldcfgs, bldcfg, brr)
             if preq:
-                brr_info.append( "PR%(pr_ident)s-brr%%(srcident)s:%%(reponame)s"
-                                 % preq.__dict__ % brr.__dict__ )
+                brr_info.append( "PR%s-brr%s:%s"
+                                 % (preq.pr_ident, brr.srcident, brr.reponame) )
                 continue
-            brr_info.append( "brr%(srcident)s:%(reponame)s" % brr.__dict__ )
+            brr_info.append( "brr%s:%s" % (brr.srcident, brr.reponame) )
 
         return ("Build configuration: " +
                 ", ".join(brr_info +
-                          [ "%(varname)s=%(varvalue)s" % v.__dict__
+                          [ "%s=%s" % (v.varname, v.varvalue)
                             for v in sorted(bldcfg.bldvars) ]
                 ))
 
@@ -230,6 +247,15 @@ class HydraBuilder(BuilderBase.Builder):
     def update(self, cfg_spec):
         print("Takes output of output_build_configurations and updates the actual remote builder")
 
+    def prefetch_build_results(self):
+        """Retrieves the build results from Hydra now (e.g. concurrently
+           with the generation of the build configurations) so that
+           they are already available for get_build_result.  Returns
+           the results, or a string explaining why they are not
+           available.
+        """
+        return self._get_build_results()
+
     def _get_build_results(self):
         r = getattr(self, '_build_results', None)
         if not r:
@@ -10,6 +10,7 @@ class InputDesc(object):
     RX  = attr.ib(factory=list)   # RepoLoc repo location translations
     REP = attr.ib(factory=dict)   # dictionary of reporting items (currently "logic")
     PNAME = attr.ib(factory=str)  # string "Project Name" (if blank, use project repo name)
+    VF  = attr.ib(factory=dict)   # variable combination filter ("exclude" and/or "include" lists)
 
 @attr.s(frozen=True)
 class RepoLoc(object):
@@ -21,11 +21,13 @@ class BISParser(object):
         bldvars = [ Desc.VariableDesc(n,v)
                     for n,v in x.get('Variables',dict()).items() ]
         reporting = x.get('Reporting', dict())
+        varfilter = x.get('VariableFilter', dict())
         r = Desc.InputDesc(RL=sorted(list(repos)),
                            BL=sorted(list(branches)),
                            VAR=bldvars,
                            RX=sorted(list(repo_locs)),
                            REP=reporting,
-                           PNAME=pname)
+                           PNAME=pname,
+                           VF=varfilter)
         if self.verbose: print('Input description: ', r)
         return r
@@ -1,8 +1,16 @@
 import attr
 from thespian.actors import *
 from thespian.runcommand import Command, RunCommand, CommandResult
-from datetime import timedelta
-import tempfile
+from thespian.system.simpleSystemBase import ActorSystemBase as SimpleSystemBase
+from Briareus.Backend import is_inprocess
+from datetime import datetime, timedelta
+import concurrent.futures
+import contextlib
+import functools
+import io
+import logging
+import subprocess
+import threading
 import os
 import sys
 
@@ -10,7 +18,7 @@ local_path = os.path.dirname(os.path.abspath(sys.modules['Briareus.Logic'].__fil
 
 PROLOG_TIMEOUT = timedelta(minutes=2,seconds=61)
 
-@attr.s(str=False, frozen=True)
+@attr.s(str=False, frozen=True, slots=True, cache_hash=True)
 class Fact(object):
     fact = attr.ib()
 
@@ -18,7 +26,7 @@ class Fact(object):
     def __str__(self): return self.fact + '.'
 
 
-@attr.s(str=False, frozen=True)
+@attr.s(str=False, frozen=True, slots=True, cache_hash=True)
 class DeclareFact(object):
     fact_and_arity = attr.ib()
 
@@ -31,64 +39,242 @@ class DeclareFact(object):
                           ]])
 
 
+def fact_formatter(predicate, *argfmts):
+    """Compiles the format of the facts for a predicate, where each of
+       the argfmts is the format of that argument: '"%s"' for a string,
+       or '%s' for an atom, number, or (already formatted) term.
+       Returns a function that is called with the argument values and
+       returns the Fact.  The same facts (with the same project, repo,
+       and branch names) are generated repeatedly (e.g. for each
+       strategy), so the fact text is interned to share a single copy.
+    """
+    template = predicate + '(' + ', '.join(argfmts) + ')'
+    return lambda *args: Fact(sys.intern(template % args))
+
+
+@functools.lru_cache(maxsize=16384)
+def varvalues_term(project, bldvars):
+    """Returns the Prolog list term for the tuple of BldVariable, using
+       the project (or the project of each BldVariable if None).  The
+       same variable combinations recur for every branch and strategy,
+       so the (interned) term is formatted only once.
+    """
+    return sys.intern('[ ' + ', '.join([ 'varvalue("%s", "%s", "%s")' %
+                                         (project or v.project, v.varname, v.varvalue)
+                                         for v in bldvars ]) + ' ]')
+
+
+def fact_strings(facts):
+    """Returns the sorted, unique Prolog text of the facts.  Each fact
+       is converted to its text once, which is then used for both the
+       ordering and the output.
+    """
+    return sorted(set([ str(f) for f in facts ]))
+
+
+# The facts are provided to swipl on its standard input: this (init)
+# file loads them from there, and then the analysis file is loaded
+# and run.
+stream_loader = 'stream_facts.pl'
+
+def swipl_args(analysis_fname):
+    return ["-f", os.path.join(local_path, stream_loader),
+            "-l", os.path.join(local_path, analysis_fname)]
+
+
+def fact_text(facts, raw_logic=''):
+    "Generates the Prolog text for the facts (and any raw logic)"
+    for f in facts:
+        yield str(f)
+        yield '\n'
+    yield raw_logic
+    yield '\n'
+
+
 def run_logic_analysis(analysis_fname, facts, raw_logic='', actor_system=None, verbose=False):
     """Runs the prolog logic specification in analysis_fname (which should
        be either an absolute address or relative to the Briareus.Logic
        directory), passing the specified facts (as an array of Fact or
-       DeclareFact objects).  Runs the prolog operation synchronously
-       (with the PROLOG_TIMEOUT time limit) and returns the stdout
-       generated by the prolog operation as a string.
+       DeclareFact objects, or their string text).  Runs the prolog
+       operation synchronously (with the PROLOG_TIMEOUT time limit)
+       and returns the stdout generated by the prolog operation as a
+       string.
 
        The raw_logic argument can be used to pass direct Prolog
        statements.  This is commonly used for the reporting control
        directives.
 
     """
-    (ffd, factfile) = tempfile.mkstemp(suffix=".pl")
+    if is_inprocess(actor_system):
+        return _run_swipl(facts, raw_logic, analysis_fname, verbose)
+
+    # Run prolog via an actor and return the stdout results as a raw
+    # string.  Use the multiprocTCPBase (if not already established)
+    # to take advantage of the ThespianWatch capability.
+    asys = actor_system or ActorSystem('multiprocTCPBase')
     try:
+        runner = asys.createActor(RunCommand)
+        cmdrslt = asys.ask(runner,
+                           _swipl_command(analysis_fname, facts, raw_logic, verbose),
+                           PROLOG_TIMEOUT)
+        asys.tell(runner, ActorExitRequest())
+        return _command_output(cmdrslt)
 
-        # Write out the facts for prolog ingestion
-        writefact = lambda f: os.write(ffd, (f+'\n').encode('utf-8'))
-        for f in facts:
-            writefact(str(f))
-        writefact(raw_logic)
-        os.close(ffd)
-
-        # Run prolog via an actor and return the stdout results as a
-        # raw string.  Use the multiprocTCPBase (if not already
-        # established) to take advantage of the ThespianWatch
-        # capability.
-        asys = actor_system or ActorSystem('multiprocTCPBase')
-        try:
-            runner = asys.createActor(RunCommand)
-            cmd = Command(exe='swipl',
-                          args = ["-f", factfile, "-l", os.path.join(local_path, analysis_fname)],
-                          logger=None if verbose else False,  # disable logging unless verbose
-                          logtag="{swipl}",
-                          max_bufsize=5*1024*1024,
-                          timeout=PROLOG_TIMEOUT,
-            )
-            cmdrslt = asys.ask(runner, cmd, PROLOG_TIMEOUT)
-            asys.tell(runner, ActorExitRequest())
-            if isinstance(cmdrslt, CommandResult):
-                if cmdrslt:
-                    warn = cmdrslt.stderr.strip()
-                    if warn:
-                        print(warn, file=sys.stderr)
-                    try:
-                        return cmdrslt.stdout.strip()
-                    except AttributeError as ex:
-                        print("If cmdrslt.stdout is a tuple, that means the middle of the"
-                              " output was elided by thespian runcommand; fix this by"
-                              " increasing the max_bufsize argument to Command in the code above!",
-                              file=sys.stderr)
-                        raise
-            raise RuntimeError('FAIL: ' + str(cmdrslt))
+    finally:
+        if not actor_system:
+            asys.shutdown()
+
+
+def run_logic_analyses(analysis_fname, fact_sets, raw_logic='', actor_system=None,
+                       verbose=False, max_workers=None):
+    """Runs the prolog logic specification in analysis_fname (as with
+       run_logic_analysis) once for each of the fact_sets, evaluating
+       up to max_workers (default: the number of CPUs) of them
+       concurrently.  Returns the list of stdout results, in the same
+       order as the fact_sets.
+    """
+    workers = max(1, min(len(fact_sets), max_workers or os.cpu_count() or 1))
 
+    if is_inprocess(actor_system):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(lambda facts: _run_swipl(facts, raw_logic,
+                                                          analysis_fname, verbose),
+                                 fact_sets))
+
+    asys = actor_system or ActorSystem('multiprocTCPBase')
+    try:
+        return _run_actor_analyses(asys, analysis_fname, fact_sets, raw_logic,
+                                   verbose, workers)
+    finally:
+        if not actor_system:
+            asys.shutdown()
+
+
+@contextlib.contextmanager
+def _private_context(asys):
+    """Yields a context for sending requests and listening for their
+       responses that only receives those responses (and not, for
+       example, a late response to an earlier ask that timed out).
+       The simpleSystemBase does not support private contexts; it is
+       used directly.
+    """
+    if isinstance(getattr(asys, '_systemBase', None), SimpleSystemBase):
+        yield asys
+    else:
+        with asys.private() as context:
+            yield context
+
+
+def _run_actor_analyses(asys, analysis_fname, fact_sets, raw_logic, verbose, workers):
+    # Each evaluation gets its own RunCommand actor (which runs its
+    # Commands sequentially); the results are correlated to the
+    # fact_sets by the Command logtag.
+    results = [None] * len(fact_sets)
+    pending = list(enumerate(fact_sets))
+    running = {}
+    with _private_context(asys) as context:
+        try:
+            while pending or running:
+                while pending and len(running) < workers:
+                    idx, facts = pending.pop(0)
+                    runner = context.createActor(RunCommand)
+                    cmd = _swipl_command(analysis_fname, facts, raw_logic, verbose,
+                                         logtag='{swipl#%d}' % idx)
+                    running[cmd.logtag] = (idx, runner, datetime.now() + PROLOG_TIMEOUT)
+                    context.tell(runner, cmd)
+                deadline = min([ d for (_, _, d) in running.values() ])
+                cmdrslt = context.listen(max(deadline - datetime.now(), timedelta(0)))
+                if cmdrslt is None:
+                    raise RuntimeError('FAIL: no result from swipl within %s' %
+                                       str(PROLOG_TIMEOUT))
+                if not isinstance(cmdrslt, CommandResult) or \
+                   cmdrslt.command.logtag not in running:
+                    logging.warning('Ignoring unexpected message while waiting for'
+                                    ' the logic analyses: %.200s', str(cmdrslt))
+                    continue
+                idx, runner, _ = running.pop(cmdrslt.command.logtag)
+                context.tell(runner, ActorExitRequest())
+                results[idx] = _command_output(cmdrslt)
         finally:
-            if not actor_system:
-                asys.shutdown()
+            for (_, runner, _) in running.values():
+                context.tell(runner, ActorExitRequest())
+    return results
+
 
+def _swipl_command(analysis_fname, facts, raw_logic, verbose, logtag='{swipl}'):
+    return Command(exe='swipl',
+                   args=swipl_args(analysis_fname),
+                   input_src=''.join(fact_text(facts, raw_logic)),
+                   logger=None if verbose else False,  # disable logging unless verbose
+                   logtag=logtag,
+                   max_bufsize=5*1024*1024,
+                   timeout=PROLOG_TIMEOUT,
+    )
+
+
+def _command_output(cmdrslt):
+    if isinstance(cmdrslt, CommandResult):
+        if cmdrslt:
+            warn = cmdrslt.stderr.strip()
+            if warn:
+                print(warn, file=sys.stderr)
+            try:
+                return cmdrslt.stdout.strip()
+            except AttributeError as ex:
+                print("If cmdrslt.stdout is a tuple, that means the middle of the"
+                      " output was elided by thespian runcommand; fix this by"
+                      " increasing the max_bufsize argument to Command in _swipl_command!",
+                      file=sys.stderr)
+                raise
+    raise RuntimeError('FAIL: ' + str(cmdrslt))
+
+
+# The facts are written to swipl's input in chunks of this size.
+fact_write_bufsize = 1024 * 1024
+
+def _run_swipl(facts, raw_logic, analysis_fname, verbose=False):
+    """Runs prolog directly (for the in-process backend), writing the
+       facts to its input as they are generated (so prolog can load
+       them concurrently) and returns the stdout results as a raw
+       string.
+    """
+    args = ['swipl'] + swipl_args(analysis_fname)
+    if verbose:
+        print('{swipl}', ' '.join(args))
+    proc = subprocess.Popen(args,
+                            bufsize=fact_write_bufsize,
+                            stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE)
+    output = {}
+    readers = [ threading.Thread(target=lambda n, f: output.__setitem__(n, f.read()),
+                                 args=(n, f), daemon=True)
+                for n, f in [ ('stdout', proc.stdout), ('stderr', proc.stderr) ] ]
+    for reader in readers:
+        reader.start()
+    try:
+        try:
+            with io.TextIOWrapper(proc.stdin, encoding='utf-8',
+                                  write_through=False) as factf:
+                for text in fact_text(facts, raw_logic):
+                    factf.write(text)
+        except BrokenPipeError:
+            pass  # swipl exited without reading everything; see its status below
+        try:
+            proc.wait(timeout=PROLOG_TIMEOUT.total_seconds())
+        except subprocess.TimeoutExpired:
+            raise RuntimeError('FAIL: swipl timeout after %s' % str(PROLOG_TIMEOUT))
     finally:
-        os.unlink(factfile)
-        # print('Factfile', str(factfile))
+        # On any failure (including generating or writing the facts),
+        # swipl must not be left running with the readers waiting on it.
+        if proc.returncode is None:
+            proc.kill()
+            proc.wait()
+        for reader in readers:
+            reader.join()
+    warn = output['stderr'].decode('utf-8', errors='replace').strip()
+    if proc.returncode != 0:
+        raise RuntimeError('FAIL: swipl exit %d: %s' % (proc.returncode, warn))
+    if warn:
+        print(warn, file=sys.stderr)
+    return output['stdout'].decode('utf-8').strip()
@@ -1,7 +1,77 @@
-from Briareus.Logic.Evaluation import DeclareFact, Fact
+from Briareus.Logic.Evaluation import DeclareFact, Fact, fact_formatter
+import itertools
 
 
-def get_input_facts(PNAME, RL, BL, VAR, repo_info):
+# Compiled formatters for the input facts
+_S = '"%s"'
+_repo_fact = fact_formatter('repo', _S, _S)
+_main_branch_fact = fact_formatter('main_branch', _S, _S)
+_project_fact = fact_formatter('project', _S, _S)
+_branchreq_fact = fact_formatter('branchreq', _S, _S)
+_subrepo_fact = fact_formatter('subrepo', _S, _S)
+_branch_fact = fact_formatter('branch', _S, _S)
+_pullreq_fact = fact_formatter('pullreq', _S, _S, _S, _S, _S)
+_submodule_fact = fact_formatter('submodule', _S, '%s', _S, _S, _S)
+_varname_fact = fact_formatter('varname', _S, _S)
+_varvalue_fact = fact_formatter('varvalue', _S, _S, _S)
+_other_project_fact = fact_formatter('other_project', _S, _S)
+
+
+def varfilter_patterns(patterns):
+    """Converts the "exclude" or "include" patterns from the input
+       specification VariableFilter into a list of patterns, where
+       each pattern is a list of (varname, varvalue) tuples.  A
+       pattern in the input may specify a list of values for a
+       variable; that is expanded to one pattern per value.
+    """
+    r = []
+    for pat in patterns or []:
+        names = sorted(pat.keys())
+        values = [ pat[n] if isinstance(pat[n], (list, tuple)) else [pat[n]]
+                   for n in names ]
+        r.extend([ list(zip(names, vals)) for vals in itertools.product(*values) ])
+    return r
+
+
+def check_repo_branches(RL, repo_info):
+    "Raises a RuntimeError if any repo has no branches available"
+    repos_without_branches = [r.repo_name for r in RL] + [r.repo_name for r in repo_info['subrepos']]
+    for rb in repo_info['branches']:
+        while rb[0] in repos_without_branches:
+            repos_without_branches.remove(rb[0])
+    if repos_without_branches:
+        raise RuntimeError("The following repos have no available branches: %s"
+                           % str(repos_without_branches))
+
+
+def project_submodules(project_repo, BL, repo_info):
+    """Returns the submodule specifications of the project repo that are
+       relevant to the build configurations (for the requested
+       branches, the main branch, and the pull requests on the
+       project repo) as a list of (PullReqID, BranchName,
+       SubmoduleRepo, SubmoduleRef), where the PullReqID is None for
+       the project repo itself.
+    """
+    # n.b. repo_info['submodules'] are of type SubModuleInfo from InternalOps;
+    # the actual definition is not imported here because Python is
+    # duck-typed.
+    submods_data = lambda bname, pr_id: [ (e.sm_sub_name, e.sm_sub_vers)
+                                          for e in repo_info['submodules']
+                                          if (e.sm_repo_name == project_repo.repo_name
+                                              and e.sm_branch == bname
+                                              and e.sm_pullreq_id == pr_id
+                                             )]
+    r = []
+    for bn in set([b.branch_name for b in BL] + [project_repo.main_branch]):
+        r.extend([ (None, bn) + repover for repover in submods_data(bn, None) ])
+    for p in repo_info['pullreqs']:
+        if p.pr_target_repo == project_repo.repo_name:
+            r.extend([ (p.pr_ident, p.pr_branch) + repover
+                       for repover in submods_data(p.pr_branch, p.pr_ident) ])
+    return r
+
+
+def get_input_facts(PNAME, RL, BL, VAR, repo_info, varfilter=None):
 
     if not RL:
         return []  # dummy run, build nothing
@@ -87,7 +157,19 @@ def get_input_facts(PNAME, RL, BL, VAR, repo_info):
         # varvalue(ProjectRepo, VarName, VarValue)
         DeclareFact('varvalue/3'),
 
-    ]
+    ] + ([
+
+        # Specifies a combination of variable values that should not
+        # be built (varcomb_exclude) or, if any are present, the
+        # combinations that are the only ones to be built
+        # (varcomb_include).  Each is a partial combination: it
+        # matches any combination including all of the specified
+        # variable values.  Format is: varcomb_exclude(ProjectRepo,
+        # [varvalue(ProjectRepo, VarName, VarValue), ...])
+        DeclareFact('varcomb_exclude/2'),
+        DeclareFact('varcomb_include/2'),
+
+    ] if varfilter else [])
 
     repo_facts    = ([ Fact('default_main_branch("master")') ] +
                      # ^^ note: for a multi-project config, possibly
@@ -95,15 +177,14 @@ def get_input_facts(PNAME, RL, BL, VAR, repo_info):
                      # globally true.  When this varied support is
                      # necesary, this fact might need a projectname
                      # addition.
-                     [ Fact('repo("%s", "%s")'    % (project_name, r.repo_name))   for r in RL ] +
-                     [ Fact('main_branch("%s", "%s")' % (r.repo_name, r.main_branch))
+                     [ _repo_fact(project_name, r.repo_name) for r in RL ] +
+                     [ _main_branch_fact(r.repo_name, r.main_branch)
                        for r in RL if r.main_branch != "master" ])
-    project_facts = [ Fact('project("%s", "%s")' % (project_name, r.repo_name))
+    project_facts = [ _project_fact(project_name, r.repo_name)
                       for r in projects ]
-    branch_facts  = [ Fact('branchreq("%s", "%s")'  % (project_name, b.branch_name))
+    branch_facts  = [ _branchreq_fact(project_name, b.branch_name)
                       for r in projects for b in BL ]
-    subrepo_facts = [ Fact('subrepo("%s", "%s")'
-                           % (project_repo.repo_name, r.repo_name))
+    subrepo_facts = [ _subrepo_fact(project_repo.repo_name, r.repo_name)
                       for r in repo_info['subrepos'] ]
 
     # n.b. repo_info['pullreqs'] are of type PRInfo from InternalOps;
@@ -111,8 +192,7 @@ def get_input_facts(PNAME, RL, BL, VAR, repo_info):
     # duck-typed.
     pullreqs = repo_info['pullreqs']
     pullreq_facts = [
-        Fact('pullreq("%(pr_target_repo)s", "%(pr_ident)s", "%(pr_branch)s", "%(pr_user)s", "%(pr_email)s")' %
-             p.__dict__)
+        _pullreq_fact(p.pr_target_repo, p.pr_ident, p.pr_branch, p.pr_user, p.pr_email)
         for p in pullreqs ]
 
     # n.b. See note in InternalOps: a pullreq for a repo
@@ -121,45 +201,32 @@ def get_input_facts(PNAME, RL, BL, VAR, repo_info):
     # will cause a check on all other repositories (including
     # other projects sharing this repository) for the branch.
 
-    repos_without_branches = [r.repo_name for r in RL] + [r.repo_name for r in repo_info['subrepos']]
-    for rb in repo_info['branches']:
-        while rb[0] in repos_without_branches:
-            repos_without_branches.remove(rb[0])
-    if repos_without_branches:
-        raise RuntimeError("The following repos have no available branches: %s"
-                           % str(repos_without_branches))
+    check_repo_branches(RL, repo_info)
 
-    repobranch_facts = [ Fact('branch("%s", "%s")' % rb)
+    repobranch_facts = [ _branch_fact(*rb)
                          for rb in repo_info['branches'] ]
 
-    submodules_facts = []
-    # n.b. repo_info['submodules'] are of type SubModuleInfo from InternalOps;
-    # the actual definition is not imported here because Python is
-    # duck-typed.
-    submods_data = lambda bname, pr_id: [ (e.sm_sub_name, e.sm_sub_vers)
-                                          for e in repo_info['submodules']
-                                          if (e.sm_repo_name == project_repo.repo_name
-                                              and e.sm_branch == bname
-                                              and e.sm_pullreq_id == pr_id
-                                             )]
-    for bn in set([b.branch_name for b in BL] + [project_repo.main_branch]):
-        for repover in submods_data(bn, None):
-            submodules_facts.append( Fact('submodule("%s", project_primary, "%s", "%%s", "%%s")'
-                                          % (project_repo.repo_name, bn) % repover) )
-    for p in pullreqs:
-        if p.pr_target_repo == project_repo.repo_name:
-            for repover in submods_data(p.pr_branch, p.pr_ident):
-                submodules_facts.append(
-                    Fact('submodule("%(pr_target_repo)s", "%(pr_ident)s", "%(pr_branch)s", "%%s", "%%s")'
-                         % p.__dict__ % repover) )
+    submodules_facts = [
+        _submodule_fact(project_repo.repo_name,
+                        'project_primary' if pr_id is None else '"%s"' % pr_id,
+                        bn, subrepo, subref)
+        for (pr_id, bn, subrepo, subref) in project_submodules(project_repo, BL, repo_info) ]
 
     varname_facts = []
     varval_facts = []
     for var in VAR:
-        varname_facts.append( Fact('varname("%s", "%s")' % (project_name, var.variable_name)) )
-        varval_facts.extend( [ Fact('varvalue("%s", "%s", "%s")' %
-                                        (project_name, var.variable_name, val))
-                                   for val in var.variable_values ] )
+        varname_facts.append( _varname_fact(project_name, var.variable_name) )
+        varval_facts.extend( [ _varvalue_fact(project_name, var.variable_name, val)
+                               for val in var.variable_values ] )
+
+    varfilter_facts = [
+        Fact('%s("%s", [%s])' %
+             (factname, project_name,
+              ', '.join([ 'varvalue("%s", "%s", "%s")' % (project_name, n, v)
+                          for (n, v) in pat ])))
+        for (factname, key) in [ ('varcomb_exclude', 'exclude'),
+                                 ('varcomb_include', 'include') ]
+        for pat in varfilter_patterns((varfilter or {}).get(key, [])) ]
 
     return (declare_facts +
             project_facts +
@@ -170,5 +237,31 @@ def get_input_facts(PNAME, RL, BL, VAR, repo_info):
             pullreq_facts +
             submodules_facts +
             varname_facts +
-            varval_facts
+            varval_facts +
+            varfilter_facts
             )
+
+
+def get_other_project_facts(PNAME, RL, BL, repo_info):
+    """Returns the facts for another project when the analysis is
+       partitioned by project (see AnaRep).  The other project is
+       identified by other_project instead of project (so there are
+       no build configurations or reports for it), but its repos,
+       branch requests, and VCS information are still shared with
+       the project being analyzed.
+    """
+    projects = [ r for r in (RL or []) if r.project_repo ]
+    if not projects:
+        return []
+    project_repo = projects[0]
+    return ([ DeclareFact('other_project/2'),
+              _other_project_fact(PNAME, project_repo.repo_name) ] +
+            [ _repo_fact(PNAME, r.repo_name) for r in RL ] +
+            [ _main_branch_fact(r.repo_name, r.main_branch)
+              for r in RL if r.main_branch != "master" ] +
+            [ _subrepo_fact(project_repo.repo_name, r.repo_name)
+              for r in repo_info['subrepos'] ] +
+            [ _branchreq_fact(PNAME, b.branch_name) for b in BL ] +
+            [ _branch_fact(*rb) for rb in repo_info['branches'] ] +
+            [ _pullreq_fact(p.pr_target_repo, p.pr_ident, p.pr_branch, p.pr_user, p.pr_email)
+              for p in repo_info['pullreqs'] ])
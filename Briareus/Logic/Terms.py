@@ -0,0 +1,163 @@
+"""Reader for simple Prolog facts.
+
+The Reporting logic of an input specification is normally a set of
+facts (e.g. enable/3, project_owner/2, email_domain_whitelist/1) that
+are passed to the logic with the analysis rules.  This reads that
+text into Python terms so that the facts can be used without the
+logic: strings are returned as str, integers as int, lists as list,
+and atoms, variables and compound terms as the Atom, Var and Term
+objects below.
+
+Only facts are supported: any rule, directive, or other syntax raises
+UnsupportedLogic, in which case the logic must be evaluated by swipl.
+"""
+
+import attr
+import itertools
+import re
+
+
+class UnsupportedLogic(Exception):
+    "The logic text cannot be handled by this reader"
+
+
+@attr.s(frozen=True)
+class Atom(object):
+    name = attr.ib()
+
+
+@attr.s(frozen=True)
+class Var(object):
+    name = attr.ib()
+
+
+@attr.s(frozen=True)
+class Term(object):
+    functor = attr.ib()
+    args = attr.ib(converter=tuple)
+
+
+_token_re = re.compile(r'''
+      (?P<ws>\s+|%[^\n]*|/\*.*?\*/)
+    | (?P<string>"(?:[^"\\]|\\.)*")
+    | (?P<qatom>'(?:[^'\\]|\\.)*')
+    | (?P<number>-?\d+)
+    | (?P<atom>[a-z][A-Za-z0-9_]*)
+    | (?P<var>[A-Z_][A-Za-z0-9_]*)
+    | (?P<punct>[()\[\],|])
+    | (?P<end>\.(?=\s|%|$))
+''', re.VERBOSE | re.DOTALL)
+
+_escapes = { 'n': '\n', 't': '\t', '\\': '\\', '"': '"', "'": "'" }
+
+
+def _unquote(text):
+    return re.sub(r'\\(.)', lambda m: _escapes.get(m.group(1), m.group(1)), text[1:-1])
+
+
+def _tokens(text):
+    pos = 0
+    while pos < len(text):
+        m = _token_re.match(text, pos)
+        if not m:
+            raise UnsupportedLogic('unsupported logic syntax: %s' % text[pos:pos+40])
+        pos = m.end()
+        if m.lastgroup != 'ws':
+            yield (m.lastgroup, m.group(m.lastgroup))
+    yield ('eof', None)
+
+
+class _Reader(object):
+    def __init__(self, text):
+        self._tokens = _tokens(text)
+        self._anon = itertools.count()
+        self._advance()
+
+    def _advance(self):
+        self.kind, self.value = next(self._tokens)
+
+    def _expect(self, punct):
+        if (self.kind, self.value) != ('punct', punct):
+            raise UnsupportedLogic('expected "%s" but found: %s' % (punct, self.value))
+        self._advance()
+
+    def _args(self, close):
+        args = [ self.term() ]
+        while (self.kind, self.value) == ('punct', ','):
+            self._advance()
+            args.append(self.term())
+        tail = []
+        if close == ']' and (self.kind, self.value) == ('punct', '|'):
+            self._advance()
+            tail = self.term()
+            if not isinstance(tail, list):
+                raise UnsupportedLogic('unsupported list tail: %s' % str(tail))
+        self._expect(close)
+        return args + tail
+
+    def term(self):
+        kind, value = self.kind, self.value
+        self._advance()
+        if kind == 'string':
+            return _unquote(value)
+        if kind == 'number':
+            return int(value)
+        if kind == 'var':
+            return Var('_%d' % next(self._anon) if value == '_' else value)
+        if kind in ['atom', 'qatom']:
+            name = value if kind == 'atom' else _unquote(value)
+            if (self.kind, self.value) == ('punct', '('):
+                self._advance()
+                return Term(name, self._args(')'))
+            return Atom(name)
+        if (kind, value) == ('punct', '['):
+            if (self.kind, self.value) == ('punct', ']'):
+                self._advance()
+                return []
+            return self._args(']')
+        raise UnsupportedLogic('unsupported logic syntax: %s' % value)
+
+    def facts(self):
+        while self.kind != 'eof':
+            fact = self.term()
+            if self.kind != 'end':
+                raise UnsupportedLogic('only facts are supported, found: %s' % self.value)
+            self._advance()
+            yield fact
+
+
+def read_facts(text):
+    """Returns the list of facts (each an Atom or Term) in the logic
+       text, or raises UnsupportedLogic.
+    """
+    return list(_Reader(text).facts())
+
+
+def unify(pattern, value, bindings=None):
+    """Returns the (updated copy of the) variable bindings dictionary if
+       the pattern and value unify, otherwise None.
+    """
+    bindings = dict(bindings or {})
+    pairs = [ (pattern, value) ]
+    while pairs:
+        a, b = pairs.pop()
+        while isinstance(a, Var) and a in bindings:
+            a = bindings[a]
+        while isinstance(b, Var) and b in bindings:
+            b = bindings[b]
+        if isinstance(a, Var):
+            if a != b:
+                bindings[a] = b
+        elif isinstance(b, Var):
+            bindings[b] = a
+        elif isinstance(a, Term) and isinstance(b, Term):
+            if a.functor != b.functor or len(a.args) != len(b.args):
+                return None
+            pairs.extend(zip(a.args, b.args))
+        elif isinstance(a, list) and isinstance(b, list):
+            if len(a) != len(b):
+                return None
+            pairs.extend(zip(a, b))
+        elif type(a) != type(b) or a != b:
+            return None
+    return bindings
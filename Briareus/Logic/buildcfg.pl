@@ -36,7 +36,7 @@ finish_config(PName, CFG, Branch, Strategy, BLDS, VARS) :-
     , rem_builds(PName, Strategy, Branch, Proj_PR_ID, ProjBranch, PRBLDS, REMBLDS)
     , join_prblds_remblds(PRBLDS, REMBLDS, BLDS)
     , all_vars(PName, VL)
-    , varcombs(PName, VL, VARS)
+    , config_varcombs(PName, VL, VARS)
     .
 
 join_prblds_remblds(PRBLDS, REMBLDS, BLDS) :-
@@ -102,7 +102,11 @@ build_repo(bld(Repo, _, _, _), Repo).
 
 rem_builds(PName, Strategy, Branch, Proj_PR_ID, ProjBranch, PRBLDS, REMBLDS) :-
     builds_repos(PRBLDS, PRREPOS),
-    findall(BLD, rem_build(PName, Strategy, Branch, Proj_PR_ID, ProjBranch, PRREPOS, BLD), REMBLDS).
+    findall(BLD, rem_build(PName, Strategy, Branch, Proj_PR_ID, ProjBranch, PRREPOS, BLD), BLDS),
+    % The (tabled) repo_in_project answers are not in any particular
+    % order; there is one BLD per repo, so sorting them orders the
+    % builds by repo.
+    msort(BLDS, REMBLDS).
 %% KWQ: setof the above for uniqueness, but needed findall because there may not be any repos not already in PRBLDS
 
 rem_build(PName, standard, Branch, _, _, PRBLD_REPOS, bld(R, B, project_primary, brr(33))) :-
@@ -1,6 +1,21 @@
 %% This provides a library of various logic predicates that can be
 %% used in the generation and analysis of build configurations.
 
+%% These derived relations are used repeatedly (with the same
+%% arguments) for each combination of pullreq, strategy, and variable
+%% values when generating and analyzing build configurations.  Tabling
+%% computes each answer set once and provides indexed lookup of the
+%% answers for subsequent calls.  Note that tabling provides set
+%% semantics (no duplicate answers), so these do not need a setof for
+%% uniqueness, but the answers are not sorted: a caller that collects
+%% the answers into a list must sort them (see rem_builds).
+:- table is_main_branch/2,
+         repo_in_project/2,
+         proj_repo_branch/2,
+         branch_type/3,
+         has_gitmodules/2,
+         strategy/3.
+
 %% Test if an argument is a Project Repo
 is_project_repo(R) :- project(_, R).
 
@@ -16,8 +31,17 @@ all_vars(PName, ALLV) :- findall(VN, varname(PName, VN), ALLV).
 
 repo_in_project(PName, Repo) :-
     project(PName, ProjRepo)
-    , setof(R, (repo(PName, R) ; subrepo(ProjRepo, R)), RS)
-    , member(Repo, RS)
+    , (repo(PName, Repo) ; subrepo(ProjRepo, Repo))
+.
+% When the analysis is partitioned by project, the facts for each of
+% the other projects are reduced to other_project(PName, ProjRepo)
+% and their repo, subrepo, and branchreq facts: those repos are still
+% part of a (pr_grouped) pull request, and their branches are still
+% regular branches.
+repo_in_project(PName, Repo) :-
+    current_predicate(other_project/2)
+    , other_project(PName, ProjRepo)
+    , (repo(PName, Repo) ; subrepo(ProjRepo, Repo))
 .
 
 % proj_repo_branch: does the branch exist for the specified project?
@@ -27,14 +51,10 @@ proj_repo_branch(PName, B) :- project(PName, R), is_main_branch(R, B), \+ branch
 % ----------------------------------------------------------------------
 % Branch Type
 
-branch_type(pullreq, B, PR_ID) :-
-    setof((PI,PB), R^pullreq(R, PI, PB, _, _), XS)
-    , member((PR_ID,B), XS)
-.
+branch_type(pullreq, B, PR_ID) :- pullreq(_R, PR_ID, B, _, _).
+branch_type(regular, B, project_primary) :- proj_repo_branch(_N, B).
 branch_type(regular, B, project_primary) :-
-    setof(BR, N^proj_repo_branch(N,BR), BRS)
-    , member(B, BRS)
-.
+    current_predicate(other_project/2), other_project(_N, R), is_main_branch(R, B).
 
 
 % ----------------------------------------------------------------------
@@ -77,7 +97,7 @@ has_gitmodules(R, B) :-
     , \+ length(SBG, 0)
 .
 
-strategy(S, PName, B) :- setof(ST, strategy_plan(ST,PName,B), SS), member(S, SS).
+strategy(S, PName, B) :- strategy_plan(S, PName, B).
 
 % ----------------------------------------------------------------------
 % Variable Value combinations
@@ -100,3 +120,27 @@ varcombs(PName, [VN|VNS], [varvalue(PName,VN,VVS)|VNSVS]) :-
     varname(PName, VN),
     varvalue(PName, VN,VVS),
     varcombs(PName, VNS, VNSVS).
+
+% True if the variable value combination is not excluded by any
+% varcomb_exclude filter and (if there are any varcomb_include
+% filters) matches at least one varcomb_include filter.  The filter
+% facts are only present when the input specifies a VariableFilter, so
+% their existence is checked before they are used.
+varcomb_allowed(PName, VARS) :-
+    \+ (current_predicate(varcomb_exclude/2)
+        , varcomb_exclude(PName, XS)
+        , subset(XS, VARS)
+        )
+    , \+ (current_predicate(varcomb_include/2)
+          , varcomb_include(PName, _)
+          , \+ (varcomb_include(PName, IS), subset(IS, VARS))
+          )
+    .
+
+% Returns the variable value combinations for a build configuration.
+% If lazy_varcombs is specified, a single build configuration with no
+% variable values is returned and the combinations are expanded
+% (applying the same filtering) when writing the builder
+% configuration.
+config_varcombs(_, _, []) :- current_predicate(lazy_varcombs/0), lazy_varcombs, !.
+config_varcombs(PName, VL, VARS) :- varcombs(PName, VL, VARS), varcomb_allowed(PName, VARS).
@@ -0,0 +1,12 @@
+%% The built_analysis for one project's partition of the facts (see
+%% AnaRep): a partition may have no reports, so the reports are
+%% collected with findall (the merged results are checked for
+%% reports instead), and each layer is printed separately.
+:- [buildcfg,reportrules,analysis],
+   findall(X, report(X), XS),
+   sort(XS, CFGS),
+   findall(A, analysis(A), AS),
+   findall(N, action(N), NS),
+   findall(D, do(D), DS),
+   print([CFGS,AS,NS,DS]),
+   halt.
@@ -0,0 +1,3 @@
+%% Loads the facts (written by Briareus.Logic.Evaluation) from the
+%% standard input before the analysis file is loaded.
+:- load_files(user:briareus_facts, [stream(user_input)]).
@@ -0,0 +1,79 @@
+# Selection of a subset of the projects, branches, and pull requests
+# for a selective (partial) Briareus run.
+#
+# A selective run only generates the build configurations within the
+# selection; the builder configuration output and the report entries
+# for those are merged with the previous output and report, which
+# supply everything outside of the selection.
+
+import attr
+from Briareus.Types import (StatusReport, PendingStatus, NewPending, PR_Status)
+from Briareus.AnaRep.Export import entry_project
+
+
+@attr.s(frozen=True)
+class Selection(object):
+    projects = attr.ib(factory=list)  # project names
+    branches = attr.ib(factory=list)  # branch names
+    pullreqs = attr.ib(factory=list)  # pull request identifiers
+
+    def __bool__(self):
+        return bool(self.projects or self.branches or self.pullreqs)
+
+    def restricts_branches(self):
+        return bool(self.branches or self.pullreqs)
+
+    def for_pullreqs(self, pullreqs):
+        """Returns a Selection where the selected pull requests are also
+           represented by their branch names, given the list of
+           InternalOps.PRInfo pull requests.  Build configurations and
+           reports identify pull requests by branch, and all of the
+           pull requests sharing a branch name are built together.
+        """
+        if not self.pullreqs:
+            return self
+        prbranches = [ p.pr_branch for p in pullreqs
+                       if str(p.pr_ident) in self.pullreqs ]
+        return attr.evolve(self,
+                           branches=sorted(set(list(self.branches) + prbranches)))
+
+    def has_project(self, projectname):
+        return not self.projects or projectname in self.projects
+
+    def has_branch(self, branchname):
+        return not self.restricts_branches() or branchname in self.branches
+
+    def has_bldcfg(self, bldcfg):
+        return (self.has_project(bldcfg.projectname) and
+                self.has_branch(bldcfg.branchname))
+
+    def has_entry(self, entry):
+        """Returns true if the report entry is regenerated by a run with
+           this selection.  Entries that are not associated with a
+           specific branch (e.g. project notifications) are only
+           regenerated if branches are not restricted.
+        """
+        if not self.has_project(entry_project(entry)):
+            return False
+        branch = entry_branch(entry)
+        if branch is None:
+            return not self.restricts_branches()
+        return self.has_branch(branch)
+
+
+def entry_branch(entry):
+    "Returns the branch name for this report entry (or None)"
+    if isinstance(entry, (StatusReport, PendingStatus, PR_Status)):
+        return entry.branch
+    if isinstance(entry, NewPending):
+        return entry.bldcfg.branchname
+    return None
+
+
+def merge_report(prior_report, report, selection):
+    """Returns the report for a selective run: the entries of the prior
+       report that are outside of the selection, followed by the
+       entries of the new report within the selection.
+    """
+    return ([ e for e in (prior_report or []) if not selection.has_entry(e) ] +
+            [ e for e in report if selection.has_entry(e) ])
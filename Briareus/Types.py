@@ -8,7 +8,12 @@ import attr
 def sorted_nub_list(l):
     return sorted(list(set(l)))
 
-@attr.s(frozen=True)
+# The build configuration and status records are created in large
+# numbers (for each combination of branch, strategy, and variables),
+# so these are slotted (no per-instance __dict__).  Those without
+# list fields are hashable and also cache their hash values.
+
+@attr.s(frozen=True, slots=True)
 class BldConfig(object):
     projectname = attr.ib()
     branchtype = attr.ib()  # default="regular"
@@ -62,7 +67,7 @@ class PR_Grouped(object):
     def as_fact(self):
         return 'pr_type(pr_grouped, "' + self.branchname + '")'
 
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True, cache_hash=True)
 class BldRepoRev(object):
     reponame   = attr.ib()
     repover    = attr.ib()
@@ -74,7 +79,7 @@ class BldRepoRev(object):
       # logic statement generated it.
     srcident   = attr.ib(default="unk", cmp=False)
 
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True, cache_hash=True)
 class BldVariable(object):
     project = attr.ib()
     varname = attr.ib()
@@ -108,7 +113,7 @@ class ProjectSummary(object):
     subrepo_count = attr.ib()  # int
     pullreq_count = attr.ib()  # int
 
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class StatusReport(object):
     status    = attr.ib()  # string "succeeded", "fixed", "initial_success", "pending", "badconfig", or int count of failing build jobs.
     project   = attr.ib()  # string name of project
@@ -119,7 +124,7 @@ class StatusReport(object):
     bldvars   = attr.ib(converter=sorted)  # list of BldVariable
     blddesc   = attr.ib(default="unk")  # same as BldConfig.description above
 
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class PendingStatus(object):
     """Just like StatusReport, but no 'status' field because there will
        (maybe) be a StatusReport from a previous build and this
@@ -137,7 +142,7 @@ class PendingStatus(object):
 class NewPending(object):
     bldcfg = attr.ib()  # BldConfig
 
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True, cache_hash=True)
 class VarFailure(BldVariable): pass
 
 @attr.s(frozen=True)
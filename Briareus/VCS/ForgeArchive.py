@@ -0,0 +1,188 @@
+"""Recording and replay of the forge HTTP exchanges of RemoteGit__Info.
+
+When the BRIAREUS_FORGE_RECORD environment variable specifies a
+directory, each forge request made by a RemoteGit__Info (GitHubInfo or
+GitLabInfo) and its response are appended to an archive file in that
+directory (one file per repository API URL).  Only the parts of the
+exchange that Briareus uses are retained: the URL, the conditional
+request headers, the response status, the headers used for caching,
+pagination and rate limiting, and the response body.  Each exchange is
+a separately compressed gzip member, so the archive is still readable
+if the recording process is interrupted.
+
+When the BRIAREUS_FORGE_REPLAY environment variable specifies a
+directory containing such archives, the recorded responses are served
+to the RemoteGit__Info instead of making network requests, so that the
+complete gather path (including pagination, the response cache, and
+conditional requests) can be exercised, benchmarked, and profiled
+offline.  Replay is deterministic: the responses for each URL and set
+of conditional headers are replayed in the order they were recorded
+(the last one is repeated thereafter).  A conditional request that was
+not recorded is answered with a 304 if it matches the validators of
+the recorded response.
+
+The BRIAREUS_FORGE_REPLAY_LATENCY environment variable specifies the
+delay in seconds for each replayed response, optionally followed by a
+comma and a maximum additional (pseudo-random, but reproducible) jitter
+in seconds, e.g. "0.08,0.04".
+"""
+
+import collections
+import gzip
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+RECORD_ENV = 'BRIAREUS_FORGE_RECORD'
+REPLAY_ENV = 'BRIAREUS_FORGE_REPLAY'
+LATENCY_ENV = 'BRIAREUS_FORGE_REPLAY_LATENCY'
+
+# The request headers that affect the response (the conditional
+# request validators), and the response headers that are used by
+# RemoteGit__Info and the forge rate limit scheduler.
+request_headers = [ 'If-None-Match', 'If-Modified-Since' ]
+response_headers = [ 'Content-Type', 'ETag', 'Last-Modified', 'Link', 'Retry-After',
+                     'X-RateLimit-Limit', 'X-RateLimit-Remaining', 'X-RateLimit-Reset',
+                     'RateLimit-Limit', 'RateLimit-Remaining', 'RateLimit-Reset',
+]
+
+
+class ReplayMissing(RuntimeError):
+    "No response was recorded for the replayed request"
+
+
+def archive_file(archive_dir, api_url):
+    "Returns the archive file in the archive_dir for the forge api_url"
+    return os.path.join(archive_dir,
+                        hashlib.sha1(api_url.encode('utf-8')).hexdigest()[:16] + '-forge.jsonl.gz')
+
+
+def parse_latency(spec):
+    "Returns the (latency, jitter) in seconds for the latency spec string"
+    if not spec:
+        return (0.0, 0.0)
+    latency, _, jitter = spec.partition(',')
+    return (float(latency), float(jitter or 0.0))
+
+
+def forge_session(api_url):
+    """Returns the requests session to use for the forge requests of
+       the RemoteGit__Info for the api_url, which records or replays
+       the exchanges if enabled by the environment.
+    """
+    replay_dir = os.getenv(REPLAY_ENV)
+    if replay_dir:
+        return ReplaySession(archive_file(replay_dir, api_url),
+                             *parse_latency(os.getenv(LATENCY_ENV)))
+    record_dir = os.getenv(RECORD_ENV)
+    if record_dir:
+        os.makedirs(record_dir, exist_ok=True)
+        return RecordingSession(archive_file(record_dir, api_url))
+    return requests.Session()
+
+
+def _vkey(headers):
+    "The key for the request headers that affect the response"
+    return tuple([ (h, headers[h]) for h in request_headers if h in (headers or {}) ])
+
+
+def read_archive(fname):
+    "Returns the list of exchanges (dictionaries) in the archive file"
+    exchanges = []
+    with gzip.open(fname, 'rt', encoding='utf-8') as archf:
+        for line in archf:
+            if line.strip():
+                exchanges.append(json.loads(line))
+    return exchanges
+
+
+class RecordingSession(requests.Session):
+    """A requests session that appends each GET exchange to the
+       archive file.  The concurrent page fetches may share the
+       session.
+    """
+
+    def __init__(self, fname):
+        super(RecordingSession, self).__init__()
+        self.fname = fname
+        self._lock = threading.Lock()
+
+    def get(self, url, **kw):
+        rsp = super(RecordingSession, self).get(url, **kw)
+        exchange = { 'url': url,
+                     'req': dict(_vkey(kw.get('headers', None))),
+                     'status': rsp.status_code,
+                     'headers': dict([ (h, rsp.headers[h]) for h in response_headers
+                                       if h in rsp.headers ]),
+                     'body': rsp.text,
+        }
+        data = gzip.compress((json.dumps(exchange) + '\n').encode('utf-8'))
+        with self._lock:
+            with open(self.fname, 'ab') as archf:
+                archf.write(data)
+        return rsp
+
+
+class ReplaySession(requests.Session):
+    """A requests session that serves the responses recorded in the
+       archive file, delaying each response by the latency plus up to
+       jitter seconds.
+    """
+
+    def __init__(self, fname, latency=0.0, jitter=0.0, seed=0):
+        super(ReplaySession, self).__init__()
+        self.fname = fname
+        self.latency = latency
+        self.jitter = jitter
+        self.replayed = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._exchanges = collections.defaultdict(list)  # (url, vkey) --> [exchange]
+        self._latest = {}  # url --> last recorded 200 exchange
+        self._next = collections.Counter()  # (url, vkey) --> next exchange index
+        for exchange in (read_archive(fname) if os.path.exists(fname) else []):
+            self._exchanges[(exchange['url'], _vkey(exchange['req']))].append(exchange)
+            if exchange['status'] == 200:
+                self._latest[exchange['url']] = exchange
+
+    def _lookup(self, url, vkey):
+        with self._lock:
+            recorded = self._exchanges.get((url, vkey), None)
+            if recorded:
+                idx = min(self._next[(url, vkey)], len(recorded) - 1)
+                self._next[(url, vkey)] += 1
+                return recorded[idx]
+            latest = self._latest.get(url, None)
+            if latest and vkey:
+                hdrs = CaseInsensitiveDict(latest['headers'])
+                validators = dict(vkey)
+                if validators.get('If-None-Match', None) == hdrs.get('ETag', '') or \
+                   validators.get('If-Modified-Since', None) == hdrs.get('Last-Modified', ''):
+                    return dict(latest, status=304, body='')
+            if latest:
+                return latest
+            if (url, ()) in self._exchanges:
+                return self._exchanges[(url, ())][-1]
+        raise ReplayMissing('No recorded response for %s in %s' % (url, self.fname))
+
+    def get(self, url, **kw):
+        exchange = self._lookup(url, _vkey(kw.get('headers', None)))
+        with self._lock:
+            delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0)
+            self.replayed += 1
+        if delay:
+            time.sleep(delay)
+        rsp = requests.Response()
+        rsp.status_code = exchange['status']
+        rsp.headers = CaseInsensitiveDict(exchange['headers'])
+        rsp._content = exchange['body'].encode('utf-8')
+        rsp.encoding = 'utf-8'
+        rsp.url = url
+        rsp.reason = 'Replayed'
+        return rsp
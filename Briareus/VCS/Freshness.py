@@ -0,0 +1,69 @@
+"""Freshness policy for the locally cached forge API responses.
+
+A cached response is re-used without contacting the forge while it
+is fresh; once stale, it is revalidated with a conditional request
+(see RemoteGit__Info._get_cached_url).  How long a response stays fresh
+depends on the type of resource requested:
+
+  * Content retrieved by commit sha can never change, so it is always
+    fresh.  A "not found" response is not: the content may become
+    visible later (e.g. a private fork whose access has not yet
+    propagated), so it is only fresh for the LocalCachePeriod.
+
+  * User information (e.g. email addresses) and project information
+    rarely change, so these remain fresh for hours.
+
+  * Branch and pull request lists (and files retrieved by branch name)
+    can change at any time, so these are only fresh for the
+    LocalCachePeriod, which is long enough to avoid re-fetching them
+    multiple times during a single gathering cycle.
+"""
+
+import datetime
+import re
+
+
+LocalCachePeriod = datetime.timedelta(minutes=1, seconds=35)
+
+Immutable = None   # period for responses that are always fresh
+
+_sha = '[0-9a-fA-F]{40}'
+
+DefaultFreshnessRules = [
+    # (resource class, regex for the url path and query, fresh period)
+    ('by_sha', re.compile(r'[?&]ref=' + _sha + '(&|$)'), Immutable),
+    ('by_sha', re.compile(r'/(commits|git/blobs|git/trees)/' + _sha + '($|[/?])'), Immutable),
+    ('user', re.compile(r'/users?/[^/?]+$'), datetime.timedelta(hours=24)),
+    ('project', re.compile(r'/(projects/[^/?]+|repos/[^/?]+/[^/?]+)$'), datetime.timedelta(hours=1)),
+    ('pullreqs', re.compile(r'/(pulls|merge_requests)($|\?)'), LocalCachePeriod),
+    ('branches', re.compile(r'/branches($|\?)'), LocalCachePeriod),
+]
+
+
+class FreshnessPolicy(object):
+    """Classifies request URLs by resource type to determine how long
+       a cached response remains fresh.  The first matching rule
+       applies; URLs not matching any rule use the default period.
+    """
+
+    def __init__(self, rules=None, default=LocalCachePeriod):
+        self.rules = DefaultFreshnessRules if rules is None else rules
+        self.default = default
+
+    def classify(self, req_url):
+        "Returns the (resource class, fresh period) for the URL"
+        for name, pattern, period in self.rules:
+            if pattern.search(req_url):
+                return (name, period)
+        return ('other', self.default)
+
+    def is_fresh(self, req_url, fetched_at, now=None, found=True):
+        """Returns True if the response fetched at the fetched_at time is
+           still fresh; found is False for a "not found" response.
+        """
+        period = self.classify(req_url)[1]
+        if period is Immutable:
+            if found:
+                return True
+            period = LocalCachePeriod
+        return (now or datetime.datetime.now()) - fetched_at < period
@@ -0,0 +1,131 @@
+"""Checkpoints of the repository information gathering performed by
+GatherRepoInfo.
+
+The gathering state (the pull requests, submodules, subrepos and
+branches found so far, along with the requests that are still
+outstanding) is checkpointed as it accumulates so that a gather that
+did not finish can be resumed rather than restarted:
+
+  * If the requestor times out, it sends a GatherTimeout and receives
+    the partial results, and the gather is suspended (the outstanding
+    requests are still processed when they complete).  A subsequent
+    request for the same information resumes the suspended gather.
+
+  * When the BRIAREUS_GATHER_CHECKPOINTS environment variable
+    specifies a directory, the checkpoint is also saved there
+    (at most every CheckpointInterval), so that a gather can be
+    resumed by a new GatherRepoInfo actor (e.g. for the "inprocess"
+    backend, or if the daemon was restarted).  The outstanding
+    requests are re-issued in that case.
+
+A repository whose information could not be obtained (because it was
+invalid, or the gather timed out waiting for it) does not prevent the
+other repositories' information from being returned: the information
+for the affected repositories is taken from the last complete gather
+for the same request, if there was one.  A checkpoint older than
+CheckpointMaxAge is not resumed.
+"""
+
+import datetime
+import hashlib
+import os
+from Briareus.VCS.InternalMessages import (DeclareRepo, FileReadData, GitmodulesData,
+                                           GitmodulesRepoVers, HasBranch, BranchPresent,
+                                           GetPullReqs, PullReqsData, ReadFileFromVCS,
+                                           RepoDeclared, Repo_AltLoc_ReqMsg, toJSON, fromJSON)
+
+
+CHECKPOINTS_ENV = 'BRIAREUS_GATHER_CHECKPOINTS'
+
+CheckpointInterval = datetime.timedelta(seconds=10)
+CheckpointMaxAge = datetime.timedelta(hours=1)
+
+_time_format = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def request_key(msg):
+    """Returns the key identifying a request sent to GetGitInfo, or the
+       request that a response message answers.
+    """
+    if isinstance(msg, Repo_AltLoc_ReqMsg):
+        return request_key(msg.altloc_reqmsg)
+    if isinstance(msg, (DeclareRepo, RepoDeclared)):
+        return ('declare', msg.reponame)
+    if isinstance(msg, (HasBranch, BranchPresent)):
+        return ('branch', msg.reponame, msg.branch_name)
+    if isinstance(msg, (GetPullReqs, PullReqsData)):
+        return ('pullreqs', msg.reponame)
+    if isinstance(msg, (GitmodulesData, GitmodulesRepoVers)):
+        return ('gitmodules', msg.reponame, msg.branch_name, msg.pullreq_id)
+    if isinstance(msg, FileReadData):
+        return request_key(msg.req)
+    if isinstance(msg, ReadFileFromVCS):
+        return ('file', msg.repourl, msg.file_path, msg.branch)
+    return None
+
+
+def checkpoint_file(request, kind):
+    """Returns the file for the kind ('progress' or 'complete') of
+       checkpoint of the GatherInfo request, or None if checkpoints
+       are not saved.
+    """
+    ckdir = os.getenv(CHECKPOINTS_ENV)
+    if not ckdir:
+        return None
+    return os.path.join(ckdir,
+                        hashlib.sha1(toJSON(request).encode('utf-8')).hexdigest()[:16]
+                        + '-gather-' + kind + '.json')
+
+
+def save_checkpoint(fname, state, now=None):
+    "Saves the state dictionary (of message objects) to the checkpoint file"
+    if not fname:
+        return
+    os.makedirs(os.path.dirname(fname) or '.', exist_ok=True)
+    tmpname = fname + '.new'
+    with open(tmpname, 'w') as ckf:
+        ckf.write(toJSON(dict(state,
+                              saved=(now or datetime.datetime.now()).strftime(_time_format))))
+    os.replace(tmpname, fname)
+
+
+def load_checkpoint(fname, max_age=None, now=None):
+    """Returns the state dictionary saved in the checkpoint file, or
+       None if there is no such checkpoint or it is older than
+       max_age.
+    """
+    if not fname or not os.path.exists(fname):
+        return None
+    with open(fname) as ckf:
+        state = fromJSON(ckf.read())
+    saved = datetime.datetime.strptime(state.pop('saved'), _time_format)
+    if max_age is not None and (now or datetime.datetime.now()) - saved > max_age:
+        return None
+    return state
+
+
+def remove_checkpoint(fname):
+    if fname and os.path.exists(fname):
+        os.remove(fname)
+
+
+def merge_prior(info, prior, affected):
+    """Returns the gathered info with the information for the affected
+       repos (names) replaced by the information from the prior
+       (complete) gathered info.
+    """
+    merged = {
+        'pullreqs': set([ p for p in info['pullreqs'] if p.pr_target_repo not in affected ] +
+                        [ p for p in prior['pullreqs'] if p.pr_target_repo in affected ]),
+        'branches': set([ b for b in info['branches'] if b[0] not in affected ] +
+                        [ b for b in prior['branches'] if b[0] in affected ]),
+        'submodules': set([ s for s in info['submodules'] if s.sm_repo_name not in affected ] +
+                          [ s for s in prior['submodules'] if s.sm_repo_name in affected ]),
+    }
+    # Any subrepos referenced by the prior submodules information
+    # might not have been discovered by this gather.
+    subnames = set([ s.sm_sub_name for s in merged['submodules'] ])
+    known = set([ r.repo_name for r in info['subrepos'] ])
+    merged['subrepos'] = set(info['subrepos']).union(
+        [ r for r in prior['subrepos'] if r.repo_name in subnames and r.repo_name not in known ])
+    return merged
@@ -0,0 +1,240 @@
+'''Retrieves git repository information from a local bare mirror of
+the repository instead of via the forge API.
+
+When the BRIAREUS_MIRRORS environment variable is set to a directory,
+the GitRepoInfo actors keep a bare mirror of each repository in that
+directory:
+
+  * All branch heads and pull request heads (the Github
+    refs/pull/N/head and Gitlab refs/merge-requests/N/head refs) are
+    obtained with a single "git ls-remote" for each LocalCachePeriod.
+
+  * The mirror is (incrementally) fetched only when a commit that is
+    needed is not already present, and the .gitmodules file and the
+    submodule gitlinks are then read locally.
+
+  * The forge API (if the repository is on a github or gitlab forge)
+    is used only for the pull request information (title, user, etc.),
+    which is not available from git itself.
+
+This is much cheaper than the forge API, which needs one request per
+branch list, pull request list page, .gitmodules file, and submodule
+path, and it also works for repositories that are not on a known
+forge (including local repositories), although pull requests can
+only be retrieved from a forge.
+'''
+
+import base64
+import configparser
+import datetime
+import hashlib
+import logging
+import os
+import re
+import subprocess
+from urllib.parse import urlparse
+from Briareus.VCS.InternalMessages import (GitmodulesRepoVers, PullReqsData,
+                                           SubRepoVers)
+from Briareus.VCS.Freshness import LocalCachePeriod
+from Briareus.VCS.Metrics import Metrics
+
+
+MIRRORS_ENV = 'BRIAREUS_MIRRORS'
+
+_sha_re = re.compile('[0-9a-fA-F]{40}')
+
+
+def mirrors_dir():
+    "Returns the directory for the local mirrors, or None if not enabled"
+    return os.getenv(MIRRORS_ENV) or None
+
+
+class GitMirrorInfo(object):
+    """Retrieve information from a local bare mirror of the repository,
+       using the forge_info (a GitHubInfo or GitLabInfo, or None) only
+       for pull request information.  Provides the same methods as
+       the forge information objects used by GitRepoInfo.
+    """
+
+    NotFound = 404
+
+    # The refs that are mirrored: the branches, and the heads of the
+    # Github pull requests and Gitlab merge requests.
+    mirror_refspecs = [ '+refs/heads/*:refs/heads/*',
+                        '+refs/pull/*/head:refs/pull/*/head',
+                        '+refs/merge-requests/*/head:refs/merge-requests/*/head',
+    ]
+    pullreq_refs = [ 'refs/pull/%s/head', 'refs/merge-requests/%s/head' ]
+
+    # The ls-remote results are re-used for this period (as with the
+    # forge branch and pull request lists).
+    refs_fresh_period = LocalCachePeriod
+
+    git_timeout = datetime.timedelta(minutes=10)
+
+    def __init__(self, repo_api_location, mirror_dir, forge_info=None):
+        self._url = repo_api_location.apiloc
+        self._apitoken = repo_api_location.apitoken
+        self._forge_info = forge_info
+        repo_id = hashlib.sha1(self._url.encode('utf-8')).hexdigest()[:16]
+        self._mirror = os.path.join(mirror_dir,
+                                    repo_id + '-' + os.path.basename(self._url.rstrip('/')) + '.git')
+        self._refs = None
+        self._refs_at = None
+        self._fetched_refs = None
+        self._ls_remote_count = 0
+        self._fetch_count = 0
+        self._forge = urlparse(self._url).netloc or 'local'
+        self.metrics = forge_info.metrics if forge_info else Metrics()
+
+    def stats(self):
+        return dict(list((self._forge_info.stats() if self._forge_info else {}).items()) +
+                    [ ("url", self._url),
+                      ("mirror", self._mirror),
+                      ("mirror_ls_remotes", self._ls_remote_count),
+                      ("mirror_fetches", self._fetch_count),
+                    ])
+
+    def _git_env(self):
+        """The environment for running git.  Any API token is supplied as
+           the credentials for the remote URL via an HTTP header in
+           the environment, so that it is not visible in the command
+           line (or in any errors reported by git).
+        """
+        env = dict(os.environ, GIT_TERMINAL_PROMPT='0')
+        if not self._apitoken or urlparse(self._url).scheme not in ['http', 'https']:
+            return env
+        # Github tokens are "user:token"; Gitlab tokens are used with
+        # the "oauth2" user.
+        creds = self._apitoken if ':' in self._apitoken else 'oauth2:' + self._apitoken
+        idx = int(env.get('GIT_CONFIG_COUNT', '0') or '0')
+        env['GIT_CONFIG_COUNT'] = str(idx + 1)
+        env['GIT_CONFIG_KEY_%d' % idx] = 'http.%s.extraHeader' % self._url
+        env['GIT_CONFIG_VALUE_%d' % idx] = ('Authorization: Basic ' +
+                                            base64.b64encode(creds.encode('utf-8')).decode('ascii'))
+        return env
+
+    def _git(self, *args, check=True):
+        proc = subprocess.run(['git'] + list(args),
+                              stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE,
+                              env=self._git_env(),
+                              timeout=self.git_timeout.total_seconds())
+        if check and proc.returncode != 0:
+            raise RuntimeError('git %s failed for %s: %s'
+                               % (args[0], self._url,
+                                  proc.stderr.decode('utf-8', errors='replace').strip()))
+        return proc
+
+    def refs(self):
+        """Returns the dictionary of mirrored ref names to commit sha in
+           the remote repository.
+        """
+        now = datetime.datetime.now()
+        if self._refs is None or now - self._refs_at >= self.refs_fresh_period:
+            self._ls_remote_count += 1
+            self.metrics.incr('briareus_mirror_ls_remote_total', forge=self._forge)
+            out = self._git('ls-remote', '--refs', self._url).stdout.decode('utf-8')
+            refs = {}
+            for line in out.splitlines():
+                sha, _, ref = line.partition('\t')
+                if ref.startswith('refs/heads/') or \
+                   any([ re.fullmatch(p % r'\d+', ref) for p in self.pullreq_refs ]):
+                    refs[ref] = sha
+            self._refs = refs
+            self._refs_at = now
+        return self._refs
+
+    def _has_commit(self, sha):
+        return os.path.isdir(self._mirror) and \
+            self._git('--git-dir', self._mirror, 'cat-file', '-e', sha + '^{commit}',
+                      check=False).returncode == 0
+
+    def _fetch(self):
+        "Incrementally updates the mirror to the current remote refs"
+        if not os.path.isdir(self._mirror):
+            self._git('init', '--bare', '--quiet', self._mirror)
+        self._fetch_count += 1
+        self.metrics.incr('briareus_mirror_fetch_total', forge=self._forge)
+        self._git('--git-dir', self._mirror, 'fetch', '--prune', '--quiet',
+                  self._url, *self.mirror_refspecs)
+        self._fetched_refs = self._refs
+
+    def _commit_for(self, ref, pullreq_id=None):
+        """Returns the commit sha (present in the mirror) for the ref,
+           which may be a sha or a branch name (or the pull request
+           head if pullreq_id is specified), or None if there is no
+           such commit.
+        """
+        refs = self.refs()
+        if _sha_re.fullmatch(ref or ''):
+            sha = ref
+        else:
+            sha = ([ refs[r] for r in ([ p % pullreq_id for p in self.pullreq_refs ]
+                                       if pullreq_id else []) + [ 'refs/heads/' + str(ref) ]
+                     if r in refs ] + [ None ])[0]
+            if not sha:
+                return None
+        if self._has_commit(sha):
+            return sha
+        if self._fetched_refs is not refs:
+            self._fetch()
+            if self._has_commit(sha):
+                return sha
+        return None
+
+    def _read_blob(self, commit, filepath):
+        rsp = self._git('--git-dir', self._mirror, 'cat-file', 'blob',
+                        commit + ':' + filepath, check=False)
+        return rsp.stdout.decode('utf-8') if rsp.returncode == 0 else self.NotFound
+
+    @property
+    def forge(self):
+        return self._forge_info.forge if self._forge_info else self._forge
+
+    def get_pullreqs(self, reponame):
+        if not self._forge_info:
+            return PullReqsData(reponame, [])
+        return self._forge_info.get_pullreqs(reponame)
+
+    def get_user_emails(self, users):
+        if not self._forge_info:
+            return dict([ (u, '') for u in users ])
+        return self._forge_info.get_user_emails(users)
+
+    def get_branches(self):
+        return [ { 'name': r[len('refs/heads/'):] }
+                 for r in sorted(self.refs()) if r.startswith('refs/heads/') ]
+
+    def get_file_contents_raw(self, target_filepath, branch):
+        commit = self._commit_for(branch)
+        if not commit:
+            return self.NotFound
+        return self._read_blob(commit, target_filepath)
+
+    def get_gitmodules(self, reponame, branch, pullreq_id, source_ref=None):
+        commit = self._commit_for(source_ref or branch, pullreq_id)
+        contents = self._read_blob(commit, '.gitmodules') if commit else self.NotFound
+        if contents == self.NotFound:
+            return GitmodulesRepoVers(reponame, branch, pullreq_id, [])
+        gitmod_cfg = configparser.ConfigParser()
+        gitmod_cfg.read_string(contents)
+        ret = []
+        for remote in gitmod_cfg.sections():
+            path = gitmod_cfg[remote]['path']
+            url = gitmod_cfg[remote]['url']
+            entry = self._git('--git-dir', self._mirror, 'ls-tree', commit, '--', path
+                              ).stdout.decode('utf-8').split()
+            if not entry:
+                # The submodule was added to .gitmodules, but no
+                # version was committed; use an invalid reference that
+                # will cause the build to fail (see
+                # RemoteGit__Info.parse_gitmodules_contents).
+                logging.warning('in %s branch %s, there is no submodule commit for .gitmodule'
+                                ' path %s, url %s', self._url, branch, path, url)
+                ret.append(SubRepoVers(path.split('/')[-1], url, 'unknownRemoteRefForPullReq'))
+            elif entry[1] != 'commit':
+                logging.warning('Found %s at %s, but expected a submodule', entry[1], path)
+            else:
+                ret.append(SubRepoVers(path.split('/')[-1], url, entry[2]))
+        return GitmodulesRepoVers(reponame, branch, pullreq_id, ret)
@@ -42,13 +42,21 @@ import requests
 import json
 import base64
 import configparser
-from urllib.parse import urlparse, urlunparse
+import attr
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+from concurrent.futures import ThreadPoolExecutor
 from thespian.actors import *
 from thespian.initmsgs import initializing_messages
 from Briareus.VCS.InternalMessages import *
+from Briareus.VCS.Metrics import Metrics, MetricsReporter, render_metrics
+from Briareus.VCS.RateLimit import forge_scheduler
+from Briareus.VCS.Freshness import FreshnessPolicy, LocalCachePeriod
+from Briareus.VCS.GitMirror import GitMirrorInfo, mirrors_dir
+from Briareus.VCS.RspCache import ResponseCache, cached_response
+from Briareus.VCS.PullReqSync import FullSyncPeriod, PullReqSnapshot, snapshot_file
+from Briareus.VCS.ForgeArchive import forge_session
 import datetime
-
-LocalCachePeriod = datetime.timedelta(minutes=1, seconds=35)
+import time
 
 
 def transient_idle(exit_delay=datetime.timedelta(seconds=20)):
@@ -57,7 +65,7 @@ def transient_idle(exit_delay=datetime.timedelta(seconds=20)):
             if not getattr(self, '_TIES', None):
                 self.wakeupAfter(exit_delay)
                 self._TIES = datetime.datetime.now() + exit_delay
-            if isinstance(msg, WakeupMessage):
+            if isinstance(msg, WakeupMessage) and msg.payload is None:
                 if datetime.datetime.now() >= self._TIES:
                     self.send(self.myAddress, ActorExitRequest())
                 else:
@@ -73,11 +81,28 @@ def transient_idle(exit_delay=datetime.timedelta(seconds=20)):
 
 @initializing_messages([('repospec', RepoRemoteSpec)], init_passthru=True)
 @transient_idle(datetime.timedelta(hours=12))
-class GitRepoInfo(ActorTypeDispatcher):
+class GitRepoInfo(ActorTypeDispatcher, MetricsReporter):
     def __init__(self, *args, **kw):
         super(GitRepoInfo, self).__init__(*args, **kw)
         self._ghinfo = None
         self.repospec = RepoRemoteSpec(RepoAPI_Location("no-url", None))
+        self._no_metrics = Metrics()
+
+    @property
+    def metrics(self):
+        return self._ghinfo.metrics if self._ghinfo else self._no_metrics
+
+    def metrics_source(self):
+        return 'GitRepoInfo:' + str(self.repospec.repo_api_loc.apiloc)
+
+    def receiveMessage(self, msg, sender):
+        r = super(GitRepoInfo, self).receiveMessage(msg, sender)
+        if not isinstance(msg, ActorSystemMessage):
+            self.metrics_updated()
+        return r
+
+    def receiveMsg_WakeupMessage(self, msg, sender):
+        self.metrics_wakeup(msg)
 
     def receiveMsg_RepoRemoteSpec(self, msg, sender):
         self._ghinfo = (GitHubInfo(msg.repo_api_loc)
@@ -85,6 +110,10 @@ class GitRepoInfo(ActorTypeDispatcher):
                         (GitLabInfo(msg.repo_api_loc)
                          if 'gitlab' in self.repospec.repo_api_loc.apiloc else
                          None))
+        if mirrors_dir():
+            # Use a local mirror for everything but the pull requests
+            # (which are only available from the forge, if any).
+            self._ghinfo = GitMirrorInfo(msg.repo_api_loc, mirrors_dir(), self._ghinfo)
         if not self._ghinfo:
             raise ValueError('Cannot determine type of remote repo at %s'
                              % self.repospec.repo_api_loc.apiloc)
@@ -97,39 +126,54 @@ class GitRepoInfo(ActorTypeDispatcher):
             self.send(msg.orig_sender,
                       InvalidRepo(msg.reponame, 'git', self.repospec.repo_api_loc.apiloc,
                                   getattr(self._ghinfo, '_url', str(self._ghinfo)),
-                                  'GetPullReqs - ' + str(err)))
+                                  'GetPullReqs - ' + str(err), request=msg,
+                                  gather_id=msg.gather_id))
         else:
-            self.send(msg.orig_sender, rsp)
+            # n.b. the response may be cached, so it is not modified
+            rsp = attr.evolve(rsp, gather_id=msg.gather_id)
+            if any([ p.pullreq_email is None for p in rsp.pullreqs ]):
+                # The author emails are resolved by GetGitInfo, which
+                # caches them for all repos (see Identity.py)
+                self.send(sender, ResolveEmails(self._ghinfo.forge, rsp, msg.orig_sender))
+            else:
+                self.send(msg.orig_sender, rsp)
+
+    def receiveMsg_GetUserEmails(self, msg, sender):
+        self.send(sender, UserEmails(self._ghinfo.forge,
+                                     self._ghinfo.get_user_emails(msg.users)))
 
     def receiveMsg_HasBranch(self, msg, sender):
         branch = msg.branch_name
         try:
-            rsp = self._ghinfo.get_branches()
+            blist = [ b['name'] for b in self._ghinfo.get_branches() ]
         except Exception as err:
             logging.critical('HasBranch: %s', err, exc_info=True)
             self.send(msg.orig_sender,
                       InvalidRepo(msg.reponame, 'git', self.repospec.repo_api_loc.apiloc,
                                   getattr(self._ghinfo, '_url', str(self._ghinfo)),
-                                  'HasBranch - ' + str(err)))
+                                  'HasBranch - ' + str(err), request=msg,
+                                  gather_id=msg.gather_id))
         else:
-            blist = [ b['name'] for b in rsp ]
             chk = branch in blist
             self.send(msg.orig_sender, BranchPresent(msg.reponame, branch, chk,
-                                                     known_branches=blist))
+                                                     known_branches=blist,
+                                                     gather_id=msg.gather_id))
 
 
     def receiveMsg_GitmodulesData(self, msg, sender):
         branch = msg.branch_name
         try:
-            rval = self._ghinfo.get_gitmodules(msg.reponame, branch, msg.pullreq_id)
+            rval = self._ghinfo.get_gitmodules(msg.reponame, branch, msg.pullreq_id,
+                                               msg.source_ref)
         except Exception as err:
             logging.critical('GitmodulesData err: %s', err, exc_info=True)
             self.send(msg.orig_sender,
                       InvalidRepo(msg.reponame, 'git', self.repospec.repo_api_loc.apiloc,
                                   getattr(self._ghinfo, '_url', str(self._ghinfo)),
-                                  'GitmodulesData - ' + str(err)))
+                                  'GitmodulesData - ' + str(err), request=msg,
+                                  gather_id=msg.gather_id))
         else:
-            self.send(msg.orig_sender, rval)
+            self.send(msg.orig_sender, attr.evolve(rval, gather_id=msg.gather_id))
 
 
     def receiveMsg_ReadFileFromVCS(self, msg, sender):
@@ -153,30 +197,67 @@ class GitRepoInfo(ActorTypeDispatcher):
             self.send(sender, self._ghinfo.stats() if self._ghinfo else
                       { "url": str(self.repospec.repo_api_loc.apiloc) + " (never accessed)",
                       })
+        elif msg == "metrics":
+            self.send(sender, render_metrics(self.metrics))
 
 
 class RemoteGit__Info(object):
     """Common functionality for remote Git retrieval (Github or Gitlab)."""
-    def __init__(self, api_url):
+    def __init__(self, api_url, apitoken=None):
         self._url = api_url
-        self._request_session = requests.Session()
-        self._rsp_cache = {}
-        self._rsp_fetched = {}
+        self._request_session = forge_session(api_url)
+        self._rsp_cache = ResponseCache()
         self._get_count = 0
         self._req_count = 0
         self._refresh_count = 0
+        self._forge = urlparse(api_url).netloc
+        self._scheduler = forge_scheduler(self._forge, apitoken)
+        self._freshness = FreshnessPolicy()
+        self._pullreqs = None
+        self.metrics = Metrics()
 
     NotFound = 404
 
+    @property
+    def forge(self):
+        "The forge host (for the identification of users)"
+        return self._forge
+
+    # Number of times a request is retried after a rate limit response
+    # (the scheduler determines how long to wait before each retry).
+    rate_limit_retries = 3
+
     def stats(self):
         return { "url": self._url,
-                 "rsp_cache_keys": list(self._rsp_cache.keys()),
+                 "rsp_cache_entries": len(self._rsp_cache),
+                 "rsp_cache_bytes": self._rsp_cache.nbytes,
+                 "rsp_cache_evictions": self._rsp_cache.evictions,
                  "get_info_reqs": self._get_count,
                  "remote_reqs": self._req_count,
                  "remote_refreshes": self._refresh_count
-                 # n.b. get_info_reqs - remote_reqs - len(rsp_cache_keys) = error or 404 responses
+                 # n.b. get_info_reqs - remote_reqs - rsp_cache_entries = error or 404 responses
         }
 
+    # Response headers reporting the remaining request allowance
+    # (Github uses the X- prefixed form, Gitlab uses both).
+    ratelimit_headers = [ 'X-RateLimit-Remaining', 'RateLimit-Remaining' ]
+
+    def _record_response_metrics(self, rsp, elapsed):
+        self.metrics.observe('briareus_forge_request_seconds', elapsed, forge=self._forge)
+        if rsp.status_code == 304:
+            self.metrics.incr('briareus_forge_not_modified_total', forge=self._forge)
+        elif rsp.status_code >= 400:
+            self.metrics.incr('briareus_forge_errors_total', forge=self._forge,
+                              status=str(rsp.status_code))
+        for hdr in self.ratelimit_headers:
+            if hdr in rsp.headers:
+                try:
+                    self.metrics.set('briareus_forge_ratelimit_remaining',
+                                     int(rsp.headers[hdr]), forge=self._forge)
+                except ValueError:
+                    pass
+                break
+
     trailer = '.git'
     trailer_len = len(trailer)
 
@@ -187,22 +268,88 @@ class RemoteGit__Info(object):
         return urlunparse(
             parsed._replace(path = '/'.join(parsed.path.split('/')[:3]) ))
 
-    def api_req(self, reqtype, notFoundOK=False, raw=False):
+    # Number of items requested per page for paged (list) requests,
+    # and the maximum number of pages fetched concurrently when the
+    # number of pages is known.
+    page_size = 100
+    page_fetch_concurrency = 4
+
+    def _api_url(self, reqtype):
         self._get_count += 1
+        self.metrics.incr('briareus_forge_requests_total', forge=self._forge)
         if reqtype.startswith('//'):
             # Drop the owner/repo at the tail of the url
             parsed = urlparse(self._url)
-            req_url = urlunparse(parsed._replace(path='/'.join(parsed.path.split('/')[:-2] + [reqtype])))
+            return urlunparse(parsed._replace(path='/'.join(parsed.path.split('/')[:-2] + [reqtype])))
+        return self._url + reqtype
+
+    def api_req(self, reqtype, notFoundOK=False, raw=False):
+        return self._get_cached_links_pageable_url(self._api_url(reqtype),
+                                                   notFoundOK=notFoundOK, raw=raw)
+
+    def api_req_iter(self, reqtype, sequential=False):
+        """Generates each of the records returned by a request for a
+           list of records, requesting page_size records per page.
+           Records are generated as each page is received.  If
+           sequential, each page is only requested when the records
+           of the previous page have all been consumed.
+        """
+        req_url = self._api_url(reqtype)
+        req_url += ('&' if '?' in req_url else '?') + 'per_page=%d' % self.page_size
+        for page in self._iter_pages(req_url, notFoundOK=False, raw=False,
+                                     concurrent=not sequential):
+            for record in page:
+                yield record
+
+    # Pull request records are synchronized incrementally (see
+    # PullReqSync.py); the subclass specifies the requests for all
+    # open pull requests and for all pull requests in order of the
+    # most recent update, along with the pullreq_key and
+    # pullreq_is_open functions for a pull request record.
+    full_sync_period = FullSyncPeriod
+
+    def open_pullreqs(self):
+        """Returns the records of the open pull requests, most recently
+           updated first.
+        """
+        if self._pullreqs is None:
+            self._pullreqs = PullReqSnapshot(snapshot_file(self._url))
+        now = datetime.datetime.now()
+        if self._pullreqs.needs_full_sync(now, self.full_sync_period):
+            self._pullreqs.replace([ pr for pr in self.api_req_iter(self.open_pullreqs_req)
+                                     if self.pullreq_is_open(pr) ],
+                                   self.pullreq_key, now)
         else:
-            req_url = self._url + reqtype
-        return self._get_cached_links_pageable_url(req_url, notFoundOK=notFoundOK, raw=raw)
+            self._pullreqs.update(self.api_req_iter(self.updated_pullreqs_req, sequential=True),
+                                  self.pullreq_key, self.pullreq_is_open)
+        return self._pullreqs.records()
 
     def _get_cached_links_pageable_url(self, req_url, notFoundOK, raw):
-        rsp = self._get_cached_url(req_url, notFoundOK=notFoundOK, raw=raw)
-        if rsp == self.NotFound:
-            return rsp
-        if 'Link' not in rsp.headers or not rsp.links.get('next', None):
-            return rsp.text if raw else rsp.json()
+        pages = self._iter_pages(req_url, notFoundOK=notFoundOK, raw=raw)
+        result = next(pages)
+        if result == self.NotFound:
+            return result
+        if raw:
+            return ''.join([result] + list(pages))
+        # n.b. the pages are the cached data, so join them into a copy
+        if isinstance(result, (list, dict)):
+            result = type(result)(result)
+        for page in pages:
+            if isinstance(result, list):
+                result.extend(page)
+            elif isinstance(result, dict):
+                result.update(page)  # later pages supercede earlier ones
+            else:
+                logging.error('Unable to join page type %s to this response type %s',
+                              type(page), type(result))
+        return result
+
+    def _iter_pages(self, req_url, notFoundOK, raw, concurrent=True):
+        """Generates the response data for each page of the response to
+           the req_url, following the Link header to subsequent
+           pages.  Generates just NotFound if the first page was not
+           found.
+        """
         # $ curl -v https://api.github.com/repos/matterhorn-chat/matterhorn/branches
         # ...
         # Link: <https://api.github.com/repositories/66096261/branches?page=2>; rel="next", \
@@ -214,54 +361,123 @@ class RemoteGit__Info(object):
         # Used by both github and gitlab APIs.  Supported easily by
         # requests
         # https://2.python-requests.org/en/master/user/advanced/#link-headers
-        nextrsp = self._get_cached_links_pageable_url(rsp.links['next']['url'],
-                                                      notFoundOK=notFoundOK, raw=raw)
-        if raw:
-            return rsp.text + nextrsp
-        if isinstance(nextrsp, dict):
-            nextrsp.update(rsp.json())
-            return nextrsp
-        elif isinstance(nextrsp, list):
-            return rsp.json() + nextrsp
-        else:
-            logging.error('Unable to join nextrsp type %s to this response type %s',
-                          type(nextrsp), type(rsp.json()))
+        rsp = self._get_cached_url(req_url, notFoundOK=notFoundOK, raw=raw)
+        if rsp == self.NotFound:
+            yield rsp
+            return
+        page_urls = self._page_range(rsp) if concurrent else None
+        if page_urls:
+            # All page URLs are known (from the "last" link), so fetch
+            # them concurrently, generating the pages in order.
+            yield rsp.data
+            fetch = lambda url: self._get_cached_url(url, notFoundOK=False, raw=raw)
+            with ThreadPoolExecutor(max_workers=min(len(page_urls),
+                                                    self.page_fetch_concurrency)) as pool:
+                for pagersp in pool.map(fetch, page_urls):
+                    yield pagersp.data
+            return
+        while True:
+            yield rsp.data
+            if not rsp.links.get('next', None):
+                return
+            rsp = self._get_cached_url(rsp.links['next']['url'], notFoundOK=False, raw=raw)
+
+    @staticmethod
+    def _page_range(rsp):
+        """Returns the URLs of the second through last pages if these can
+           be determined from the Link header of the first page's
+           (CachedResponse) response, otherwise None (e.g. for keyset
+           pagination, where only the next page is known).
+        """
+        nextlink = rsp.links.get('next', None)
+        lastlink = rsp.links.get('last', None)
+        if not nextlink or not lastlink:
+            return None
+        parsed = urlparse(lastlink['url'])
+        query = parse_qsl(parsed.query, keep_blank_values=True)
+        qdict = dict(query)
+        if dict(parse_qsl(urlparse(nextlink['url']).query)).get('page', None) != '2':
+            return None
+        try:
+            last = int(qdict.get('page', ''))
+        except ValueError:
+            return None
+        return [ urlunparse(parsed._replace(
+                     query=urlencode([ (k, str(pnum) if k == 'page' else v) for k, v in query ])))
+                 for pnum in range(2, last + 1) ]
 
     def _get_cached_url(self, req_url, notFoundOK, raw):
-        last_one = self._rsp_cache.get(req_url, None)
+        """Returns the CachedResponse for the req_url (or NotFound if
+           notFoundOK), using the previous response if it is still
+           fresh.
+        """
+        last_one, last = self._rsp_cache.get(req_url)
         if last_one:
-            # If fetched within the local cache period, just re-use
-            # the same response
-            last = self._rsp_fetched.get(req_url, None)
-            if last:
-                if datetime.datetime.now() - last < LocalCachePeriod:
-                    return self._rsp_cache[req_url]
+            # If still fresh (as determined by the type of resource),
+            # just re-use the same response
+            if self._freshness.is_fresh(req_url, last, found=last_one != self.NotFound):
+                self.metrics.incr('briareus_forge_cache_hits_total', forge=self._forge,
+                                  resource=self._freshness.classify(req_url)[0])
+                return last_one
         # If already fetched, pass the header tags to the server in
         # the request so that the server can respond with either a 304
         # "Not Modified" or the new data (the 304 does not count
         # against the server's rate limit).
-        hdrs = {}
-        if last_one and last_one != self.NotFound:
-            if 'ETag' in last_one.headers:
-                hdrs = { "If-None-Match": last_one.headers['ETag'] }
-            elif last_one and 'Last-Modified' in last_one.headers:
-                hdrs = { "If-Modified-Since": last_one.headers['Last-Modified'] }
-        self._req_count += 1
-        rsp = self._request_session.get(req_url, headers = hdrs)
+        stale = last_one if last_one and last_one != self.NotFound else None
+        hdrs = stale.validators() if stale else {}
+        for attempt in range(self.rate_limit_retries + 1):
+            # Conditional requests are preferred by the scheduler when
+            # the rate limit is nearly exhausted; if the scheduler
+            # would need to wait too long, use the previous response.
+            if not self._scheduler.wait_for_turn(conditional=bool(hdrs), stale_ok=bool(stale)):
+                self.metrics.incr('briareus_forge_stale_served_total', forge=self._forge)
+                return stale
+            self._req_count += 1
+            self.metrics.incr('briareus_forge_remote_requests_total', forge=self._forge)
+            start = time.monotonic()
+            rsp = self._request_session.get(req_url, headers = hdrs)
+            self._record_response_metrics(rsp, time.monotonic() - start)
+            retry = self._scheduler.update(rsp)
+            if retry is None:
+                break
+            self.metrics.incr('briareus_forge_ratelimited_total', forge=self._forge)
+            logging.warning('Rate limited by %s for %s (retry in %.0fs)',
+                            self._forge, req_url, retry)
+        if retry is not None and stale:
+            self.metrics.incr('briareus_forge_stale_served_total', forge=self._forge)
+            return stale
         if rsp.status_code == 304:  # Not Modified
             self._refresh_count += 1
-            rsp = self._rsp_cache[req_url]
-            self._rsp_fetched[req_url] = datetime.datetime.now()
-        elif rsp.status_code == 200:
-            self._rsp_cache[req_url] = rsp
-            self._rsp_fetched[req_url] = datetime.datetime.now()
-        elif rsp.status_code == 404 and notFoundOK:
-            self._rsp_cache[req_url] = self.NotFound
-            self._rsp_fetched[req_url] = datetime.datetime.now()
+            self._rsp_cache.put(req_url, stale, datetime.datetime.now())
+            return stale
+        if rsp.status_code == 200:
+            cached = cached_response(req_url, rsp, raw)
+            self._rsp_cache.put(req_url, cached, datetime.datetime.now())
+            self.metrics.set('briareus_forge_cache_bytes', self._rsp_cache.nbytes,
+                             forge=self._forge)
+            return cached
+        if rsp.status_code == 404 and notFoundOK:
+            self._rsp_cache.put(req_url, self.NotFound, datetime.datetime.now())
             return self.NotFound
-        else:
-            rsp.raise_for_status()
-        return rsp
+        rsp.raise_for_status()
+
+    def get_user_emails(self, users):
+        """Returns a dictionary of the email for each of the users, which
+           are retrieved concurrently.  The email is blank if it could
+           not be retrieved.
+        """
+        def get_email(user):
+            try:
+                return self.get_user_email(user)
+            except Exception as err:
+                logging.warning('Unable to get email for user %s from %s: %s',
+                                user, self._forge, err)
+                return ''
+        if not users:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(len(users),
+                                                self.page_fetch_concurrency)) as pool:
+            return dict(zip(users, pool.map(get_email, users)))
 
     def get_file_contents_raw(self, target_filepath, branch):
         rsp = self._get_file_contents_info(target_filepath, branch)
@@ -273,19 +489,25 @@ class RemoteGit__Info(object):
             return base64.b64decode(rsp['content']).decode('utf-8')
         return rsp
 
-    def get_gitmodules(self, reponame, branch, pullreq_id):
-        rsp = self.get_file_contents_raw('.gitmodules', branch)
+    def get_gitmodules(self, reponame, branch, pullreq_id, source_ref=None):
+        # Read the files via the source_ref (usually a commit sha) if
+        # known: that content is immutable and can therefore be
+        # cached indefinitely.
+        rsp = self.get_file_contents_raw('.gitmodules', source_ref or branch)
         if rsp == self.NotFound:
             return GitmodulesRepoVers(reponame, branch, pullreq_id, [])
-        return self.parse_gitmodules_contents(reponame, branch, pullreq_id, rsp)
+        return self.parse_gitmodules_contents(reponame, branch, pullreq_id, rsp,
+                                              source_ref=source_ref)
 
-    def parse_gitmodules_contents(self, reponame, branch, pullreq_id, gitmodules_contents):
+    def parse_gitmodules_contents(self, reponame, branch, pullreq_id, gitmodules_contents,
+                                  source_ref=None):
         gitmod_cfg = configparser.ConfigParser()
         gitmod_cfg.read_string(gitmodules_contents)
         ret = []
         for remote in gitmod_cfg.sections():
             # Note: if the URL of a repo moves, need a new name for the moved location?  Or choose not to track these changes?
-            submod_info = self._get_file_contents_info(gitmod_cfg[remote]['path'], branch)
+            submod_info = self._get_file_contents_info(gitmod_cfg[remote]['path'],
+                                                       source_ref or branch)
             if submod_info == self.NotFound:
                 # Is the repo in .gitmodules valid?
                 valid_repo = self.api_req('', notFoundOK=True)
@@ -339,7 +561,8 @@ class GitLabInfo(RemoteGit__Info):
        several projects may share the same repo.
     """
     def __init__(self, repo_api_location):
-        super(GitLabInfo, self).__init__(self.get_api_url(repo_api_location.apiloc))
+        super(GitLabInfo, self).__init__(self.get_api_url(repo_api_location.apiloc),
+                                         repo_api_location.apitoken)
         if repo_api_location.apitoken:
             self._request_session.headers.update({'Private-Token': repo_api_location.apitoken})
 
@@ -361,8 +584,19 @@ class GitLabInfo(RemoteGit__Info):
         rsp = self.api_req(mergereq.get('source_project_id', "no_spid"))
         return ("DifferentProject", rsp.name)
 
+    open_pullreqs_req = '/merge_requests?state=opened&order_by=updated_at&sort=desc'
+    updated_pullreqs_req = '/merge_requests?state=all&order_by=updated_at&sort=desc'
+
+    @staticmethod
+    def pullreq_key(mergereq):
+        return str(mergereq["iid"])
+
+    @staticmethod
+    def pullreq_is_open(mergereq):
+        return mergereq["state"] == "opened" and not mergereq["merged_at"]
+
     def get_pullreqs(self, reponame):
-        rsp = self.api_req('/merge_requests')
+        rsp = self.open_pullreqs()
         # Gather {"upvotes": 0, "downvotes": 0, "approvals_before_merge": 0} for analysis phase
         # Use {"work_in_progress": true} to ignore the PR
         # Use {"merge_status": "can_be_merged"} for analysis phase?
@@ -376,9 +610,10 @@ class GitLabInfo(RemoteGit__Info):
                               pullreq_branch=pr["source_branch"],          # source repo branch
                               pullreq_ref=pr["sha"],
                               pullreq_user=pr['author']['username'],
-                              pullreq_email=self.get_user_email(pr['author']['id']),
-                              pullreq_mergeref=None)
-                  for pr in rsp if pr["state"] == "opened" and not pr["merged_at"] ]
+                              pullreq_email=None,  # resolved from pullreq_user_ref
+                              pullreq_mergeref=None,
+                              pullreq_user_ref=pr['author']['id'])
+                  for pr in rsp ]
         return PullReqsData(reponame, preqs)
 
     def get_user_email(self, userid):
@@ -388,7 +623,7 @@ class GitLabInfo(RemoteGit__Info):
         return userinfo['public_email']
 
     def get_branches(self):
-        return self.api_req('/repository/branches')
+        return self.api_req_iter('/repository/branches')
 
     def _get_file_contents_info(self, target_filepath, branch):
         return self.api_req('/repository/files/' + target_filepath.replace('/', '%2F') + '?ref=' + branch)
@@ -421,7 +656,8 @@ class GitHubInfo(RemoteGit__Info):
        several projects may share the same repo.
     """
     def __init__(self, repo_api_location):
-        super(GitHubInfo, self).__init__(self.get_api_url(repo_api_location.apiloc))
+        super(GitHubInfo, self).__init__(self.get_api_url(repo_api_location.apiloc),
+                                         repo_api_location.apitoken)
         if repo_api_location.apitoken:
             self._request_session.auth = requests.auth.HTTPBasicAuth(
                 *tuple(repo_api_location.apitoken.split(':')))
@@ -438,9 +674,19 @@ class GitHubInfo(RemoteGit__Info):
                                 path = 'repos' + parsed.path))
         raise RuntimeError("No API URL parsing for: %s [ %s ]" % (url, str(parsed)))
 
+    open_pullreqs_req = '/pulls?state=open&sort=updated&direction=desc'
+    updated_pullreqs_req = '/pulls?state=all&sort=updated&direction=desc'
+
+    @staticmethod
+    def pullreq_key(pullreq):
+        return str(pullreq["number"])
+
+    @staticmethod
+    def pullreq_is_open(pullreq):
+        return pullreq["state"] == "open" and not pullreq["merged_at"]
+
     def get_pullreqs(self, reponame):
-        rsp = self.api_req('/pulls')
-        # May want to filter on ["state"] == "open"
+        rsp = self.open_pullreqs()
         # May want to echo either ["number"] or ["title"]
         # ["base"]["ref"] is the fork point the pull req is related to (e.g. matterhorn "develop")  # constrains merge command, but not build config...
         # ["head"]["repo"]["url"] is the github repo url for the source repo of the PR
@@ -451,9 +697,10 @@ class GitHubInfo(RemoteGit__Info):
                               pullreq_branch=pr["head"]["ref"],          # source repo branch
                               pullreq_ref=pr["head"]["sha"],         # for github, can also use branch ^
                               pullreq_user=pr["user"]["login"],
-                              pullreq_email=self.get_user_email(pr["user"]["login"]),
-                              pullreq_mergeref=pr["merge_commit_sha"])
-                  for pr in rsp if pr["state"] == "open" and not pr["merged_at"] ]
+                              pullreq_email=None,  # resolved from pullreq_user_ref
+                              pullreq_mergeref=pr["merge_commit_sha"],
+                              pullreq_user_ref=pr["user"]["login"])
+                  for pr in rsp ]
         return PullReqsData(reponame, preqs)
 
     def get_user_email(self, username):
@@ -463,7 +710,7 @@ class GitHubInfo(RemoteGit__Info):
         return userinfo['email'] or ''
 
     def get_branches(self):
-        return self.api_req('/branches')
+        return self.api_req_iter('/branches')
 
     def _get_file_contents_info(self, target_filepath, branch):
         return self.api_req('/contents/' + target_filepath + '?ref=' + branch, notFoundOK=True)
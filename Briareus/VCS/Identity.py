@@ -0,0 +1,40 @@
+"""Cache of the email addresses of the forge users (the pull request
+authors), shared by all of the repositories on each forge.
+
+The GetGitInfo actor owns the IdentityCache.  The pull request
+information from each GitRepoInfo actor is sent to GetGitInfo
+(ResolveEmails) with the emails not yet resolved; any emails that are
+not cached are requested in a single GetUserEmails batch from that
+GitRepoInfo (which has the forge access), and users whose emails are
+already being requested are not requested again.  The pull request
+information is then forwarded to the original requestor when all of
+its emails are known.
+"""
+
+import datetime
+
+
+# User email addresses rarely change, so they are cached for this
+# period.
+IdentityCachePeriod = datetime.timedelta(hours=24)
+
+
+class IdentityCache(object):
+    "Email addresses indexed by (forge host, user reference)"
+
+    def __init__(self, period=IdentityCachePeriod):
+        self.period = period
+        self._emails = {}  # (forge, user) --> (email, fetched)
+
+    def __len__(self):
+        return len(self._emails)
+
+    def get(self, forge, user, now=None):
+        "Returns the cached email for the user, or None if not known"
+        entry = self._emails.get((forge, user), None)
+        if entry is None or (now or datetime.datetime.now()) - entry[1] >= self.period:
+            return None
+        return entry[0]
+
+    def put(self, forge, user, email, now=None):
+        self._emails[(forge, user)] = (email, now or datetime.datetime.now())
@@ -4,31 +4,85 @@ import attr
 import json
 from Briareus.Input.Description import *
 
+# The messages are encoded as JSON (or optionally msgpack) for
+# exchange with the GatherRepoInfo daemon.  Each message object is
+# encoded as a dictionary of its fields plus a "__type__" field with
+# the class name; sets (and the tuples within them) are encoded as a
+# dictionary with "__type__" and "__value__" fields.  The message
+# classes are found (once) from this module's namespace, which
+# includes the Input.Description classes, and each class's field
+# names are recorded for encoding.
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+_codec_types = {}   # class name --> (class, tuple of field names)
+_codec_fields = {}  # class --> (class name, tuple of field names)
+
+def _codec_registry():
+    if not _codec_types:
+        for name, cls in list(globals().items()):
+            if isinstance(cls, type) and attr.has(cls):
+                fields = tuple([ f.name for f in attr.fields(cls) ])
+                _codec_types[name] = (cls, fields)
+                _codec_fields[cls] = (name, fields)
+    return _codec_fields
+
+_codec_scalars = (str, int, float, bool, type(None))
+_codec_containers = { 'set': set, 'tuple': tuple }
+
+def _to_wire(obj):
+    if isinstance(obj, _codec_scalars):
+        return obj
+    objtype = type(obj)
+    if objtype is list or objtype is tuple:
+        return [ _to_wire(e) for e in obj ]
+    if objtype is dict:
+        return dict([ (k, _to_wire(v)) for k, v in obj.items() ])
+    if objtype is set:
+        return { '__type__': 'set',
+                 '__value__': [ _to_wire_element(e) for e in obj ] }
+    name, fields = _codec_registry().get(objtype, (None, None))
+    if name is None:
+        raise TypeError('Cannot encode message type %s' % objtype.__name__)
+    objdict = dict([ (f, _to_wire(getattr(obj, f))) for f in fields ])
+    objdict['__type__'] = name
+    return objdict
+
+def _to_wire_element(obj):
+    # Elements of a set retain their tuple-ness (for hashability)
+    if type(obj) is tuple:
+        return { '__type__': 'tuple',
+                 '__value__': [ _to_wire_element(e) for e in obj ] }
+    return _to_wire(obj)
+
+def _from_wire(objdict):
+    objtype = objdict.get('__type__', None)
+    if objtype is None:
+        return objdict
+    if '__value__' in objdict:
+        return _codec_containers[objtype](objdict['__value__'])
+    _codec_registry()
+    if objtype not in _codec_types:
+        raise ValueError('Cannot decode message type %s' % objtype)
+    del objdict['__type__']
+    return _codec_types[objtype][0](**objdict)
+
+
 def toJSON(obj):
-    class objToJSON(json.JSONEncoder):
-        def default(self, obj):
-            if obj.__class__.__name__ in [ 'dict', 'list', 'int', 'float',
-                                           'str', 'bool', 'NoneType' ]:
-                return obj
-            if obj.__class__.__name__ in ['set', 'tuple']:
-                return { '__type__': obj.__class__.__name__,
-                         '__value__': [self.default(e) for e in obj]
-                }
-            objdict = attr.asdict(obj, recurse=False)
-            objdict['__type__'] = obj.__class__.__name__
-            return objdict
-    return json.dumps(obj, cls=objToJSON)
+    return json.dumps(_to_wire(obj))
 
 def fromJSON(jstr):
-    def objFromJSON(objdict):
-        if '__type__' in objdict:
-            objtype = objdict['__type__']
-            if '__value__' in objdict:
-                return eval(objtype)(objdict['__value__'])
-            del objdict['__type__']
-            return eval(objtype)(**objdict)
-        return objdict
-    return json.loads(jstr, object_hook=objFromJSON)
+    return json.loads(jstr, object_hook=_from_wire)
+
+def toMsgpack(obj):
+    "Compact binary encoding of the message (requires the msgpack module)"
+    return msgpack.packb(_to_wire(obj), use_bin_type=True)
+
+def fromMsgpack(data):
+    return msgpack.unpackb(data, object_hook=_from_wire, raw=False)
 
 
 @attr.s
@@ -48,9 +102,13 @@ class GatherInfo(object):             #            --> GatheredInfo
     repolocs = attr.ib(factory=list)    # array of RepoLoc
     branchlist = attr.ib(factory=list)  # array of BranchDesc
 @attr.s
-class GatheredInfo(object):           # GatherInfo -->
+class GatheredInfo(object):           # GatherInfo, GatherTimeout -->
     info = attr.ib(factory=dict)
     error = attr.ib(default=None)
+    stale_repos = attr.ib(factory=list) # repos with info from a previous gather
+@attr.s
+class GatherTimeout(object):          #            --> GatheredInfo (partial)
+    request = attr.ib()                 # the GatherInfo that was not answered in time
 
 
 @attr.s
@@ -59,6 +117,7 @@ class ReadFileFromVCS(object):        # --> FileReadData
     repolocs = attr.ib()              # array of RepoLoc
     file_path = attr.ib()
     branch = attr.ib(factory=str)     # defaults to "master"
+    gather_id = attr.ib(default=None, kw_only=True)  # see Repo__ReqMsg
 @attr.s
 class FileReadData(object):           # ReadFileFromVCS -->
     req = attr.ib()                     # The ReadFileFromVCS that originated this response
@@ -69,9 +128,14 @@ class FileReadData(object):           # ReadFileFromVCS -->
 @attr.s
 class Repo__ReqMsg(object):
     reponame = attr.ib()
+    # Identifies the GatherRepoInfo gather that sent the request; it
+    # is echoed in the response so that late responses to an earlier
+    # gather can be recognized.
+    gather_id = attr.ib(default=None, kw_only=True)
 @attr.s
 class Repo__RspMsg(object):
     reponame = attr.ib()
+    gather_id = attr.ib(default=None, kw_only=True)  # from the Repo__ReqMsg
 
 
 @attr.s
@@ -99,6 +163,7 @@ class InvalidRepo(Repo__RspMsg):        # {ANY} -->
     repo_remote = attr.ib()
     repo_api_url = attr.ib()
     errorstr = attr.ib()
+    request = attr.ib(default=None)     # the Repo__ReqMsg that failed
 
 
 class GetPullReqs(Repo__ReqMsg): pass   #             --> PullReqInfo
@@ -114,8 +179,24 @@ class PullReqInfo(object):
     pullreq_branch = attr.ib()
     pullreq_ref    = attr.ib()
     pullreq_user   = attr.ib() # string name of user on forge
-    pullreq_email  = attr.ib() # string user email (may be blank if not public)
+    pullreq_email  = attr.ib() # string user email (may be blank if not public,
+                               # or None until resolved by GetGitInfo)
     pullreq_mergeref = attr.ib(default=None) # if available
+    pullreq_user_ref = attr.ib(default=None) # forge reference to user (for the email)
+
+@attr.s
+class ResolveEmails(object):            # GitRepoInfo --> GetGitInfo --> PullReqsData
+    forge = attr.ib()                   # forge host for the pullreq_user_ref
+    pullreqs_data = attr.ib()           # PullReqsData with unresolved emails
+    orig_sender = attr.ib()             # recipient of the resolved PullReqsData
+
+@attr.s
+class GetUserEmails(object):            # GetGitInfo --> GitRepoInfo --> UserEmails
+    users = attr.ib()                   # list of pullreq_user_ref
+@attr.s
+class UserEmails(object):               # GetUserEmails -->
+    forge = attr.ib()
+    emails = attr.ib(factory=dict)      # pullreq_user_ref --> email ('' if not public)
 
 @attr.s
 class HasBranch(Repo__ReqMsg):          #           --> BranchPresent
@@ -153,7 +234,7 @@ class RepoRemoteSpec(object):
     repo_api_loc = attr.ib()               # RepoAPI_Location for forge API
 
 
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True, cache_hash=True)
 class PRInfo(object):
     pr_target_repo = attr.ib()
     pr_srcrepo_url = attr.ib()
@@ -164,7 +245,7 @@ class PRInfo(object):
     pr_email       = attr.ib()  # email of user (if known, else blank)
 
 
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True, cache_hash=True)
 class SubModuleInfo(object):
     """Describes a known submodule for a repository.  Only a project
        repository is checked for submodules.
@@ -5,23 +5,55 @@ from thespian.initmsgs import initializing_messages
 from Briareus.Input.Description import RepoDesc
 from Briareus.VCS.InternalMessages import *
 from Briareus.VCS.GitRepo import GitRepoInfo
+from Briareus.VCS.GatherCheckpoint import (CheckpointInterval, CheckpointMaxAge,
+                                           checkpoint_file, load_checkpoint, merge_prior,
+                                           remove_checkpoint, request_key, save_checkpoint)
+from Briareus.VCS.Identity import IdentityCache
+from Briareus.VCS.Metrics import Metrics, MetricsReporter
 from urllib.parse import urlparse, urlunparse
 from collections import defaultdict
 import attr
+import datetime
 import logging
 import os
 
 
-class GatherRepoInfo(ActorTypeDispatcher):
-    "Main Actor for obtaining information from VCS repositories."
+class GatherRepoInfo(ActorTypeDispatcher, MetricsReporter):
+    """Main Actor for obtaining information from VCS repositories.  The
+       state of a gather is checkpointed so that it can be resumed
+       (see GatherCheckpoint.py).
+    """
 
     def __init__(self, *args, **kw):
         super(GatherRepoInfo, self).__init__(*args, **kw)
         self._get_git_info = None
         self.top_requestor = None
         self._stats = {}
-        self.responses_pending = 0
+        self.outstanding = []    # requests sent to GetGitInfo, not yet answered
         self.pending_requests = []
+        self.request = None      # the current (or suspended) GatherInfo
+        self._request_id = None  # JSON of self.request
+        self._gather_id = 0      # tags the requests of the current gather
+        self.failed = {}         # reponame --> error for the current GatherInfo
+        self._suspended_at = None
+        self._checkpointed_at = None
+        # (JSON GatherInfo, info) of the last complete gather; only the
+        # most recent is kept in memory, the others are in the
+        # 'complete' checkpoint files.
+        self._last_complete = None
+        self.metrics = Metrics()
+
+    @property
+    def responses_pending(self):
+        return len(self.outstanding)
+
+    def _update_gauges(self):
+        self.metrics.set('briareus_gather_pending_requests', len(self.pending_requests))
+        self.metrics.set('briareus_gather_responses_pending', self.responses_pending)
+        self.metrics_updated()
+
+    def receiveMsg_WakeupMessage(self, msg, sender):
+        self.metrics_wakeup(msg)
 
     def receiveMsg_str(self, msg, sender):
         if msg == "status":
@@ -48,6 +80,8 @@ class GatherRepoInfo(ActorTypeDispatcher):
     def _dispatch(self, objmsg, sender, jsonReply=False):
         if isinstance(objmsg, GatherInfo):
             self._gatherInfo(objmsg, sender, jsonReply=jsonReply)
+        elif isinstance(objmsg, GatherTimeout):
+            self._gatherTimeout(objmsg, sender, jsonReply=jsonReply)
         elif isinstance(objmsg, ReadFileFromVCS):
             self.read_vcs_file(objmsg, sender, jsonReply=jsonReply)
         else:
@@ -63,8 +97,17 @@ class GatherRepoInfo(ActorTypeDispatcher):
             # override the GetGitInfo instance below with a mocked
             # version appropriate to that test.
             self._get_git_info = self.createActor(GetGitInfo, globalName="GetGitInfo")
-        self.responses_pending += 1
+        # Tag the request with the current gather so that responses
+        # to the requests of an earlier gather can be discarded.
+        if isinstance(reqmsg, Repo_AltLoc_ReqMsg):
+            reqmsg = attr.evolve(reqmsg,
+                                 altloc_reqmsg=attr.evolve(reqmsg.altloc_reqmsg,
+                                                           gather_id=self._gather_id))
+        else:
+            reqmsg = attr.evolve(reqmsg, gather_id=self._gather_id)
+        self.outstanding.append(reqmsg)
         self._incr_stat("get_git")
+        self._update_gauges()
         self.send(self._get_git_info, reqmsg)
 
 
@@ -74,40 +117,178 @@ class GatherRepoInfo(ActorTypeDispatcher):
             self.top_requestor = None
         if self.pending_requests:
             self._dispatch(*self.pending_requests.pop(0))
+        self._update_gauges()
 
     def is_idle(self, newmsg, msg_sender, jsonReply):
         if self.top_requestor is None:
             return True
+        if isinstance(newmsg, GatherInfo) and newmsg == self.request:
+            # The requestor of the current gather has given up on it
+            # (e.g. a new hh run after a timeout); continue the gather
+            # for the new requestor.
+            self.metrics.incr('briareus_gather_resumed_total', source='active')
+            self.top_requestor = msg_sender
+            self.prepareReply = toJSON if jsonReply else (lambda x: x)
+            return False
         self.pending_requests.append( (newmsg, msg_sender, jsonReply) )
+        self._update_gauges()
         return False
 
-    def got_response(self, got_a_response=True, response_name='unk'):
+    def _answered(self, rspmsg, key=None):
+        """Removes the outstanding request answered by the response
+           message (or with the key, if specified); returns False if
+           there is no such request, or if the response is for a
+           request from an earlier (e.g. abandoned) gather.
+        """
+        gather_id = (rspmsg.req if isinstance(rspmsg, FileReadData) else rspmsg).gather_id
+        if gather_id is None and isinstance(rspmsg, InvalidRepo) and rspmsg.request:
+            gather_id = rspmsg.request.gather_id
+        if gather_id is not None and gather_id != self._gather_id:
+            logging.info('Ignoring response from an earlier gather: %s', request_key(rspmsg))
+            return False
+        key = key or request_key(rspmsg)
+        for idx, req in enumerate(self.outstanding):
+            if key and request_key(req) == key:
+                del self.outstanding[idx]
+                return True
+        logging.warning('Ignoring response for a request that is not outstanding: %s', key)
+        return False
+
+    def _new_gather(self):
+        "Starts a new set of requests; responses to earlier requests are ignored"
+        self._gather_id += 1
+        self.outstanding = []
+
+    def got_response(self, response_name='unk'):
         self._incr_stat(response_name)
-        if got_a_response and self.responses_pending:
-            self.responses_pending -= 1
         if self.responses_pending == 0:
-            self.respond_to_requestor(
-                self.prepareReply(
-                    GatheredInfo({ "pullreqs" : self.pullreqs,
-                                   "submodules": self.submodules,
-                                   "subrepos" : self.subrepos,
-                                   "branches" : self.branches
-                    })))
+            self._suspended_at = None
+            self.respond_to_requestor(self.prepareReply(self._gather_result()))
+        else:
+            self._checkpoint()
+
+    def _gather_result(self):
+        """Returns the GatheredInfo for the current gather.  The
+           information for any repos that failed or that still have
+           outstanding requests is taken from the last complete gather
+           (if there is one).
+        """
+        info = { "pullreqs" : self.pullreqs,
+                 "submodules": self.submodules,
+                 "subrepos" : self.subrepos,
+                 "branches" : self.branches
+        }
+        timed_out = set([ request_key(r)[1] for r in self.outstanding ]) - set(self.failed)
+        if not self.failed and not timed_out:
+            self._last_complete = (self._request_id,
+                                   dict([ (k, set(v)) for k, v in info.items() ]))
+            save_checkpoint(checkpoint_file(self.request, 'complete'), info)
+            remove_checkpoint(checkpoint_file(self.request, 'progress'))
+            return GatheredInfo(info)
+        errors = [ self.failed[r] for r in sorted(self.failed) ]
+        if timed_out:
+            errors.append('Timed out waiting for the information for %s' %
+                          ', '.join(sorted(timed_out)))
+        prior = ((self._last_complete[1]
+                  if self._last_complete and self._last_complete[0] == self._request_id
+                  else None) or
+                 load_checkpoint(checkpoint_file(self.request, 'complete')))
+        if prior is None:
+            return GatheredInfo(None, '; '.join(errors))
+        affected = set(self.failed).union(timed_out)
+        logging.warning('Using the previously gathered information for %s: %s',
+                        ', '.join(sorted(affected)), '; '.join(errors))
+        self.metrics.incr('briareus_gather_stale_repos_total', len(affected))
+        return GatheredInfo(merge_prior(info, prior, affected), stale_repos=sorted(affected))
+
+    def _gather_state(self):
+        "Returns the checkpoint state of the current gather"
+        # n.b. the API tokens are not saved; they are re-determined
+        # when the state is restored.
+        return { 'pullreqs': self.pullreqs,
+                 'submodules': self.submodules,
+                 'subrepos': self.subrepos,
+                 'branches': self.branches,
+                 'known_branches': dict(self.known_branches),
+                 'branches_check': [ list(k) for k, v in self.branches_check.items() if v ],
+                 'pending_info': self._pending_info,
+                 'BL_queried': self.BL_queried,
+                 'failed': self.failed,
+                 'outstanding': [ Repo_AltLoc_ReqMsg(RepoAPI_Location(r.api_repo_loc.apiloc, None),
+                                                     r.altloc_reqmsg)
+                                  if isinstance(r, Repo_AltLoc_ReqMsg) else r
+                                  for r in self.outstanding ],
+        }
+
+    def _restore_state(self, state):
+        self.pullreqs = state['pullreqs']
+        self.submodules = state['submodules']
+        self.subrepos = state['subrepos']
+        self.branches = state['branches']
+        self.known_branches = defaultdict(set, state['known_branches'])
+        self.branches_check = dict([ (tuple(k), True) for k in state['branches_check'] ])
+        self._pending_info = state['pending_info']
+        self.BL_queried = state['BL_queried']
+        self.failed = state['failed']
+        self.outstanding = [ Repo_AltLoc_ReqMsg(to_http_url(r.api_repo_loc.apiloc, self.RX),
+                                                r.altloc_reqmsg)
+                             if isinstance(r, Repo_AltLoc_ReqMsg) else r
+                             for r in state['outstanding'] ]
+
+    def _checkpoint(self, force=False):
+        "Saves the state of the current gather, at most every CheckpointInterval"
+        fname = checkpoint_file(self.request, 'progress') if self.request else None
+        if not fname:
+            return
+        now = datetime.datetime.now()
+        if force or not self._checkpointed_at or now - self._checkpointed_at >= CheckpointInterval:
+            self._checkpointed_at = now
+            save_checkpoint(fname, self._gather_state(), now)
 
     def receiveMsg_ChildActorExited(self, msg, sender):
         if msg.childAddress == self._get_git_info:
             self._get_git_info = None
+            self._new_gather()
             self.respond_to_requestor(self.prepareReply(GatheredInfo(None, 'GitInfo actor exited')))
 
     def receiveMsg_InvalidRepo(self, msg, sender):
-        self.respond_to_requestor(
-            self.prepareReply(
-                GatheredInfo(None, 'Invalid %s repo "%s", remote %s (@ %s): %s' %
-                             (msg.repo_type,
-                              msg.reponame,
-                              msg.repo_remote,
-                              msg.repo_api_url,
-                              msg.errorstr))))
+        """The request for a repo failed: record the error and continue
+           gathering the information for the other repos.
+        """
+        key = request_key(msg.request) if msg.request else \
+              ([ request_key(r) for r in self.outstanding
+                 if request_key(r)[1] == msg.reponame ] + [ None ])[0]
+        if not self._answered(msg, key):
+            return
+        self.failed[msg.reponame] = ('Invalid %s repo "%s", remote %s (@ %s): %s' %
+                                     (msg.repo_type,
+                                      msg.reponame,
+                                      msg.repo_remote,
+                                      msg.repo_api_url,
+                                      msg.errorstr))
+        self.got_response(response_name='invalid_repo')
+
+    def receiveMsg_GatherTimeout(self, msg, sender):
+        """The requestor timed out waiting for the GatheredInfo: respond
+           with the information gathered so far and suspend the gather
+           so that it can be resumed by the next request for the same
+           information.
+        """
+        self._gatherTimeout(msg, sender)
+
+    def _gatherTimeout(self, msg, sender, jsonReply=False):
+        prepareReply = toJSON if jsonReply else (lambda x: x)
+        if msg.request != self.request:
+            self.send(sender, prepareReply(GatheredInfo(None, 'No gather in progress for the request')))
+            return
+        if self.outstanding:
+            logging.warning('Gather timed out with %d requests outstanding; suspending',
+                            len(self.outstanding))
+            self._suspended_at = datetime.datetime.now()
+            self._checkpoint(force=True)
+        self.top_requestor = sender
+        self.prepareReply = prepareReply
+        self.respond_to_requestor(self.prepareReply(self._gather_result()))
 
     def receiveMsg_ReadFileFromVCS(self, msg, sender):
         """Main entrypoint to read a specific file from a repo at the
@@ -118,14 +299,20 @@ class GatherRepoInfo(ActorTypeDispatcher):
     def read_vcs_file(self, readfile_msg, sender, jsonReply=False):
         if not self.is_idle(readfile_msg, sender, jsonReply):
             return
+        self.metrics.incr('briareus_gather_requests_total', type='ReadFileFromVCS')
         self.top_requestor = sender
+        # Any suspended gather is abandoned (it can still be resumed
+        # from a saved checkpoint).
+        self.request = None
+        self._new_gather()
         self.prepareReply = toJSON if jsonReply else (lambda x: x)
         self.get_git_info(Repo_AltLoc_ReqMsg(to_http_url(readfile_msg.repourl,
                                                          readfile_msg.repolocs),
                                              readfile_msg))
 
     def receiveMsg_FileReadData(self, msg, sender):
-        self.respond_to_requestor(self.prepareReply(msg))
+        if self._answered(msg):
+            self.respond_to_requestor(self.prepareReply(msg))
 
     def receiveMsg_GatherInfo(self, msg, sender):
         """Main entrypoint to gather information for the list of repos and
@@ -142,9 +329,16 @@ class GatherRepoInfo(ActorTypeDispatcher):
     def _gatherInfo(self, msg, sender, jsonReply=False):
         if not self.is_idle(msg, sender, jsonReply):
             return
+        self.metrics.incr('briareus_gather_requests_total', type='GatherInfo')
         self.top_requestor = sender
         self.prepareReply = toJSON if jsonReply else (lambda x: x)
-        self.responses_pending = 0
+        if self._resume_suspended(msg) or self._resume_checkpoint(msg):
+            self.got_response(response_name='resumed')
+            return
+        self.request = msg
+        self._request_id = toJSON(msg)
+        self._new_gather()
+        self.failed = {}
 
         self.pullreqs = set()
         self.submodules = set()
@@ -161,7 +355,47 @@ class GatherRepoInfo(ActorTypeDispatcher):
         for repo in self.RL:
             self.get_info_for_a_repo(repo)
         # In case there were no repos, this is the "I am done" check:
-        self.got_response(False)
+        self.got_response()
+
+    def _resume_suspended(self, msg):
+        "Resumes the suspended gather if it was for the same request"
+        if msg != self.request or not self.outstanding or self._suspended_at is None or \
+           datetime.datetime.now() - self._suspended_at > CheckpointMaxAge:
+            return False
+        logging.info('Resuming the suspended gather (%d requests outstanding)',
+                     len(self.outstanding))
+        self.metrics.incr('briareus_gather_resumed_total', source='suspended')
+        self._suspended_at = None
+        return True
+
+    def _resume_checkpoint(self, msg):
+        """Resumes the gather for the same request from the saved
+           checkpoint, if there is one.  The responses to the
+           outstanding requests were lost, so they are re-issued.
+        """
+        state = load_checkpoint(checkpoint_file(msg, 'progress'), CheckpointMaxAge)
+        if not state or not state['outstanding']:
+            return False
+        self.request = msg
+        self._request_id = toJSON(msg)
+        self.RL = msg.repolist
+        self.RX = msg.repolocs
+        self.BL = msg.branchlist
+        self._restore_state(state)
+        logging.info('Resuming the gather from the checkpoint (%d requests outstanding)',
+                     len(self.outstanding))
+        self.metrics.incr('briareus_gather_resumed_total', source='checkpoint')
+        reissue = self.outstanding
+        self._new_gather()
+        # A new GetGitInfo needs the repos to be declared before
+        # requests for them.
+        declaring = set([ request_key(r) for r in reissue if isinstance(r, DeclareRepo) ])
+        for repo in self._all_repos():
+            if ('declare', repo.repo_name) not in declaring:
+                self.get_git_info(DeclareRepo(repo.repo_name, repo.repo_url, self.RX))
+        for req in reissue:
+            self.get_git_info(req)
+        return True
 
     def get_info_for_a_repo(self, repo):
         self.get_git_info(DeclareRepo(repo.repo_name, repo.repo_url, self.RX))
@@ -171,6 +405,8 @@ class GatherRepoInfo(ActorTypeDispatcher):
 
     def receiveMsg_RepoDeclared(self, msg, sender):
         "Response message from the GetGitInfo actor to a DeclareRepo message"
+        if not self._answered(msg):
+            return
         repo = self._pending_info.get(msg.reponame, None)
         if repo:
             del self._pending_info[msg.reponame]
@@ -204,6 +440,8 @@ class GatherRepoInfo(ActorTypeDispatcher):
         # handled by the pullreqs retrievals, so just check for
         # branches.
 
+        if not self._answered(msg):
+            return
         for p in msg.pullreqs:
 
             # First, determine the source repo URL for the pullreq.
@@ -365,6 +603,8 @@ class GatherRepoInfo(ActorTypeDispatcher):
 
     def receiveMsg_BranchPresent(self, msg, sender):
         "Response message from the GetGitInfo actor to a HasBranch message"
+        if not self._answered(msg):
+            return
         if msg.branch_present:
             self.branches_check[(msg.reponame, msg.branch_name)] = False  # no longer pending
             self.branches.add( (msg.reponame, msg.branch_name) )
@@ -396,6 +636,8 @@ class GatherRepoInfo(ActorTypeDispatcher):
 
     def receiveMsg_GitmodulesRepoVers(self, msg, sender):
         "Response message from the GetGitInfo actor to a GitmodulesData message"
+        if not self._answered(msg):
+            return
         for each in msg.gitmodules_repovers:
             named_submod_repo = ([r for r in self._all_repos()
                                   if r.repo_name == each.subrepo_name] + [None])[0]
@@ -432,6 +674,9 @@ class GetGitInfo(ActorTypeDispatcher):
         super(GetGitInfo, self).__init__(*args, **kw)
         self.gitinfo_actors = {}
         self.gitinfo_actors_by_url = {}
+        self.identities = IdentityCache()
+        self._email_requests = {}  # (forge, user) --> GitRepoInfo asked for the email
+        self._email_waiters = []   # ResolveEmails waiting for _email_requests
 
     def _get_subactor(self, reponame, repourl=None, repolocs=None):
         suba = self.gitinfo_actors.get(reponame, None)
@@ -468,10 +713,55 @@ class GetGitInfo(ActorTypeDispatcher):
                       for k in self.gitinfo_actors_by_url
                       if self.gitinfo_actors_by_url[k] == msg.childAddress ]:
             del self.gitinfo_actors_by_url[each]
+        # Emails requested from the exited actor will not be provided
+        lost = [ k for k in self._email_requests
+                 if self._email_requests[k] == msg.childAddress ]
+        for (forge, user) in lost:
+            del self._email_requests[(forge, user)]
+        self._resolve_emails(dict([ (k, '') for k in lost ]))
+
+    def receiveMsg_ResolveEmails(self, msg, sender):
+        "Pull request information from a GitRepoInfo, with the emails not yet known"
+        missing = set([ p.pullreq_user_ref for p in msg.pullreqs_data.pullreqs
+                        if p.pullreq_email is None and
+                        self.identities.get(msg.forge, p.pullreq_user_ref) is None ])
+        request = [ u for u in sorted(missing, key=str)
+                    if (msg.forge, u) not in self._email_requests ]
+        if request:
+            for u in request:
+                self._email_requests[(msg.forge, u)] = sender
+            self.send(sender, GetUserEmails(request))
+        self._email_waiters.append(msg)
+        self._resolve_emails({})
+
+    def receiveMsg_UserEmails(self, msg, sender):
+        for user, email in msg.emails.items():
+            self.identities.put(msg.forge, user, email)
+            self._email_requests.pop((msg.forge, user), None)
+        self._resolve_emails({})
+
+    def _resolve_emails(self, unknown):
+        """Forwards each waiting PullReqsData whose emails are all known
+           (from the identities cache or the unknown dictionary of
+           (forge, user) --> email) to its original requestor.
+        """
+        waiting = []
+        for each in self._email_waiters:
+            email = lambda u: (unknown[(each.forge, u)] if (each.forge, u) in unknown
+                               else self.identities.get(each.forge, u))
+            if any([ p.pullreq_email is None and email(p.pullreq_user_ref) is None
+                     for p in each.pullreqs_data.pullreqs ]):
+                waiting.append(each)
+                continue
+            for p in each.pullreqs_data.pullreqs:
+                if p.pullreq_email is None:
+                    p.pullreq_email = email(p.pullreq_user_ref)
+            self.send(each.orig_sender, each.pullreqs_data)
+        self._email_waiters = waiting
 
     def receiveMsg_DeclareRepo(self, msg, sender):
         suba = self._get_subactor(msg.reponame, msg.repo_url, msg.repolocs)
-        self.send(sender, RepoDeclared(msg.reponame))
+        self.send(sender, RepoDeclared(msg.reponame, gather_id=msg.gather_id))
 
     def receiveMsg_Repo__ReqMsg(self, msg, sender):
         suba = self._get_subactor(msg.reponame)
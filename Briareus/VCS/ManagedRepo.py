@@ -2,18 +2,27 @@
 
 from thespian.actors import *
 from Briareus.VCS.InternalOps import *
+from Briareus.Backend import is_inprocess
 from datetime import timedelta
+import logging
 
 
 REPO_INFO_TIMEOUT = timedelta(seconds=600)
+PARTIAL_INFO_TIMEOUT = timedelta(seconds=30)
 
 def gather_repo_info(RL, RX, BL, actor_system=None):
     """Gets the full set of information for the listed repositories, with
-       location translations and branches of interest.
+       location translations and branches of interest.  If the
+       information for some repositories could not be obtained, the
+       information from the previous gather is used for those
+       repositories (see GatherCheckpoint.py).
     """
     rspobj = _run_actors(GatherInfo(RL, RX, BL), GatheredInfo, actor_system)
     if rspobj.error:
         raise RuntimeError('VCS request error: ' + str(rspobj.error))
+    if rspobj.stale_repos:
+        logging.warning('Using previously gathered VCS information for: %s',
+                        ', '.join(rspobj.stale_repos))
     return rspobj.info
 
 
@@ -25,15 +34,24 @@ def get_updated_file(repourl, filepath, repolocs, branch, actor_system=None):
 
 def _run_actors(request, expected_resp_type, actor_system=None):
     asys = actor_system or ActorSystem('multiprocTCPBase')  # use TCP base for ThespianWatch support.
+    # The in-process actors can exchange the objects directly;
+    # otherwise use JSON to be independent of the code version of an
+    # existing daemon.
+    direct = is_inprocess(asys)
     try:
         # Use a global name for this actor to re-connect to the existing "daemon"
-        rsp = asys.ask(asys.createActor('Briareus.VCS.InternalOps.GatherRepoInfo',
-                                        globalName='GatherRepoInfo'),
-                       toJSON(request),
-                       REPO_INFO_TIMEOUT)
+        gatherer = asys.createActor('Briareus.VCS.InternalOps.GatherRepoInfo',
+                                    globalName='GatherRepoInfo')
+        rsp = asys.ask(gatherer, request if direct else toJSON(request), REPO_INFO_TIMEOUT)
+        if rsp == None and isinstance(request, GatherInfo):
+            # Get the partial information; the gather continues and
+            # will be resumed by the next request.
+            timeout = GatherTimeout(request)
+            rsp = asys.ask(gatherer, timeout if direct else toJSON(timeout),
+                           PARTIAL_INFO_TIMEOUT)
         if rsp == None:
             raise RuntimeError('Timeout waiting for GatherInfo response')
-        rspobj = fromJSON(rsp)
+        rspobj = rsp if direct else fromJSON(rsp)
         if isinstance(rspobj, expected_resp_type):
             return rspobj
         raise RuntimeError('Unexpected response to VCS request: %s' % str(rsp))
@@ -0,0 +1,313 @@
+"""Prometheus-style metrics for the long-lived VCS actors.
+
+Each actor that gathers information (GatherRepoInfo, GitRepoInfo)
+keeps its own Metrics collection.  When the BRIAREUS_METRICS
+environment variable is set, those actors periodically send a
+snapshot of their Metrics to the MetricsServer actor, which combines
+the snapshots and serves them in the Prometheus text exposition format
+on the location specified by BRIAREUS_METRICS:
+
+    BRIAREUS_METRICS=9187                   # http://localhost:9187/metrics
+    BRIAREUS_METRICS=0.0.0.0:9187           # listen on all interfaces
+    BRIAREUS_METRICS=unix:/run/briareus.sock # HTTP over a Unix socket
+
+The combined metrics text can also be retrieved by asking the
+MetricsServer actor (globalName "BriareusMetrics") with a "metrics"
+string message.
+"""
+
+import attr
+import datetime
+import http.server
+import logging
+import os
+import socketserver
+import threading
+import time
+from thespian.actors import *
+
+
+METRICS_ENV = 'BRIAREUS_METRICS'
+METRICS_REPORT_PERIOD = datetime.timedelta(seconds=5)
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Type and help text for each metric; metrics not listed here are
+# still rendered, but without HELP/TYPE annotations.
+METRIC_INFO = {
+    'briareus_forge_requests_total':
+    ('counter', 'Requests for forge information (including locally cached responses).'),
+    'briareus_forge_remote_requests_total':
+    ('counter', 'HTTP requests sent to the forge.'),
+    'briareus_forge_not_modified_total':
+    ('counter', 'Conditional forge requests answered with 304 Not Modified.'),
+    'briareus_forge_cache_hits_total':
+    ('counter', 'Forge requests answered from the local cache without a remote request.'),
+    'briareus_forge_errors_total':
+    ('counter', 'Forge responses with an error status.'),
+    'briareus_forge_request_seconds':
+    ('histogram', 'Latency of HTTP requests to the forge.'),
+    'briareus_forge_ratelimit_remaining':
+    ('gauge', 'Remaining forge API rate limit as reported by the last response.'),
+    'briareus_forge_ratelimited_total':
+    ('counter', 'Forge responses indicating a rate limit was exceeded.'),
+    'briareus_forge_stale_served_total':
+    ('counter', 'Previously fetched responses used because of forge rate limits.'),
+    'briareus_forge_cache_bytes':
+    ('gauge', 'Approximate size of the locally cached forge responses.'),
+    'briareus_mirror_ls_remote_total':
+    ('counter', 'Remote ref listings (git ls-remote) for local repository mirrors.'),
+    'briareus_mirror_fetch_total':
+    ('counter', 'Fetches to update local repository mirrors.'),
+    'briareus_gather_requests_total':
+    ('counter', 'Gather or file read requests received by GatherRepoInfo.'),
+    'briareus_gather_pending_requests':
+    ('gauge', 'Requests queued in GatherRepoInfo waiting for the current request to finish.'),
+    'briareus_gather_responses_pending':
+    ('gauge', 'Outstanding GetGitInfo responses for the current GatherRepoInfo request.'),
+    'briareus_gather_resumed_total':
+    ('counter', 'Gathers resumed (while active, when suspended, or from a checkpoint).'),
+    'briareus_gather_stale_repos_total':
+    ('counter', 'Repos whose information was taken from a previous gather.'),
+}
+
+
+def _labelkey(labels):
+    return tuple(sorted(labels.items()))
+
+
+class Metrics(object):
+    """A collection of counter, gauge, and histogram values, each
+       identified by a metric name and a set of label values.
+    """
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name, amount=1, **labels):
+        key = (name, _labelkey(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        self.gauges[(name, _labelkey(labels))] = (value, time.time())
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, _labelkey(labels))
+        with self._lock:
+            hist = self.histograms.get(key, None)
+            if hist is None:
+                hist = self.histograms[key] = [list(buckets), [0] * len(buckets), 0.0, 0]
+            for idx, upper in enumerate(hist[0]):
+                if value <= upper:
+                    hist[1][idx] += 1
+            hist[2] += value
+            hist[3] += 1
+
+    def value(self, name, **labels):
+        "Returns the current counter or gauge value (or None if not present)"
+        key = (name, _labelkey(labels))
+        if key in self.counters:
+            return self.counters[key]
+        if key in self.gauges:
+            return self.gauges[key][0]
+        return None
+
+    def snapshot(self):
+        "Returns a plain (pickleable) representation for sending to the MetricsServer"
+        with self._lock:
+            return self._snapshot()
+
+    def _snapshot(self):
+        return { 'counters': [ (n, list(l), v) for (n, l), v in self.counters.items() ],
+                 'gauges': [ (n, list(l), v, ts) for (n, l), (v, ts) in self.gauges.items() ],
+                 'histograms': [ (n, list(l), list(h[0]), list(h[1]), h[2], h[3])
+                                 for (n, l), h in self.histograms.items() ],
+        }
+
+
+def combine_snapshots(snapshots):
+    """Combines multiple snapshots into a single Metrics: counters and
+       histograms are summed, and the most recently set value is used
+       for each gauge.
+    """
+    combined = Metrics()
+    for snap in snapshots:
+        for n, l, v in snap['counters']:
+            key = (n, tuple(map(tuple, l)))
+            combined.counters[key] = combined.counters.get(key, 0) + v
+        for n, l, v, ts in snap['gauges']:
+            key = (n, tuple(map(tuple, l)))
+            if key not in combined.gauges or combined.gauges[key][1] < ts:
+                combined.gauges[key] = (v, ts)
+        for n, l, b, c, s, cnt in snap['histograms']:
+            key = (n, tuple(map(tuple, l)))
+            hist = combined.histograms.get(key, None)
+            if hist is None:
+                combined.histograms[key] = [list(b), list(c), s, cnt]
+            else:
+                hist[1] = [ a + x for a, x in zip(hist[1], c) ]
+                hist[2] += s
+                hist[3] += cnt
+    return combined
+
+
+def _fmt_labels(labels, extra=()):
+    lbls = list(labels) + list(extra)
+    if not lbls:
+        return ''
+    return '{' + ','.join([ '%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                            for k, v in lbls ]) + '}'
+
+def _fmt_value(v):
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+def render_metrics(metrics):
+    "Returns the Prometheus text exposition format for the Metrics"
+    lines = []
+    names = sorted(set([ n for n, _ in metrics.counters ] +
+                       [ n for n, _ in metrics.gauges ] +
+                       [ n for n, _ in metrics.histograms ]))
+    for name in names:
+        if name in METRIC_INFO:
+            lines.append('# HELP %s %s' % (name, METRIC_INFO[name][1]))
+            lines.append('# TYPE %s %s' % (name, METRIC_INFO[name][0]))
+        for (n, l), v in sorted(metrics.counters.items()):
+            if n == name:
+                lines.append('%s%s %s' % (n, _fmt_labels(l), _fmt_value(v)))
+        for (n, l), (v, _ts) in sorted(metrics.gauges.items()):
+            if n == name:
+                lines.append('%s%s %s' % (n, _fmt_labels(l), _fmt_value(v)))
+        for (n, l), (buckets, counts, total, count) in sorted(metrics.histograms.items()):
+            if n == name:
+                for upper, cnt in zip(buckets, counts):
+                    lines.append('%s_bucket%s %d' % (n, _fmt_labels(l, [('le', upper)]), cnt))
+                lines.append('%s_bucket%s %d' % (n, _fmt_labels(l, [('le', '+Inf')]), count))
+                lines.append('%s_sum%s %s' % (n, _fmt_labels(l), _fmt_value(total)))
+                lines.append('%s_count%s %d' % (n, _fmt_labels(l), count))
+    return '\n'.join(lines) + '\n'
+
+
+# ----------------------------------------------------------------------
+# Metrics delivery
+
+@attr.s
+class MetricsReport(object):
+    source = attr.ib()     # string identifying the reporting actor
+    snapshot = attr.ib()   # Metrics.snapshot()
+
+
+def metrics_enabled():
+    return bool(os.getenv(METRICS_ENV))
+
+
+class MetricsReporter(object):
+    """Mixin for an Actor with a self.metrics (Metrics) attribute that
+       sends the snapshot of those metrics to the MetricsServer
+       (throttled to one report per METRICS_REPORT_PERIOD).  The
+       Actor's receiveMsg_WakeupMessage must call
+       self.metrics_wakeup(msg).
+    """
+
+    def metrics_updated(self):
+        if not metrics_enabled() or getattr(self, '_metrics_wakeup_pending', False):
+            return
+        self._metrics_wakeup_pending = True
+        self.wakeupAfter(METRICS_REPORT_PERIOD, payload='metrics')
+
+    def metrics_wakeup(self, msg):
+        if msg.payload != 'metrics':
+            return False
+        self._metrics_wakeup_pending = False
+        self.send(self.createActor(MetricsServer, globalName='BriareusMetrics'),
+                  MetricsReport(self.metrics_source(), self.metrics.snapshot()))
+        return True
+
+    def metrics_source(self):
+        return '%s@%s' % (self.__class__.__name__, str(self.myAddress))
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ['/', '/metrics']:
+            self.send_error(404)
+            return
+        body = self.server.metrics_text().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        return str(self.client_address or 'unix')
+
+    def log_message(self, format, *args):
+        logging.debug('metrics request: ' + format, *args)
+
+
+class _HTTPMetricsServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+class _UnixMetricsServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def start_metrics_listener(location, metrics_text):
+    """Starts a background thread serving the metrics_text() result via
+       HTTP at the location (see BRIAREUS_METRICS above).  Returns the
+       server object.
+    """
+    if location.startswith('unix:'):
+        path = location[len('unix:'):]
+        if os.path.exists(path):
+            os.unlink(path)
+        server = _UnixMetricsServer(path, _MetricsHandler)
+    else:
+        host, _, port = location.rpartition(':')
+        server = _HTTPMetricsServer((host or 'localhost', int(port)), _MetricsHandler)
+    server.metrics_text = metrics_text
+    thread = threading.Thread(target=server.serve_forever, name='briareus-metrics', daemon=True)
+    thread.start()
+    return server
+
+
+class MetricsServer(ActorTypeDispatcher):
+    "Collects MetricsReport snapshots and serves the combined metrics."
+
+    def __init__(self, *args, **kw):
+        super(MetricsServer, self).__init__(*args, **kw)
+        self._snapshots = {}
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def _start_listener(self):
+        location = os.getenv(METRICS_ENV)
+        if self._listener is not None or not location:
+            return
+        try:
+            self._listener = start_metrics_listener(location, self.metrics_text)
+        except Exception as ex:
+            logging.error('Unable to serve metrics at %s: %s', location, ex)
+            self._listener = False  # do not retry
+
+    def metrics_text(self):
+        with self._lock:
+            snapshots = list(self._snapshots.values())
+        return render_metrics(combine_snapshots(snapshots))
+
+    def receiveMsg_MetricsReport(self, msg, sender):
+        self._start_listener()
+        with self._lock:
+            self._snapshots[msg.source] = msg.snapshot
+
+    def receiveMsg_str(self, msg, sender):
+        if msg == 'metrics':
+            self.send(sender, self.metrics_text())
+
+    def receiveMsg_ActorExitRequest(self, msg, sender):
+        if self._listener:
+            self._listener.shutdown()
+            self._listener.server_close()
@@ -0,0 +1,104 @@
+"""Incremental synchronization of the open pull requests of a
+repository (see RemoteGit__Info.open_pullreqs).
+
+A full sync requests only the open pull requests from the forge.
+After that, each sync requests the pull requests (in any state) in
+order of their most recent update, and stops at the first one that
+has not been updated since the newest update seen by the previous
+sync (the watermark).  The updated pull requests are merged into the
+PullReqSnapshot: open ones are added or replaced, and closed or
+merged ones are removed.  This usually needs only a single page,
+regardless of how many pull requests the repository has had.
+
+A full sync is performed again after the FullSyncPeriod in case any
+changes were missed (e.g. a pull request was deleted).
+
+When the BRIAREUS_PR_SNAPSHOTS environment variable specifies a
+directory, the snapshots are saved there so that they are retained
+when the GitRepoInfo actor exits; otherwise they are only kept in
+memory.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+
+
+SNAPSHOTS_ENV = 'BRIAREUS_PR_SNAPSHOTS'
+
+FullSyncPeriod = datetime.timedelta(hours=24)
+
+_time_format = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def snapshot_file(api_url):
+    """Returns the file where the pull request snapshot for the api_url
+       is saved, or None if snapshots are not saved.
+    """
+    snapdir = os.getenv(SNAPSHOTS_ENV)
+    if not snapdir:
+        return None
+    return os.path.join(snapdir,
+                        hashlib.sha1(api_url.encode('utf-8')).hexdigest()[:16] + '-pullreqs.json')
+
+
+class PullReqSnapshot(object):
+    """The (forge JSON) records of the open pull requests as of the
+       last sync, indexed by pull request number.
+    """
+
+    def __init__(self, fname=None):
+        self.fname = fname
+        self.pullreqs = {}      # pull request number (str) --> record
+        self.watermark = None   # newest updated_at of any synced record
+        self.full_sync = None   # datetime of the last full sync
+        if fname and os.path.exists(fname):
+            with open(fname) as snapf:
+                saved = json.load(snapf)
+            self.pullreqs = saved['pullreqs']
+            self.watermark = saved['watermark']
+            self.full_sync = datetime.datetime.strptime(saved['full_sync'], _time_format)
+
+    def needs_full_sync(self, now, period=FullSyncPeriod):
+        return (self.watermark is None or self.full_sync is None or
+                now - self.full_sync >= period)
+
+    def replace(self, records, key, now):
+        "Replaces the snapshot with all of the (open) records"
+        self.pullreqs = dict([ (key(r), r) for r in records ])
+        self.watermark = max([ r['updated_at'] for r in self.pullreqs.values() ] or [ None ])
+        self.full_sync = now
+        self.save()
+
+    def update(self, records, key, is_open):
+        """Merges the records, which must be in order of most recent
+           update, stopping at the first that was not updated since
+           the watermark.
+        """
+        newest = self.watermark
+        for r in records:
+            if r['updated_at'] < self.watermark:
+                break
+            newest = max(newest, r['updated_at'])
+            if is_open(r):
+                self.pullreqs[key(r)] = r
+            else:
+                self.pullreqs.pop(key(r), None)
+        self.watermark = newest
+        self.save()
+
+    def records(self):
+        "Returns the open pull request records, most recently updated first"
+        return sorted(self.pullreqs.values(), key=lambda r: r['updated_at'], reverse=True)
+
+    def save(self):
+        if not self.fname:
+            return
+        tmpname = self.fname + '.new'
+        with open(tmpname, 'w') as snapf:
+            json.dump({ 'pullreqs': self.pullreqs,
+                        'watermark': self.watermark,
+                        'full_sync': self.full_sync.strftime(_time_format),
+                      }, snapf)
+        os.replace(tmpname, self.fname)
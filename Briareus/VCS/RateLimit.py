@@ -0,0 +1,192 @@
+"""Rate-limit-aware scheduling of forge API requests.
+
+Both Github and Gitlab limit the number of API requests per token (or
+per client address for unauthenticated requests) and report the
+remaining allowance in the response headers.  Github additionally
+applies "secondary" rate limits to bursts of requests, which are
+reported as a 403 or 429 response, usually with a Retry-After header.
+
+A ForgeScheduler is shared by all requests to the same forge host
+with the same access token (see forge_scheduler()).  Before each
+request, the scheduler determines how long to wait:
+
+  * A local token bucket limits request bursts to avoid triggering
+    secondary rate limits.
+
+  * When the remaining server allowance falls below pace_below, the
+    remaining requests are spread out over the time until the
+    allowance is reset.
+
+  * The last reserve requests of the allowance are only used for
+    conditional refreshes of previously fetched data (which do not
+    count against the Github rate limit when the response is a 304).
+    New fetches wait for the reset instead.
+
+  * After a rate limit response, all requests wait for the
+    Retry-After or reset time (or an increasing backoff if neither is
+    specified).
+
+If the wait would exceed max_wait, a request that has previously
+fetched (stale) data should use that data instead of waiting; other
+requests raise RateLimited.  The wait blocks the requesting
+GitRepoInfo actor (which cannot handle any other messages meanwhile),
+so the default max_wait is kept well below the gather's
+PARTIAL_INFO_TIMEOUT: longer rate limits are handled by using the
+stale data or failing the request rather than by waiting.
+
+Note that each GitRepoInfo actor may run in a separate process, so the
+local token bucket is only shared within a process; the server's
+reported allowance is what coordinates requests across processes.
+Within a process, the scheduler may be used by multiple threads (e.g.
+for concurrent page fetches): each request reserves its turn before
+waiting, so concurrent requests are spaced out rather than released
+together.
+"""
+
+import threading
+import time
+
+
+class RateLimited(Exception):
+    "Raised when a forge request cannot be made within the allowed wait time."
+    def __init__(self, host, wait_secs):
+        super(RateLimited, self).__init__(
+            'Rate limit for %s would require waiting %.0f seconds' % (host, wait_secs))
+        self.host = host
+        self.wait_secs = wait_secs
+
+
+_remaining_headers = [ 'X-RateLimit-Remaining', 'RateLimit-Remaining' ]
+_reset_headers = [ 'X-RateLimit-Reset', 'RateLimit-Reset' ]
+
+
+def _header_int(headers, names):
+    for hdr in names:
+        if hdr in headers:
+            try:
+                return int(headers[hdr])
+            except ValueError:
+                return None
+    return None
+
+
+class ForgeScheduler(object):
+
+    def __init__(self, host,
+                 rate=10.0,        # local token bucket refill (requests/second)
+                 burst=20,         # local token bucket size
+                 reserve=50,       # allowance reserved for conditional refreshes
+                 pace_below=500,   # start pacing below this remaining allowance
+                 max_wait=5.0,     # longest single wait (seconds) before giving up
+                 backoff=60.0,     # initial backoff when no retry time is given
+                 clock=time.monotonic, wallclock=time.time, sleep=time.sleep):
+        self.host = host
+        self.rate = rate
+        self.burst = burst
+        self.reserve = reserve
+        self.pace_below = pace_below
+        self.max_wait = max_wait
+        self.backoff = backoff
+        self._clock = clock
+        self._wallclock = wallclock
+        self._sleep = sleep
+        self._tokens = float(burst)
+        self._last_fill = clock()
+        self._last_request = None
+        self.remaining = None     # server-reported remaining allowance
+        self.reset_at = None      # clock() time when the allowance is reset
+        self.blocked_until = None # clock() time after a rate limit response
+        self._backoff_count = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(float(self.burst),
+                           self._tokens + (now - self._last_fill) * self.rate)
+        self._last_fill = now
+
+    def delay(self, conditional=False):
+        """Returns the number of seconds to wait before the next request
+           can be sent.  A conditional request is a refresh of
+           previously fetched data.
+        """
+        now = self._clock()
+        self._refill(now)
+        waits = [ 0.0 if self._tokens >= 1.0 else (1.0 - self._tokens) / self.rate ]
+        if self.blocked_until is not None:
+            waits.append(self.blocked_until - now)
+        if self.remaining is not None:
+            until_reset = max(0.0, (self.reset_at - now) if self.reset_at is not None
+                              else self.backoff)
+            available = self.remaining - (0 if conditional else self.reserve)
+            if available <= 0:
+                waits.append(until_reset)
+            elif available < self.pace_below and self._last_request is not None:
+                waits.append(self._last_request + until_reset / available - now)
+        return max(waits)
+
+    def wait_for_turn(self, conditional=False, stale_ok=False):
+        """Waits until the next request can be sent.  Returns False
+           (without waiting) if stale_ok and the wait would exceed
+           max_wait; raises RateLimited if not stale_ok and the wait
+           would exceed max_wait.
+        """
+        with self._lock:
+            wait = self.delay(conditional)
+            if wait > self.max_wait:
+                if stale_ok:
+                    return False
+                raise RateLimited(self.host, wait)
+            # Reserve this turn (the token bucket may go negative,
+            # which delays subsequent requests accordingly).
+            wait = max(0.0, wait)
+            self._tokens -= 1.0
+            self._last_request = self._clock() + wait
+            if self.remaining is not None and self.remaining > 0:
+                self.remaining -= 1
+        if wait > 0:
+            self._sleep(wait)
+        return True
+
+    def update(self, rsp):
+        """Updates the scheduler from the response headers.  Returns the
+           retry delay in seconds if the response indicates a rate
+           limit was hit, otherwise None.
+        """
+        with self._lock:
+            return self._update(rsp)
+
+    def _update(self, rsp):
+        now = self._clock()
+        remaining = _header_int(rsp.headers, _remaining_headers)
+        if remaining is not None:
+            self.remaining = remaining
+            reset = _header_int(rsp.headers, _reset_headers)
+            if reset is not None:
+                # Github and Gitlab report the reset as epoch seconds
+                self.reset_at = now + max(0, reset - self._wallclock())
+        if rsp.status_code not in (403, 429):
+            self._backoff_count = 0
+            return None
+        retry_after = _header_int(rsp.headers, ['Retry-After'])
+        if retry_after is not None:
+            retry = float(retry_after)
+        elif remaining == 0 and self.reset_at is not None:
+            retry = max(0.0, self.reset_at - now)
+        elif rsp.status_code == 429 or 'rate limit' in getattr(rsp, 'text', '').lower():
+            # Secondary rate limit without guidance: back off exponentially
+            retry = self.backoff * (2 ** self._backoff_count)
+        else:
+            return None  # a 403 that is not rate limiting
+        self._backoff_count += 1
+        self.blocked_until = max(self.blocked_until or now, now + retry)
+        return retry
+
+
+_schedulers = {}
+
+def forge_scheduler(host, token=None):
+    "Returns the ForgeScheduler shared by all requests to host using token."
+    key = (host, token)
+    if key not in _schedulers:
+        _schedulers[key] = ForgeScheduler(host)
+    return _schedulers[key]
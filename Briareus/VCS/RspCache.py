@@ -0,0 +1,151 @@
+"""Cache of the forge API responses for RemoteGit__Info.
+
+Only the parts of a response that are needed later are retained:
+
+  * the validator headers (ETag and Last-Modified) for the conditional
+    request that revalidates a stale entry,
+
+  * the pagination links, and
+
+  * the decoded payload (the text of a raw response), with JSON
+    payloads trimmed to the fields that Briareus uses (see
+    DefaultTrimRules).
+
+Entries are decoded and trimmed once, when received, so a cache hit
+does not need to parse the response again.  The cache is limited to
+max_bytes (estimated from the size of the retained payloads): the
+least recently used entries are evicted when that is exceeded.
+"""
+
+import attr
+import collections
+import json
+import re
+import threading
+
+
+DefaultMaxBytes = 32 * 1024 * 1024
+
+_keep = None  # keep the entire value of the field
+
+# The fields used from the JSON responses for each type of request.
+# Responses to other requests are cached without being trimmed.
+DefaultTrimRules = [
+    # (regex for the url path and query, fields to keep)
+    (re.compile(r'/(pulls|merge_requests)($|\?)'),
+     { 'number': _keep, 'iid': _keep, 'title': _keep,
+       'state': _keep, 'merged_at': _keep, 'updated_at': _keep,
+       'merge_commit_sha': _keep, 'sha': _keep,
+       'head': { 'ref': _keep, 'sha': _keep, 'repo': { 'html_url': _keep } },
+       'user': { 'login': _keep },
+       'source_branch': _keep, 'source_project_url': _keep,
+       'source_project_id': _keep, 'target_project_id': _keep,
+       'author': { 'id': _keep, 'username': _keep },
+     }),
+    (re.compile(r'/branches($|\?)'), { 'name': _keep }),
+    (re.compile(r'/users?/[^/?]+$'), { 'email': _keep, 'public_email': _keep }),
+    (re.compile(r'/contents/'),
+     { 'type': _keep, 'name': _keep, 'encoding': _keep, 'content': _keep,
+       'sha': _keep, 'submodule_git_url': _keep }),
+    (re.compile(r'/repository/files/[^/?]+\?'), { 'file_name': _keep, 'blob_id': _keep }),
+    (re.compile(r'/(projects/[^/?]+|repos/[^/?]+/[^/?]+)$'),
+     { 'id': _keep, 'name': _keep, 'html_url': _keep, 'web_url': _keep }),
+]
+
+
+def trim_payload(data, fields):
+    """Returns the JSON data (a dict or a list of dicts) with only the
+       specified fields, where fields is a dict of field name to the
+       fields to keep in that field's value (or _keep for all).
+    """
+    if isinstance(data, list):
+        return [ trim_payload(e, fields) for e in data ]
+    if isinstance(data, dict):
+        return dict([ (k, v if fields[k] is _keep else trim_payload(v, fields[k]))
+                      for k, v in data.items() if k in fields ])
+    return data
+
+
+@attr.s(frozen=True, slots=True)
+class CachedResponse(object):
+    data = attr.ib()                    # decoded JSON or (raw) text
+    etag = attr.ib(default=None)
+    last_modified = attr.ib(default=None)
+    links = attr.ib(factory=dict)       # rel --> { 'url': url }, as for requests.Response
+    size = attr.ib(default=0)           # approximate bytes retained
+
+    def validators(self):
+        "Returns the headers for a conditional request to revalidate this response"
+        if self.etag:
+            return { "If-None-Match": self.etag }
+        if self.last_modified:
+            return { "If-Modified-Since": self.last_modified }
+        return {}
+
+
+def cached_response(req_url, rsp, raw, trim_rules=None):
+    "Returns the CachedResponse for the requests.Response"
+    if raw:
+        data = rsp.text
+        size = len(data)
+    else:
+        data = rsp.json()
+        for pattern, fields in (DefaultTrimRules if trim_rules is None else trim_rules):
+            if pattern.search(req_url):
+                data = trim_payload(data, fields)
+                break
+        size = len(json.dumps(data))
+    links = dict([ (rel, { 'url': link['url'] })
+                   for rel, link in (rsp.links.items() if 'Link' in rsp.headers else [])
+                   if rel in ['next', 'last'] ])
+    return CachedResponse(data,
+                          etag=rsp.headers.get('ETag', None),
+                          last_modified=rsp.headers.get('Last-Modified', None),
+                          links=links,
+                          size=size + len(req_url) + sum([ len(l['url']) for l in links.values() ]))
+
+
+class ResponseCache(object):
+    """Least-recently-used cache of the CachedResponse (or other small
+       value, such as a NotFound indication) and the time it was
+       fetched for each request URL, limited to max_bytes.  The cache
+       may be used by the concurrent page fetches.
+    """
+
+    entry_overhead = 200  # approximate bytes for each entry
+
+    def __init__(self, max_bytes=DefaultMaxBytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()  # url --> (value, fetched)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, req_url):
+        return req_url in self._entries
+
+    def _size(self, req_url, value):
+        return self.entry_overhead + getattr(value, 'size', len(req_url))
+
+    def get(self, req_url):
+        "Returns the (value, fetched) for the req_url, or (None, None)"
+        with self._lock:
+            entry = self._entries.get(req_url, None)
+            if entry is None:
+                return (None, None)
+            self._entries.move_to_end(req_url)
+            return entry
+
+    def put(self, req_url, value, fetched):
+        with self._lock:
+            if req_url in self._entries:
+                self.nbytes -= self._size(req_url, self._entries.pop(req_url)[0])
+            self._entries[req_url] = (value, fetched)
+            self.nbytes += self._size(req_url, value)
+            while self.nbytes > self.max_bytes and len(self._entries) > 1:
+                old_url, (old_value, _) = self._entries.popitem(last=False)
+                self.nbytes -= self._size(old_url, old_value)
+                self.evictions += 1
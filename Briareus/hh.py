@@ -2,18 +2,24 @@
 #! nix-shell -i "python3.7 -u" -p git swiProlog "python37.withPackages(pp: with pp; [ thespian setproctitle attrs requests ])"
 
 import Briareus.AnaRep.Operations as AnaRep
-from Briareus.AnaRep.Prior import ( get_prior_report, write_report_output )
+from Briareus.AnaRep.Prior import ( lock_report_file, read_report_from, write_report_output )
 import Briareus.BCGen.Operations as BCGen
 import Briareus.Input.Operations as BInput
 import Briareus.BuildSys.Hydra as BldSys
 import Briareus.Actions.Ops as Actions
 from Briareus.VCS.ManagedRepo import get_updated_file
 from Briareus.Types import SendEmail
+from Briareus.Selection import Selection, merge_report
+from Briareus.Backend import backends, actor_system_for
+from Briareus.BCGen.Generator import engines as bcgen_engines
+from Briareus.AnaRep.Operations import engines as report_engines
 import argparse
+import concurrent.futures
 import datetime
 import os
 import os.path
 import sys
+import threading
 from thespian.actors import ActorSystem
 import attr
 
@@ -40,12 +46,111 @@ class Params(object):
     verbose = attr.ib(default=False)
     up_to = attr.ib(default=None)  # class UpTo
     report_file = attr.ib(default=None)
+    lazy_variables = attr.ib(default=False)
+    only = attr.ib(default=None)  # Selection for a selective run, or None for all
+    backend = attr.ib(default='daemon')  # one of Briareus.Backend.backends
+    bcgen_engine = attr.ib(default='prolog')  # one of Generator.engines
+    report_engine = attr.ib(default='prolog')  # one of AnaRep.Operations.engines
+    partition_analysis = attr.ib(default=False)  # analyze each -C project separately
 
 
 def verbosely(params, *msgargs):
     if params.verbose:
         print(*msgargs)
 
+
+class Pipeline(object):
+    """Runs the independent (I/O) stages of an hh cycle in the
+       background so that they overlap with the VCS gathering and the
+       logic phases, which run in the main thread.  Each stage is
+       started as soon as the stages it comes after have completed
+       (no worker waits on another stage), and the main thread joins
+       a stage where its result is needed; the cycle time is then
+       determined by the longest chain of stages rather than the sum
+       of all of them.
+
+       The stages used by run_hh are:
+
+         prior_report      -- reads the prior report (the report file
+                              itself is locked before the cycle starts)
+         refresh:N         -- updates the Nth input configuration's
+                              files from the remote input_url
+         build_results:N   -- retrieves the builder results for the
+                              Nth input configuration (after refresh:N)
+
+       A stage that fails raises its exception when joined, or when
+       started after it.
+    """
+
+    def __init__(self, params, max_workers=4):
+        self._params = params
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        self._stages = {}  # name --> concurrent.futures.Future
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # On an error, do not wait for the stages that are no longer
+        # needed.
+        self._executor.shutdown(wait=exc_type is None)
+
+    def __contains__(self, name):
+        return name in self._stages
+
+    def start(self, name, fun, *args, after=()):
+        """Starts the named stage, which calls fun(*args) when the stages
+           named in after have completed.  Returns the stage's Future.
+        """
+        stage = concurrent.futures.Future()
+        deps = [ self._stages[each] for each in after if each in self._stages ]
+        self._stages[name] = stage
+        waiting = [ len(deps) ]
+
+        def run():
+            if not stage.set_running_or_notify_cancel():
+                return
+            failed = [ d.exception() for d in deps if d.exception() ]
+            if failed:
+                stage.set_exception(failed[0])
+                return
+            t0 = datetime.datetime.now()
+            try:
+                r = fun(*args)
+            except BaseException as ex:
+                stage.set_exception(ex)
+            else:
+                stage.set_result(r)
+            verbosely(self._params, 'Stage %s completed in %s' %
+                      (name, str(datetime.datetime.now() - t0)))
+
+        def dep_done(_dep):
+            with self._lock:
+                waiting[0] -= 1
+                if waiting[0]:
+                    return
+            try:
+                self._executor.submit(run)
+            except RuntimeError as ex:  # the pipeline has been shutdown
+                stage.set_exception(ex)
+
+        if deps:
+            for each in deps:
+                each.add_done_callback(dep_done)
+        else:
+            self._executor.submit(run)
+        return stage
+
+    def join(self, name, default=None):
+        """Waits for the named stage and returns its result (or raises its
+           exception).  Returns the default if the stage was not
+           started.
+        """
+        if name not in self._stages:
+            return default
+        return self._stages[name].result()
+
 # ----------------------------------------------------------------------
 # Actual generation and reporting functions
 
@@ -60,16 +165,23 @@ class GenResult(object):
         self.result_sets.append(AnaRep.ResultSet(builder, inp_desc, repo_info, build_cfgs))
 
 
-def run_hh_gen(params, inpcfg, inp, bldcfg_fname, prev_gen_result=None):
-    verbosely(params, 'Generating Build Configurations from %s' % inpcfg.hhd)
-    result = (prev_gen_result or
-              GenResult(actor_system=ActorSystem('multiprocTCPBase')))
-    if inpcfg.builder_type == 'hydra':
-        builder = BldSys.HydraBuilder(inpcfg.builder_conf,
-                                      builder_url=inpcfg.builder_url)
-    else:
+builder_types = { 'hydra': BldSys.HydraBuilder }
+
+
+def new_builder(inpcfg):
+    if inpcfg.builder_type not in builder_types:
         raise RuntimeError('Unknown builder (known: %s), specified: %s' %
-                           (', '.join(['hydra']), inpcfg.builder_type))
+                           (', '.join(builder_types), inpcfg.builder_type))
+    return builder_types[inpcfg.builder_type](inpcfg.builder_conf,
+                                              builder_url=inpcfg.builder_url)
+
+
+def run_hh_gen(params, inpcfg, inp, bldcfg_fname, prev_gen_result, builder=None):
+    # The prev_gen_result (a GenResult, possibly without any results
+    # yet) supplies the actor_system, which is owned by the caller.
+    verbosely(params, 'Generating Build Configurations from %s' % inpcfg.hhd)
+    result = prev_gen_result
+    builder = builder or new_builder(inpcfg)
 
     inp_desc, repo_info = \
         BInput.input_desc_and_VCS_info(inp,
@@ -79,6 +191,9 @@ def run_hh_gen(params, inpcfg, inp, bldcfg_fname, prev_gen_result=None):
     bcgen = BCGen.BCGen(builder,
                         verbose=params.verbose,
                         up_to=params.up_to,
+                        lazy_variables=params.lazy_variables,
+                        selection=params.only,
+                        engine=params.bcgen_engine,
                         actor_system=result.actor_system)
     config_results = bcgen.generate(inp_desc, repo_info,
                                     bldcfg_fname=bldcfg_fname)
@@ -103,7 +218,9 @@ def run_hh_report(params, gen_result, prior_report, reporting_logic_defs=''):
     t0 = datetime.datetime.now()
     anarep = AnaRep.AnaRep(verbose=params.verbose,
                            up_to=params.up_to,
-                           actor_system=gen_result.actor_system)
+                           actor_system=gen_result.actor_system,
+                           engine=params.report_engine,
+                           partition=params.partition_analysis)
     report = anarep.report_on(gen_result.result_sets, prior_report,
                               reporting_logic_defs=reporting_logic_defs)
     te = datetime.datetime.now()
@@ -122,10 +239,12 @@ def perform_hh_actions(inpcfg, inp_report):
 
 # ----------------------------------------------------------------------
 
-def run_hh_gen_with_files(inp, inpcfg, outputf, outputfname, params, prev_gen_result=None):
+def run_hh_gen_with_files(inp, inpcfg, outputf, outputfname, params, prev_gen_result,
+                          builder=None):
     r = run_hh_gen(params, inpcfg, inp,
                    bldcfg_fname=outputfname,
-                   prev_gen_result=prev_gen_result)
+                   prev_gen_result=prev_gen_result,
+                   builder=builder)
     if r is None:
         # Probably an --up-to prevented the full generation
         return None
@@ -133,11 +252,20 @@ def run_hh_gen_with_files(inp, inpcfg, outputf, outputfname, params, prev_gen_re
         return None
     gen_result, builder_cfgs = r
     if outputf and (not params.up_to or params.up_to.enough('builder_configs')):
-        outputf.write(builder_cfgs[None])
+        output = builder_cfgs[None]
+        if params.only and os.path.exists(outputfname):
+            # Selective run: the other build configurations are
+            # retained from the previous output.
+            result_set = gen_result.result_sets[-1]
+            with open(outputfname) as prevf:
+                output = result_set.builder.merge_build_configurations(
+                    prevf.read(), output,
+                    params.only.for_pullreqs(result_set.build_cfgs.cfg_pullreqs))
+        outputf.write(output)
     return r
 
 
-def run_hh_gen_on_inpfile(inp_fname, params, inpcfg, prev_gen_result=None):
+def run_hh_gen_on_inpfile(inp_fname, params, inpcfg, prev_gen_result, builder=None):
     inp_parts = os.path.split(inp_fname)
     outfname = (inpcfg.output_file or
                 os.path.join(os.getcwd(),
@@ -149,12 +277,14 @@ def run_hh_gen_on_inpfile(inp_fname, params, inpcfg, prev_gen_result=None):
                 outfname,
                 lambda outf: run_hh_gen_with_files(inpf.read(), inpcfg, outf, outfname,
                                                    params=params,
-                                                   prev_gen_result=prev_gen_result))
+                                                   prev_gen_result=prev_gen_result,
+                                                   builder=builder))
         else:
             verbosely(params, 'hh partial run, no output')
             r = run_hh_gen_with_files(inpf.read(), inpcfg, None, outfname,
                                       params=params,
-                                      prev_gen_result=prev_gen_result)
+                                      prev_gen_result=prev_gen_result,
+                                      builder=builder)
     if r is None:
         # If r is None, then an --up-to probably halted production
         return None
@@ -194,23 +324,91 @@ def upd_from_remote(src_url, src_path, fname, repolocs, actor_system=None):
                   % (fpath, src_url))
 
 
-def run_hh_on_inpcfg(inpcfg, params, prev_gen_result=None):
-    if inpcfg.input_url is not None:
-        asys = ((prev_gen_result.actor_system if prev_gen_result else None)
-                or ActorSystem('multiprocTCPBase'))
-        try:
-            upd_from_remote(inpcfg.input_url, inpcfg.input_path, inpcfg.hhd, [], asys)
-            upd_from_remote(inpcfg.input_url, inpcfg.input_path, inpcfg.builder_conf, [], asys)
-        except:
-            print('Warning: update from remote %s path %s failed (%s, %s)' %
-                  (inpcfg.input_url, inpcfg.input_path, inpcfg.hhd, inpcfg.builder_conf))
-    ifile = (inpcfg.hhd if os.path.exists(inpcfg.hhd)
-                 else ((inpcfg.hhd + '.hhd') if os.path.exists(inpcfg.hhd + '.hhd')
-                       else None))
+def refresh_inpcfg(inpcfg, asys):
+    try:
+        upd_from_remote(inpcfg.input_url, inpcfg.input_path, inpcfg.hhd, [], asys)
+        upd_from_remote(inpcfg.input_url, inpcfg.input_path, inpcfg.builder_conf, [], asys)
+    except:
+        print('Warning: update from remote %s path %s failed (%s, %s)' %
+              (inpcfg.input_url, inpcfg.input_path, inpcfg.hhd, inpcfg.builder_conf))
+
+
+def refresh_inpcfg_privately(inpcfg, asys):
+    # The ActorSystem is not thread-safe: a stage running in another
+    # thread must use its own private context for the requests.
+    with asys.private() as context:
+        refresh_inpcfg(inpcfg, context)
+
+
+def inpcfg_file(inpcfg):
+    return (inpcfg.hhd if os.path.exists(inpcfg.hhd)
+            else ((inpcfg.hhd + '.hhd') if os.path.exists(inpcfg.hhd + '.hhd')
+                  else None))
+
+
+def prefetch_build_results(inpcfg, params, builder):
+    if params.only:
+        ifile = inpcfg_file(inpcfg)
+        if not ifile or not params.only.has_project(inpfile_project_name(ifile)):
+            return None
+    return builder.prefetch_build_results()
+
+
+def start_input_stages(pipeline, inpcfgs, params, reporting, actor_system):
+    """Starts the refresh:N and build_results:N pipeline stages for the
+       input configurations, returning the builder for each input
+       configuration (or None if the builder is to be created when
+       generating).
+
+       The remote input refreshes are run in the background (one
+       after the other) only for the daemon backend: the inprocess
+       actors run in the main thread, so the refresh is performed
+       there just before the configuration is generated.  The builder
+       results are prefetched if they will be reported on, once the
+       builder configuration is up to date.
+    """
+    builders = []
+    prev_refresh = []
+    for idx, inpcfg in enumerate(inpcfgs):
+        refresh = 'refresh:%d' % idx
+        if inpcfg.input_url is not None and params.backend == 'daemon':
+            pipeline.start(refresh, refresh_inpcfg_privately,
+                           inpcfg, actor_system,
+                           after=prev_refresh)
+            prev_refresh = [refresh]
+        builder = None
+        if reporting and inpcfg.builder_type in builder_types and \
+           (inpcfg.input_url is None or refresh in pipeline):
+            builder = new_builder(inpcfg)
+            pipeline.start('build_results:%d' % idx, prefetch_build_results,
+                           inpcfg, params, builder, after=[refresh])
+        builders.append(builder)
+    return builders
+
+
+def run_hh_on_inpcfg(inpcfg, params, actor_system, prev_gen_result=None, pipeline=None,
+                     idx=0, builder=None):
+    refresh = 'refresh:%d' % idx
+    if pipeline and refresh in pipeline:
+        pipeline.join(refresh)
+    elif inpcfg.input_url is not None:
+        refresh_inpcfg(inpcfg, actor_system)
+    ifile = inpcfg_file(inpcfg)
     if not ifile:
         raise RuntimeError('Input specification not found (in %s): %s' %
                            (os.getcwd(), inpcfg.hhd))
-    return run_hh_gen_on_inpfile(ifile, params=params, inpcfg=inpcfg, prev_gen_result=prev_gen_result)
+    if params.only and not params.only.has_project(inpfile_project_name(ifile)):
+        verbosely(params, 'Skipping %s: not a selected project' % ifile)
+        return prev_gen_result
+    return run_hh_gen_on_inpfile(ifile, params=params, inpcfg=inpcfg,
+                                 prev_gen_result=(prev_gen_result or
+                                                  GenResult(actor_system=actor_system)),
+                                 builder=builder)
+
+
+def inpfile_project_name(inp_fname):
+    with open(inp_fname) as inpf:
+        return BInput.Parser.BISParser().parse(inpf.read()).PNAME
 
 
 def read_inpcfgs_from(inputArg):
@@ -233,31 +431,67 @@ def read_inpcfgs_from(inputArg):
     return inpParsed
 
 
-def run_hh_reporting_to(reportf, params, inputArg=None, inpcfg=None, prior_report=None):
+def run_hh_reporting_to(reportf, params, inputArg=None, inpcfg=None, prior_report=None,
+                        pipeline=None, actor_system=None):
     """Runs the Briareus operation, writing the output to reportf if not
        None. If inpcfg is set, then this is for that single
        configuration, otherwise the input configurations are read from
        inputArg (stdin if inputArg is None).
 
+       If the pipeline is specified, its prior_report stage (if
+       started) supplies the prior_report.  If the actor_system is not
+       specified, one is created for the params.backend for this run.
+
     """
+    if actor_system is None:
+        with actor_system_for(params.backend) as actor_system:
+            return run_hh_reporting_to(reportf, params, inputArg=inputArg, inpcfg=inpcfg,
+                                       prior_report=prior_report, pipeline=pipeline,
+                                       actor_system=actor_system)
+
+    if pipeline is None:
+        with Pipeline(params) as pipeline:
+            return run_hh_reporting_to(reportf, params, inputArg=inputArg, inpcfg=inpcfg,
+                                       prior_report=prior_report, pipeline=pipeline,
+                                       actor_system=actor_system)
+
     if inpcfg is None:
         inpcfgs = read_inpcfgs_from(inputArg)
         if not inpcfgs:
             raise ValueError('No input configurations specified')
-        gen_result = None
-        for inpcfg in inpcfgs['InpConfigs']:
-            gen_result = run_hh_on_inpcfg(inpcfg, params, prev_gen_result=gen_result)
+        cfgs = inpcfgs['InpConfigs']
         reporting_logic_defs = inpcfgs.get('Reporting', dict()).get('logic', '')
     else:
-        gen_result = run_hh_on_inpcfg(inpcfg, params)
+        cfgs = [ inpcfg ]
         reporting_logic_defs = ''
 
+    reporting = ((not params.up_to or params.up_to.enough('build_results')) and
+                 bool(reportf or (params.up_to and params.up_to.enough('built_facts'))))
+    builders = start_input_stages(pipeline, cfgs, params, reporting, actor_system)
+
+    gen_result = None
+    for idx, inpcfg in enumerate(cfgs):
+        gen_result = run_hh_on_inpcfg(inpcfg, params, actor_system,
+                                      prev_gen_result=gen_result,
+                                      pipeline=pipeline, idx=idx, builder=builders[idx])
+
     # Generator cycle done, now do any reporting
 
     if params.up_to and not params.up_to.enough('build_results'):
         return
 
-    if reportf or (params.up_to and params.up_to.enough('built_facts')):
+    prior_report = pipeline.join('prior_report', prior_report)
+
+    if gen_result is None:
+        # Selective run where no projects were selected
+        if reportf:
+            write_report_output(reportf, prior_report or [])
+        return
+
+    if reporting:
+
+        for idx in range(len(cfgs)):
+            pipeline.join('build_results:%d' % idx)
 
         report = run_hh_report(params, gen_result, prior_report,
                                reporting_logic_defs=reporting_logic_defs)
@@ -265,6 +499,14 @@ def run_hh_reporting_to(reportf, params, inputArg=None, inpcfg=None, prior_repor
         if params.up_to and not params.up_to.enough('actions'):
             return
 
+        if params.only:
+            # Selective run: the report entries outside of the
+            # selection are retained from the prior report.
+            selection = params.only.for_pullreqs(
+                [ p for rs in gen_result.result_sets
+                  for p in rs.build_cfgs.cfg_pullreqs ])
+            report = merge_report(prior_report, report, selection)
+
         report = perform_hh_actions(inpcfg, report)
 
         if reportf and (not params.up_to or params.up_to.enough('report')):
@@ -288,16 +530,21 @@ def run_hh(params, inpcfg=None, inputArg=None):
         verbosely(params, 'input from:', inpcfg.hhd)
     if params.report_file and (not params.up_to or params.up_to.enough('report')):
         verbosely(params, 'Reporting to', params.report_file)
-        prior_rep_fd, prior_report = get_prior_report(params.report_file)
+        prior_rep_fd = lock_report_file(params.report_file)
         # n.b. the rep_fd references the locked file descriptor; keep
         # this reference to keep the lock active and prevent
-        # simultaneous Briareus runs from colliding.
-        atomic_write_to(
-            params.report_file,
-            lambda rep_fd: run_hh_reporting_to(rep_fd, params,
-                                               inputArg=inputArg,
-                                               inpcfg=inpcfg,
-                                               prior_report=prior_report))
+        # simultaneous Briareus runs from colliding.  The prior report
+        # itself is read while the build configurations are
+        # generated.
+        with actor_system_for(params.backend) as asys, Pipeline(params) as pipeline:
+            pipeline.start('prior_report', read_report_from, prior_rep_fd)
+            atomic_write_to(
+                params.report_file,
+                lambda rep_fd: run_hh_reporting_to(rep_fd, params,
+                                                   inputArg=inputArg,
+                                                   inpcfg=inpcfg,
+                                                   pipeline=pipeline,
+                                                   actor_system=asys))
     else:
         verbosely(params, 'No reporting')
         run_hh_reporting_to(None, params, inputArg=inputArg, inpcfg=inpcfg)
@@ -375,6 +622,66 @@ def main():
         help='''For debugging: run hh up to the designated point and stop, printing
                 the results to stdout (ignoring the -o argument).
                 Valid ending points: %s''' % UpTo.valid())
+    parser.add_argument(
+        '--lazy-variables', dest="lazy_variables", action='store_true',
+        help='''Generate a single build configuration for each branch and
+                strategy in the logic phase and expand the variable
+                value combinations when writing the builder
+                configurations.  This reduces the logic processing
+                time for projects with many variables.''')
+    parser.add_argument(
+        '--only-project', dest='only_projects', action='append', default=[],
+        help='''Selective run: only regenerate the build configurations and
+                report entries for this project (may be repeated).
+                The output build configurations and the report are
+                updated for the selection and retain everything else
+                from the previous run.''')
+    parser.add_argument(
+        '--only-branch', dest='only_branches', action='append', default=[],
+        help='''Selective run: only regenerate the build configurations and
+                report entries for this branch name, including pull
+                requests from a branch with this name (may be
+                repeated).''')
+    parser.add_argument(
+        '--only-pr', dest='only_pullreqs', action='append', default=[],
+        help='''Selective run: only regenerate the build configurations and
+                report entries for this pull request identifier (may be
+                repeated).  The builds for all pull requests with the
+                same branch name are regenerated.''')
+    parser.add_argument(
+        '--backend', default='daemon', choices=backends,
+        help='''Execution backend for the VCS information gathering and the
+                logic analysis.  The "daemon" backend (the default)
+                uses daemon processes that retain VCS information
+                between runs.  The "inprocess" backend performs all
+                operations within the hh process, which has less
+                overhead for a single run but no VCS information is
+                retained for subsequent runs.''')
+    parser.add_argument(
+        '--bcgen-engine', default='prolog', choices=bcgen_engines,
+        dest='bcgen_engine',
+        help='''Engine used to generate the build configurations.  The
+                "prolog" engine (the default) runs the build
+                configuration logic in swipl.  The "native" engine
+                computes the same build configurations directly in
+                Python.  The "compare" engine runs both and fails if
+                the results differ.''')
+    parser.add_argument(
+        '--report-engine', default='prolog', choices=report_engines,
+        dest='report_engine',
+        help='''Engine used for the analysis and reporting.  The "prolog"
+                engine (the default) runs the analysis logic in swipl.
+                The "native" engine computes the same report directly
+                in Python (if the Reporting logic consists only of
+                facts; otherwise the prolog engine is used).  The
+                "compare" engine runs both and fails if the results
+                differ.''')
+    parser.add_argument(
+        '--partition-analysis', dest='partition_analysis', action='store_true',
+        help='''Experimental: when reporting on multiple projects (-C),
+                run the logic analysis separately (and concurrently)
+                for each project and merge the results, instead of a
+                single analysis of all of the projects.''')
     parser.add_argument(
         '--stop-daemon', '-S', dest="stopdaemon", action='store_true',
         help='''Stop daemon processes on exit.  Normally Briareus leaves daemon
@@ -421,7 +728,15 @@ def main():
     args = parser.parse_args()
     params = Params(verbose=args.verbose,
                     up_to=args.up_to,
-                    report_file=args.report)
+                    report_file=args.report,
+                    lazy_variables=args.lazy_variables,
+                    only=Selection(projects=args.only_projects,
+                                   branches=args.only_branches,
+                                   pullreqs=args.only_pullreqs) or None,
+                    backend=args.backend,
+                    bcgen_engine=args.bcgen_engine,
+                    report_engine=args.report_engine,
+                    partition_analysis=args.partition_analysis)
     if args.cfginput:
         if args.builder_url or args.builder_conf or \
            args.input_url_and_path or args.OUTPUT:
@@ -2,9 +2,11 @@
 #! nix-shell -i "python3.7 -u" -p "python37.withPackages(pp: with pp; [  attrs ])"
 
 import argparse
-from Briareus.AnaRep.Prior import ( read_report_from )
+import sys
+from Briareus.AnaRep.Prior import ( read_report_from, iter_report_from )
 from Briareus.AnaRep.TextSummary import text_summary
 from Briareus.AnaRep.HTMLSummary import html_summary
+from Briareus.AnaRep.Export import ( select_entries, jsonl_export, csv_export )
 
 def text_formatter(repdata, _builder_url):
     lines = len(repdata)
@@ -16,10 +18,21 @@ def html_formatter(repdata, builder_url):
     print('HTML status from a', lines, ' line report')
     print(html_summary(repdata, builder_url))
 
+def jsonl_formatter(entries, _builder_url):
+    jsonl_export(entries, sys.stdout)
+
+def csv_formatter(entries, _builder_url):
+    csv_export(entries, sys.stdout)
+
 def main():
     supported_formats = { 'text': text_formatter,
                           'html': html_formatter,
+                          'jsonl': jsonl_formatter,
+                          'csv': csv_formatter,
     }
+    # These formats process each report entry as it is read instead
+    # of reading the whole report first.
+    streaming_formats = [ 'jsonl', 'csv' ]
 
     parser = argparse.ArgumentParser(
         description='Show status output from Briareus build report.',
@@ -37,12 +50,27 @@ def main():
         "  If not specified, no links will be generated.")
     # TBD: should -U come from the inp_configs as well Should it
     # specify the type of builder (like hh.py)?
+    parser.add_argument(
+        '--project', '-p', action='append', default=[],
+        help='Only show the status for this project (may be repeated)')
+    parser.add_argument(
+        '--status', '-s', action='append', default=[],
+        help=('Only show builds with this status (may be repeated).  The status may be'
+              ' a report status (e.g. "succeeded", "bad_config", or a failure count)'
+              ' or a result: "ok", "FAIL", "badcfg", or "pending".'))
     parser.add_argument(
         'INPUT_REPORT', type=argparse.FileType('r'),
         help="Briareus report file used as input (use '-' to read from stdin).")
     args = parser.parse_args()
 
-    repdata = read_report_from(args.INPUT_REPORT)
+    if args.format in streaming_formats:
+        repdata = iter_report_from(args.INPUT_REPORT)
+    else:
+        repdata = read_report_from(args.INPUT_REPORT)
+    if args.project or args.status:
+        repdata = select_entries(repdata or [], args.project, args.status)
+        if args.format not in streaming_formats:
+            repdata = list(repdata)
     supported_formats[args.format](repdata, args.builder_url)
 
 if __name__ == "__main__":
@@ -0,0 +1,120 @@
+"""Times the encoding and decoding of the GatheredInfo response for a
+synthetic project with the VCS message codec.
+
+Usage:
+
+    python bench/bench_codec.py --repos 20 --submodules 10 --pullreqs 2000
+
+The GatheredInfo is obtained by running the VCS gathering for the
+SyntheticProject with the in-process backend.  Each codec is timed for
+a round trip (encode then decode) of that GatheredInfo, and the
+original JSON codec (the eval-based implementation that the registry
+codec replaced) is included for comparison.  The msgpack codec is only
+timed if the msgpack module is available.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import attr
+from datetime import timedelta
+from thespian.actors import ActorExitRequest
+from Briareus.Backend import InProcessActorSystem
+import Briareus.Input.Parser as Parser
+from Briareus.VCS.ManagedRepo import gather_repo_info
+import Briareus.VCS.InternalMessages as IM
+from synthetic import SyntheticProject, SyntheticGitInfo
+
+
+def original_toJSON(obj):
+    class objToJSON(json.JSONEncoder):
+        def default(self, obj):
+            if obj.__class__.__name__ in [ 'dict', 'list', 'int', 'float',
+                                           'str', 'bool', 'NoneType' ]:
+                return obj
+            if obj.__class__.__name__ in ['set', 'tuple']:
+                return { '__type__': obj.__class__.__name__,
+                         '__value__': [self.default(e) for e in obj]
+                }
+            objdict = attr.asdict(obj, recurse=False)
+            objdict['__type__'] = obj.__class__.__name__
+            return objdict
+    return json.dumps(obj, cls=objToJSON)
+
+def original_fromJSON(jstr):
+    def objFromJSON(objdict):
+        if '__type__' in objdict:
+            objtype = objdict['__type__']
+            if '__value__' in objdict:
+                return eval(objtype, vars(IM))(objdict['__value__'])
+            del objdict['__type__']
+            return eval(objtype, vars(IM))(**objdict)
+        return objdict
+    return json.loads(jstr, object_hook=objFromJSON)
+
+
+def gathered_info(project):
+    asys = InProcessActorSystem()
+    try:
+        gitinfo = asys.createActor(SyntheticGitInfo, globalName="GetGitInfo")
+        assert asys.ask(gitinfo, project, timedelta(seconds=10)) == 'ok'
+        inp_desc = Parser.BISParser().parse(project.input_spec())
+        info = gather_repo_info(inp_desc.RL, inp_desc.RX, inp_desc.BL, actor_system=asys)
+        asys.ask(gitinfo, ActorExitRequest(), 1)
+    finally:
+        asys.shutdown()
+    return IM.GatheredInfo(info)
+
+
+def time_codec(encode, decode, msg, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        data = encode(msg)
+    t1 = time.perf_counter()
+    for _ in range(repeat):
+        rsp = decode(data)
+    t2 = time.perf_counter()
+    assert rsp == msg
+    return (t1 - t0) / repeat, (t2 - t1) / repeat, len(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the VCS message codecs on a synthetic GatheredInfo.',
+        prog='bench_codec')
+    defaults = SyntheticProject()
+    for field in ['repos', 'submodules', 'branches', 'pullreqs', 'seed']:
+        parser.add_argument('--' + field, type=int, default=getattr(defaults, field), dest=field,
+                            help='Synthetic project %s (default: %%(default)s)' % field)
+    parser.add_argument('--repeat', '-n', type=int, default=5,
+                        help='Number of round trips to average (default: %(default)s)')
+    args = parser.parse_args()
+
+    project = SyntheticProject(repos=args.repos, submodules=args.submodules,
+                               branches=args.branches, pullreqs=args.pullreqs,
+                               seed=args.seed)
+    msg = gathered_info(project)
+    print('GatheredInfo: %s' % ', '.join([ '%d %s' % (len(v), k)
+                                            for k, v in sorted(msg.info.items()) ]))
+    if IM.toJSON(msg) != original_toJSON(msg):
+        print('WARNING: JSON encoding differs from the original encoding')
+
+    codecs = [ ('original json', original_toJSON, original_fromJSON),
+               ('json', IM.toJSON, IM.fromJSON) ]
+    if IM.msgpack:
+        codecs.append(('msgpack', IM.toMsgpack, IM.fromMsgpack))
+    else:
+        print('msgpack not available; skipped')
+    for name, encode, decode in codecs:
+        enc, dec, size = time_codec(encode, decode, msg, args.repeat)
+        print('  %14s: encode %8.4fs  decode %8.4fs  %9d bytes' % (name, enc, dec, size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Times the repository information gather for a project from
+recorded forge traffic (see Briareus/VCS/ForgeArchive.py).
+
+Usage:
+
+    # Record the forge exchanges of a real gather (needs network access)
+    python bench/bench_gather.py --record archive_dir project.hhd
+
+    # Replay them (offline) with 60-100ms of latency per request
+    python bench/bench_gather.py --replay archive_dir --latency 0.06,0.04 \\
+                                 --runs 5 project.hhd
+
+The gather uses the actual GatherRepoInfo, GetGitInfo and GitRepoInfo
+actors and the RemoteGit__Info forge access (including pagination and
+the response cache), so the results reflect the complete gather path.
+Each run uses a new actor system, so the caches start empty; use
+--profile to write cProfile statistics for the last run.
+"""
+
+import argparse
+import cProfile
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from thespian.actors import ActorSystem
+import Briareus.Input.Operations as BInput
+from Briareus.VCS.ForgeArchive import RECORD_ENV, REPLAY_ENV, LATENCY_ENV
+
+
+def gather(input_spec):
+    "Runs the gather for the input_spec; returns the elapsed time and the repo_info"
+    asys = ActorSystem('simpleSystemBase', transientUnique=True)
+    try:
+        start = time.perf_counter()
+        _, repo_info = BInput.input_desc_and_VCS_info(input_spec, actor_system=asys)
+        return time.perf_counter() - start, repo_info
+    finally:
+        asys.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the repository information gather from recorded forge traffic.',
+        prog='bench_gather')
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument('--record', metavar='DIR',
+                      help='Record the forge exchanges of the gather to archives in DIR')
+    mode.add_argument('--replay', metavar='DIR',
+                      help='Replay the forge exchanges from the archives in DIR')
+    parser.add_argument('--latency', default='0',
+                        help='Replay latency in seconds, optionally followed by ",JITTER"'
+                        ' (default: %(default)s)')
+    parser.add_argument('--runs', type=int, default=1,
+                        help='Number of replayed gathers (default: %(default)s)')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='Write the cProfile statistics of the last run to FILE')
+    parser.add_argument('input_spec', help='The project input specification (.hhd) file')
+    args = parser.parse_args()
+
+    with open(args.input_spec) as inpf:
+        input_spec = inpf.read()
+    if args.record:
+        os.environ[RECORD_ENV] = args.record
+        runs = 1
+    else:
+        os.environ[REPLAY_ENV] = args.replay
+        os.environ[LATENCY_ENV] = args.latency
+        runs = args.runs
+
+    times = []
+    for run in range(runs):
+        profiler = cProfile.Profile() if args.profile and run == runs - 1 else None
+        if profiler:
+            profiler.enable()
+        elapsed, repo_info = gather(input_spec)
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+        times.append(elapsed)
+        print('run %d: %9.4fs  (%s)' % (run + 1, elapsed,
+                                         ', '.join([ '%s=%d' % (k, len(repo_info[k]))
+                                                     for k in sorted(repo_info) ])))
+    if len(times) > 1:
+        print('min %.4fs, mean %.4fs, max %.4fs' % (min(times), sum(times) / len(times), max(times)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Measures the memory used for the build configuration and report
+records of a synthetic project.
+
+Usage:
+
+    python bench/bench_memory.py --repos 20 --pullreqs 500 --variables 3
+
+The logic output text for the build configurations and the status
+reports of the SyntheticProject is generated directly (so swipl is not
+needed), and then each stage that creates the records is run: the
+eval of the build configurations and of the reports (as done for the
+logic results), and the writing and reading of the report file.  The
+peak memory allocated (per tracemalloc) during each stage and the
+size of the resulting records are shown, along with the maximum RSS
+of the process.
+"""
+
+import argparse
+import io
+import itertools
+import os
+import resource
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Briareus.Types import logic_result_expr
+from Briareus.AnaRep.Prior import read_report_from, write_report_output
+from synthetic import SyntheticProject
+
+
+def synthetic_logic_output(project):
+    """Returns the (bldcfgs, status_reports) logic output strings for
+       each requested branch and pull request branch of the
+       SyntheticProject, with each strategy and variable combination.
+    """
+    branches, pullreqs, _ = project.vcs_data()
+    pname = 'Synthetic'
+    repos = project.repo_names() + project.subrepo_names()
+    prbranches = sorted(set([ p.pullreq_branch for prs in pullreqs.values() for p in prs ]))
+    varcombs = list(itertools.product(*[ [ (v, 'v%d_%d' % (v, n)) for n in range(project.var_values) ]
+                                        for v in range(project.variables) ]))
+    bldcfgs = []
+    reports = []
+    for (brtype, branch) in ([ ('regular', b) for b in ['master'] + project.branch_names() ] +
+                             [ ('pullreq', b) for b in prbranches ]):
+        for strategy in [ 'standard', 'submodules', 'heads' ]:
+            for combo in varcombs:
+                vars = '[' + ','.join([ 'varvalue("%s","var%d","%s")' % (pname, v, val)
+                                        for (v, val) in combo ]) + ']'
+                blds = '[' + ','.join([ 'bld("%s","%s",project_primary,brr(%d))'
+                                        % (r, branch if branch in branches[r] else 'master', n)
+                                        for n, r in enumerate(repos) ]) + ']'
+                buildname = '-'.join([ ('PR-' if brtype == 'pullreq' else '') + branch + '.' + strategy ] +
+                                     [ val for (_, val) in combo ])
+                bldcfgs.append('bldcfg("%s",%s,"%s",%s,"desc",%s,%s)'
+                               % (pname, brtype, branch, strategy, blds, vars))
+                reports.append('status_report(succeeded,project("%s"),%s,%s,"%s","%s",%s)'
+                               % (pname, strategy, brtype, branch, buildname, vars))
+    return '[' + ',\n'.join(bldcfgs) + ']', '[' + ',\n'.join(reports) + ']'
+
+
+def measure(stage, fun, *args):
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    r = fun(*args)
+    current, peak = tracemalloc.get_traced_memory()
+    print('  %16s: peak %8.2f MiB, retained %8.2f MiB'
+          % (stage, (peak - base) / 1048576.0, (current - base) / 1048576.0))
+    return r
+
+
+def write_report(report):
+    repf = io.StringIO()
+    write_report_output(repf, report)
+    return repf.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure the memory used by the build configuration and report records.',
+        prog='bench_memory')
+    defaults = SyntheticProject()
+    for field in ['repos', 'submodules', 'branches', 'pullreqs', 'variables', 'var_values', 'seed']:
+        parser.add_argument('--' + field.replace('_', '-'), type=int,
+                            default=getattr(defaults, field), dest=field,
+                            help='Synthetic project %s (default: %%(default)s)' % field.replace('_', ' '))
+    args = parser.parse_args()
+    project = SyntheticProject(**dict([ (f, getattr(args, f))
+                                        for f in SyntheticProject().params() ]))
+
+    bldcfg_out, report_out = synthetic_logic_output(project)
+    tracemalloc.start()
+    bldcfgs = measure('eval bldcfgs', eval, bldcfg_out, globals(), logic_result_expr)
+    report = measure('eval reports', eval, report_out, globals(), logic_result_expr)
+    reptext = measure('write report', write_report, report)
+    measure('read report', read_report_from, io.StringIO(reptext))
+    tracemalloc.stop()
+    print('  %d build configurations, %d report entries, max RSS %.1f MiB'
+          % (len(bldcfgs), len(report),
+             resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0))
+
+
+if __name__ == "__main__":
+    main()
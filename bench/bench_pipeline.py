@@ -0,0 +1,209 @@
+"""Times each stage of the Briareus pipeline on a synthetic project.
+
+Usage:
+
+    python bench/bench_pipeline.py --repos 20 --submodules 10 --pullreqs 200
+
+Each run appends a JSON record (the git commit, the project shape,
+and the per-stage times in seconds) to the results file (default:
+bench_results.jsonl) so that runs on different commits can be compared
+with --compare, which shows the change relative to the most recent
+previous record for the same project shape.
+
+Stages that need the swipl executable are skipped (and the dependent
+stages with them) if it is not available.  With --bcgen-engine=native
+the build configurations are generated without swipl, and with
+--report-engine=native as well the analysis and reporting stages are
+also run without swipl.
+"""
+
+import argparse
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from thespian.actors import ActorSystem, ActorExitRequest
+import Briareus.AnaRep.Operations as AnaRep
+from Briareus.AnaRep.Prior import read_report_from, write_report_output
+from Briareus.AnaRep.TextSummary import text_summary
+from Briareus.AnaRep.HTMLSummary import html_summary
+import Briareus.BCGen.Generator as Generator
+import Briareus.BuildSys.Hydra as BldSys
+import Briareus.Input.Operations as BInput
+from Briareus.Logic.InpFacts import get_input_facts
+from synthetic import SyntheticProject, SyntheticGitInfo, synthetic_build_results
+
+
+class StageTimer(object):
+    def __init__(self, verbose=False):
+        self.times = {}
+        self.skipped = []
+        self.verbose = verbose
+
+    def run(self, stage, fun, *args, **kw):
+        t0 = time.perf_counter()
+        r = fun(*args, **kw)
+        self.times[stage] = time.perf_counter() - t0
+        if self.verbose:
+            print('%20s: %9.4fs' % (stage, self.times[stage]), file=sys.stderr)
+        return r
+
+    def skip(self, *stages):
+        self.skipped.extend(stages)
+
+
+def run_pipeline(project, timer, actor_system, lazy_variables=False, engine='prolog',
+                 report_engine='prolog'):
+    "Runs all pipeline stages for the SyntheticProject; returns the counts of things generated"
+    counts = {}
+    gitinfo = actor_system.createActor(SyntheticGitInfo, globalName="GetGitInfo")
+    assert actor_system.ask(gitinfo, project, timedelta(seconds=10)) == 'ok'
+    try:
+        inp_desc, repo_info = timer.run('vcs_gather', BInput.input_desc_and_VCS_info,
+                                        project.input_spec(), actor_system=actor_system)
+    finally:
+        actor_system.ask(gitinfo, ActorExitRequest(), 1)
+    counts['pullreqs'] = len(repo_info['pullreqs'])
+    counts['branches'] = len(repo_info['branches'])
+    counts['submodules'] = len(repo_info['submodules'])
+
+    facts = timer.run('input_facts', get_input_facts,
+                      inp_desc.PNAME, inp_desc.RL, inp_desc.BL, inp_desc.VAR, repo_info,
+                      varfilter=inp_desc.VF)
+    counts['input_facts'] = len(facts)
+
+    analysis_stages = ['built_analysis', 'report_write', 'report_read',
+                       'text_summary', 'html_summary']
+    have_swipl = shutil.which('swipl')
+    if not have_swipl and engine != 'native':
+        timer.skip('build_config_logic', 'hydra_output', *analysis_stages)
+        return counts
+
+    gen = Generator.Generator(actor_system=actor_system, lazy_variables=lazy_variables,
+                              engine=engine)
+    rtype, build_cfgs = timer.run('build_config_logic', gen.generate_build_configs,
+                                  inp_desc, repo_info)
+    counts['build_configs'] = len(build_cfgs.cfg_build_configs)
+
+    builder = BldSys.HydraBuilder(None)
+    timer.run('hydra_output', builder.output_build_configurations, inp_desc, build_cfgs)
+    if not have_swipl and report_engine != 'native':
+        timer.skip(*analysis_stages)
+        return counts
+
+    builder._build_results = synthetic_build_results(build_cfgs.cfg_build_configs,
+                                                     seed=project.seed)
+    anarep = AnaRep.AnaRep(actor_system=actor_system, engine=report_engine)
+    report = timer.run('built_analysis', anarep.report_on,
+                       [AnaRep.ResultSet(builder, inp_desc, repo_info, build_cfgs)], None)
+    counts['report_entries'] = len(report[1])
+
+    repf = io.StringIO()
+    timer.run('report_write', write_report_output, repf, report[1])
+    repf.seek(0)
+    repdata = timer.run('report_read', read_report_from, repf)
+    timer.run('text_summary', text_summary, repdata)
+    timer.run('html_summary', html_summary, repdata)
+    return counts
+
+
+def git_commit():
+    try:
+        here = os.path.dirname(os.path.abspath(__file__))
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                         cwd=here, stderr=subprocess.DEVNULL).decode().strip()
+        dirty = subprocess.call(['git', 'diff', '--quiet', 'HEAD'],
+                                cwd=here, stderr=subprocess.DEVNULL) != 0
+        return commit + ('+dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def previous_record(results_file, params):
+    "Returns the most recent record in the results file for the same project parameters"
+    prev = None
+    if os.path.exists(results_file):
+        with open(results_file) as resf:
+            for line in resf:
+                if line.strip():
+                    rec = json.loads(line)
+                    if rec.get('params') == params:
+                        prev = rec
+    return prev
+
+
+def show_record(record, prev=None):
+    print('Briareus pipeline benchmark @ %s: %s' % (record['commit'],
+                                                   ', '.join([ '%s=%s' % kv for kv in
+                                                               sorted(record['params'].items()) ])))
+    print('  counts: %s' % ', '.join([ '%s=%s' % kv for kv in sorted(record['counts'].items()) ]))
+    for stage, secs in record['stages'].items():
+        delta = ''
+        if prev and stage in prev['stages'] and prev['stages'][stage]:
+            delta = '  (%+.1f%% vs %s)' % (100.0 * (secs - prev['stages'][stage]) / prev['stages'][stage],
+                                          prev['commit'])
+        print('  %20s: %9.4fs%s' % (stage, secs, delta))
+    for stage in record['skipped']:
+        print('  %20s: skipped' % stage)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the Briareus pipeline stages on a synthetic project.',
+        prog='bench_pipeline')
+    defaults = SyntheticProject()
+    for field in ['repos', 'submodules', 'branches', 'pullreqs', 'variables', 'var_values', 'seed']:
+        parser.add_argument('--' + field.replace('_', '-'), type=int,
+                            default=getattr(defaults, field), dest=field,
+                            help='Synthetic project %s (default: %%(default)s)' % field.replace('_', ' '))
+    parser.add_argument('--results', '-r', default='bench_results.jsonl',
+                        help='File to append the benchmark results to (default: %(default)s)')
+    parser.add_argument('--no-record', action='store_true',
+                        help='Do not append these results to the results file')
+    parser.add_argument('--compare', '-c', action='store_true',
+                        help='Compare with the previous results for the same project shape')
+    parser.add_argument('--lazy-variables', action='store_true',
+                        help='Expand variable combinations after the build config logic')
+    parser.add_argument('--bcgen-engine', default='prolog', choices=Generator.engines,
+                        help='Build configuration engine (default: %(default)s)')
+    parser.add_argument('--report-engine', default='prolog', choices=AnaRep.engines,
+                        help='Analysis and reporting engine (default: %(default)s)')
+    parser.add_argument('--verbose', '-v', action='store_true')
+    args = parser.parse_args()
+
+    project = SyntheticProject(**dict([ (f, getattr(args, f))
+                                        for f in SyntheticProject().params() ]))
+    timer = StageTimer(verbose=args.verbose)
+    asys = ActorSystem('simpleSystemBase', transientUnique=True)
+    try:
+        counts = run_pipeline(project, timer, asys, lazy_variables=args.lazy_variables,
+                              engine=args.bcgen_engine, report_engine=args.report_engine)
+    finally:
+        asys.shutdown()
+
+    record = { 'commit': git_commit(),
+               'when': datetime.now().isoformat(),
+               'params': dict(project.params(), lazy_variables=args.lazy_variables,
+                              bcgen_engine=args.bcgen_engine,
+                              report_engine=args.report_engine),
+               'counts': counts,
+               'stages': timer.times,
+               'skipped': timer.skipped,
+    }
+    prev = previous_record(args.results, record['params']) if args.compare else None
+    show_record(record, prev)
+    if not args.no_record:
+        with open(args.results, 'a') as resf:
+            resf.write(json.dumps(record) + '\n')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Synthetic project generators for benchmarking Briareus.
+
+A SyntheticProject describes a project shape (number of repos,
+submodules, branches, pull requests, and variables) and
+deterministically generates (from its seed) the Briareus input
+specification along with all of the VCS information that the
+SyntheticGitInfo actor will return in place of the real GetGitInfo
+actor.  This is the same approach used by the mocked GitExample actors
+in the test directory, but scaled up and parameterized.
+"""
+
+import attr
+import random
+from thespian.actors import *
+from Briareus.VCS.InternalMessages import *
+
+
+@attr.s(frozen=True)
+class SyntheticProject(object):
+    repos = attr.ib(default=5)        # repos listed in the input spec (first is the project repo)
+    submodules = attr.ib(default=3)   # additional repos only found via .gitmodules
+    branches = attr.ib(default=3)     # requested branches ("Branches" in the input spec)
+    pullreqs = attr.ib(default=10)    # total pull requests across all repos
+    variables = attr.ib(default=2)    # number of variables
+    var_values = attr.ib(default=3)   # number of values per variable
+    seed = attr.ib(default=1)
+
+    def params(self):
+        return attr.asdict(self)
+
+    def repo_names(self):
+        return [ 'R%d' % n for n in range(self.repos) ]
+
+    def subrepo_names(self):
+        return [ 'S%d' % n for n in range(self.submodules) ]
+
+    def branch_names(self):
+        return [ 'feat%d' % n for n in range(self.branches) ]
+
+    def input_spec(self):
+        return repr({
+            'Repos': [ (r, self.repo_url(r)) for r in self.repo_names() ],
+            'Name': 'Synthetic',
+            'Branches': [ 'master' ] + self.branch_names(),
+            'Variables': dict([ ('var%d' % v, [ 'v%d_%d' % (v, n)
+                                                for n in range(self.var_values) ])
+                                for v in range(self.variables) ]),
+        })
+
+    @staticmethod
+    def repo_url(reponame):
+        return 'https://synthetic.forge/synth/%s' % reponame
+
+    def vcs_data(self):
+        """Returns the (branches, pullreqs, gitmodules) dictionaries that the
+           SyntheticGitInfo actor serves.  All values are generated
+           from the seed, so the same SyntheticProject always
+           describes the same VCS state.
+        """
+        rng = random.Random(self.seed)
+        all_repos = self.repo_names() + self.subrepo_names()
+        pr_branch_pool = (self.branch_names() +
+                          [ 'fix%d' % n for n in range(max(1, self.pullreqs // 3)) ])
+        branches = dict([ (r, set(['master'] +
+                                  [ b for b in pr_branch_pool if rng.random() < 0.3 ]))
+                          for r in all_repos ])
+        pullreqs = dict([ (r, []) for r in all_repos ])
+        for n in range(self.pullreqs):
+            repo = rng.choice(all_repos)
+            branch = 'master' if rng.random() < 0.1 else rng.choice(pr_branch_pool)
+            user = 'user%d' % rng.randrange(max(1, self.pullreqs // 2))
+            pullreqs[repo].append(
+                PullReqInfo(str(n + 1),
+                            pullreq_title='synthetic change %d' % (n + 1),
+                            pullreq_srcurl='https://synthetic.forge/%s/%s' % (user, repo),
+                            pullreq_branch=branch,
+                            pullreq_ref='%s_pr%d_ref' % (repo, n + 1),
+                            pullreq_user=user,
+                            pullreq_email='%s@synthetic.dev' % user))
+        project = self.repo_names()[0] if self.repos else None
+        gitmodules = {}
+        if project:
+            project_branches = (sorted(branches[project]) +
+                                sorted(set([ p.pullreq_branch for p in pullreqs[project] ])))
+            for b in project_branches:
+                gitmodules[b] = [ SubRepoVers(s, self.repo_url(s), '%s_%s_ref%d' % (s, b, rng.randrange(100)))
+                                  for s in self.subrepo_names() ]
+        return branches, pullreqs, gitmodules
+
+
+class SyntheticGitInfo(ActorTypeDispatcher):
+    """Replaces the GetGitInfo actor (via the "GetGitInfo" globalName) to
+       serve the VCS information for a SyntheticProject.  The
+       SyntheticProject must be sent to this actor before any requests
+       are made.
+    """
+    def __init__(self, *args, **kw):
+        super(SyntheticGitInfo, self).__init__(*args, **kw)
+        self.branches, self.pullreqs, self.gitmodules = {}, {}, {}
+
+    def receiveMsg_SyntheticProject(self, msg, sender):
+        self.branches, self.pullreqs, self.gitmodules = msg.vcs_data()
+        self.send(sender, 'ok')
+
+    def receiveMsg_DeclareRepo(self, msg, sender):
+        self.send(sender, RepoDeclared(msg.reponame))
+
+    def receiveMsg_GetPullReqs(self, msg, sender):
+        self.send(sender, PullReqsData(msg.reponame, list(self.pullreqs.get(msg.reponame, []))))
+
+    def receiveMsg_HasBranch(self, msg, sender):
+        known = sorted(self.branches.get(msg.reponame, []))
+        self.send(sender, BranchPresent(msg.reponame, msg.branch_name,
+                                        msg.branch_name in known,
+                                        known_branches=known))
+
+    def receiveMsg_GitmodulesData(self, msg, sender):
+        self.send(sender, GitmodulesRepoVers(msg.reponame, msg.branch_name, msg.pullreq_id,
+                                             self.gitmodules.get(msg.branch_name, [])))
+
+    def receiveMsg_Repo_AltLoc_ReqMsg(self, msg, sender):
+        self.receiveMessage(msg.altloc_reqmsg, sender)
+
+
+def synthetic_build_results(bldcfgs, seed=1, buildname=None):
+    """Generates Hydra /api/jobsets style results for the build
+       configurations, with a seeded mixture of successes, failures,
+       pending builds, and configuration errors.
+    """
+    from Briareus.BuildSys import buildcfg_name
+    buildname = buildname or buildcfg_name
+    rng = random.Random(seed)
+    results = []
+    for cfg in bldcfgs:
+        outcome = rng.random()
+        total = rng.randrange(1, 20)
+        failed = 0 if outcome < 0.6 else rng.randrange(1, total + 1)
+        scheduled = 0 if outcome < 0.85 else rng.randrange(1, total + 1)
+        results.append({ "name": buildname(cfg),
+                         "nrtotal": total,
+                         "nrsucceeded": total - failed,
+                         "nrfailed": failed,
+                         "nrscheduled": scheduled,
+                         "haserrormsg": outcome > 0.97,
+                         "fetcherrormsg": '',
+        })
+    return results
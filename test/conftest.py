@@ -13,6 +13,31 @@ from Briareus.Logic.Evaluation import (Fact, DeclareFact)
 import Briareus.hh as hh
 
 
+def pytest_addoption(parser):
+    parser.addoption('--bcgen-engine', default='prolog', choices=Generator.engines,
+                     help="""Build configuration engine for the tests; "compare"
+                             checks the native engine results against
+                             the prolog engine results.""")
+    parser.addoption('--report-engine', default='prolog', choices=AnaRep.engines,
+                     help="""Analysis and reporting engine for the tests;
+                             "compare" checks the native engine results
+                             against the prolog engine results.""")
+    parser.addoption('--partition-analysis', action='store_true',
+                     help="""Partition the multi-project analysis by
+                             project for the tests.""")
+
+@pytest.fixture(scope="session")
+def partition_analysis(request):
+    return request.config.getoption('--partition-analysis')
+
+@pytest.fixture(scope="session")
+def bcgen_engine(request):
+    return request.config.getoption('--bcgen-engine')
+
+@pytest.fixture(scope="session")
+def report_engine(request):
+    return request.config.getoption('--report-engine')
+
 @pytest.fixture(scope="module")
 def actor_system():
     asys = ActorSystem('simpleSystemBase', transientUnique=True)
@@ -57,20 +82,23 @@ def generated_inp_config_facts(actor_system, testing_dir, inp_configs):
     return result
 
 @pytest.fixture(scope="module")
-def generated_bldconfigs(actor_system, generated_repo_info):
+def generated_bldconfigs(actor_system, generated_repo_info, bcgen_engine):
     "Generate build configs from a single configuration"
     inp, repo_info = generated_repo_info
-    gen = Generator.Generator(actor_system=actor_system, verbose=True)
+    gen = Generator.Generator(actor_system=actor_system, verbose=True,
+                              engine=bcgen_engine)
     (rtype, cfgs) = gen.generate_build_configs(inp, repo_info)
     assert rtype == "build_configs"
     return cfgs
 
 @pytest.fixture(scope="module")
-def generated_inp_config_bldconfigs(actor_system, testing_dir, inp_configs, request):
+def generated_inp_config_bldconfigs(actor_system, testing_dir, inp_configs, request,
+                                    bcgen_engine):
     "Return bldconfigs from a list of (gitactor, outcfg_fname, InpConfig) inputs"
     starttime = datetime.now()
     params = hh.Params(verbose=True, up_to=hh.UpTo("builder_configs"),
-                       report_file=testing_dir.join("testreport_bldcfgs.hhr"))
+                       report_file=testing_dir.join("testreport_bldcfgs.hhr"),
+                       bcgen_engine=bcgen_engine)
     result = hh.GenResult(actor_system=actor_system)
     for git, outf, inpcfg in inp_configs:
         # Generate canned info instead of actually doing git operations
@@ -87,11 +115,13 @@ def generated_inp_config_bldconfigs(actor_system, testing_dir, inp_configs, requ
 
 
 @pytest.fixture(scope="module")
-def generated_hydra_builder_output(actor_system, generated_repo_info, request):
+def generated_hydra_builder_output(actor_system, generated_repo_info, request,
+                                   bcgen_engine):
     starttime = datetime.now()
     input_desc, repo_info = generated_repo_info
     builder = BldSys.HydraBuilder(None)
-    bcgen = BCGen.BCGen(builder, actor_system=actor_system, verbose=True)
+    bcgen = BCGen.BCGen(builder, actor_system=actor_system, verbose=True,
+                        engine=bcgen_engine)
     output = bcgen.generate(input_desc, repo_info)
     endtime = datetime.now()
     # This should be a proper test: checks the amount of time to run run the logic process.
@@ -100,12 +130,14 @@ def generated_hydra_builder_output(actor_system, generated_repo_info, request):
     return output
 
 @pytest.fixture(scope="module")
-def generate_hydra_results(actor_system, generated_repo_info, generated_hydra_builder_output, request):
+def generate_hydra_results(actor_system, generated_repo_info, generated_hydra_builder_output, request,
+                           report_engine):
     def _ghr(build_results, prior, reporting_logic_defs=''):
         starttime = datetime.now()
         inp_desc, repo_info = generated_repo_info
         builder_cfgs, build_cfgs = generated_hydra_builder_output
-        anarep = AnaRep.AnaRep(verbose=True, actor_system=actor_system)
+        anarep = AnaRep.AnaRep(verbose=True, actor_system=actor_system,
+                               engine=report_engine)
         # n.b. the name values for build_results come from
         # buildcfg_name, which is revealed by this print loop.
         builder = BldSys.HydraBuilder(None)
@@ -0,0 +1,183 @@
+import os
+import pytest
+import shutil
+import subprocess
+import threading
+from thespian.actors import *
+import Briareus.AnaRep.Operations as AnaRep
+import Briareus.BCGen.Operations as BCGen
+import Briareus.BuildSys.Hydra as BldSys
+import Briareus.Input.Operations as BInput
+from Briareus.Backend import (InProcessActorSystem, new_actor_system, is_inprocess,
+                              actor_system_for)
+from Briareus.Input.Description import RepoDesc, BranchDesc
+from Briareus.Logic.Evaluation import Fact, run_logic_analysis, run_logic_analyses
+from Briareus.VCS.InternalMessages import PRInfo
+from Briareus.VCS.ManagedRepo import gather_repo_info
+from test_single import GitTestSingle
+import test_example_results
+
+
+RL = [ RepoDesc('TheRepo', 'the_repo_url', project_repo=True) ]
+BL = [ BranchDesc('feat1'), BranchDesc('dev') ]
+
+def gathered(asys):
+    gitinfo = asys.createActor(GitTestSingle, globalName="GetGitInfo")
+    try:
+        return gather_repo_info(RL, [], BL, actor_system=asys)
+    finally:
+        asys.tell(gitinfo, ActorExitRequest())
+
+def test_inprocess_backend_selection():
+    asys = new_actor_system('inprocess')
+    try:
+        assert is_inprocess(asys)
+    finally:
+        asys.shutdown()
+    assert not is_inprocess(None)
+    with pytest.raises(ValueError):
+        new_actor_system('carrier_pigeon')
+
+def test_inprocess_actor_system_shutdown_after_run(monkeypatch):
+    shutdown = []
+    orig_shutdown = InProcessActorSystem.shutdown
+    monkeypatch.setattr(InProcessActorSystem, 'shutdown',
+                        lambda self: shutdown.append(self) or orig_shutdown(self))
+    with pytest.raises(ValueError):
+        with actor_system_for('inprocess') as asys:
+            assert is_inprocess(asys)
+            raise ValueError('failed run')
+    assert shutdown == [ asys ]
+
+def test_inprocess_gather_matches_json_messaging():
+    asys = InProcessActorSystem()
+    try:
+        direct = gathered(asys)
+    finally:
+        asys.shutdown()
+    asys = ActorSystem('simpleSystemBase', transientUnique=True)
+    try:
+        viajson = gathered(asys)
+    finally:
+        asys.shutdown()
+    assert direct == viajson
+    assert set(['134', '91']) == set([ p.pr_ident for p in direct['pullreqs'] ])
+    assert all([ isinstance(p, PRInfo) for p in direct['pullreqs'] ])
+    assert ('TheRepo', 'feat1') in direct['branches']
+
+def test_inprocess_logic_runs_swipl_directly(tmp_path, monkeypatch):
+    swipl = tmp_path / 'swipl'
+    swipl.write_text('#!/bin/sh\n'
+                     'echo "[bldcfg(facts_from, \\"$2\\")]"\n'
+                     'echo "note: no problem" >&2\n')
+    swipl.chmod(0o755)
+    monkeypatch.setenv('PATH', str(tmp_path) + os.pathsep + os.environ['PATH'])
+    asys = InProcessActorSystem()
+    try:
+        r = run_logic_analysis('build_config', [ Fact('branch("R1", "master")') ],
+                               actor_system=asys)
+    finally:
+        asys.shutdown()
+    assert r.startswith('[bldcfg(facts_from, "')
+    assert r.endswith('.pl")]')
+
+def test_inprocess_logic_facts_streamed_on_stdin(tmp_path, monkeypatch):
+    swipl = tmp_path / 'swipl'
+    swipl.write_text('#!/bin/sh\n'
+                     'echo "$2"\n'
+                     'cat\n')
+    swipl.chmod(0o755)
+    monkeypatch.setenv('PATH', str(tmp_path) + os.pathsep + os.environ['PATH'])
+    asys = InProcessActorSystem()
+    facts = [ Fact('branch("R%d", "master")' % n) for n in range(20000) ]
+    try:
+        r = run_logic_analysis('build_config', facts, raw_logic='done.',
+                               actor_system=asys)
+    finally:
+        asys.shutdown()
+    lines = r.split('\n')
+    assert lines[0].endswith('stream_facts.pl')
+    assert lines[1:] == [ str(f) for f in facts ] + [ 'done.' ]
+
+def test_inprocess_logic_swipl_stopped_on_fact_failure(tmp_path, monkeypatch):
+    swipl = tmp_path / 'swipl'
+    swipl.write_text('#!/bin/sh\n'
+                     'cat\n')
+    swipl.chmod(0o755)
+    monkeypatch.setenv('PATH', str(tmp_path) + os.pathsep + os.environ['PATH'])
+    procs = []
+    popen = subprocess.Popen
+    monkeypatch.setattr(subprocess, 'Popen',
+                        lambda *args, **kw: procs.append(popen(*args, **kw)) or procs[-1])
+    def facts():
+        yield Fact('branch("R1", "master")')
+        raise ValueError('bad fact')
+    threads = threading.active_count()
+    asys = InProcessActorSystem()
+    try:
+        with pytest.raises(ValueError, match='bad fact'):
+            run_logic_analysis('build_config', facts(), actor_system=asys)
+    finally:
+        asys.shutdown()
+    assert procs[0].returncode is not None
+    assert threading.active_count() == threads
+
+@pytest.mark.skipif(not shutil.which('swipl'), reason='requires swipl')
+def test_inprocess_logic_with_swipl():
+    "swipl loads the facts for build_config and built_analysis from its stdin"
+    asys = InProcessActorSystem()
+    try:
+        asys.createActor(test_example_results.gitactor, globalName='GetGitInfo')
+        inp_desc, repo_info = BInput.input_desc_and_VCS_info(
+            test_example_results.input_spec, actor_system=asys)
+        builder = BldSys.HydraBuilder(None)
+        builder._build_results = test_example_results.build_results
+        # The compare engines fail if the swipl results differ from
+        # the native engine results.
+        _, build_cfgs = BCGen.BCGen(builder, actor_system=asys,
+                                    engine='compare').generate(inp_desc, repo_info)
+        report = AnaRep.AnaRep(actor_system=asys, engine='compare').report_on(
+            [ AnaRep.ResultSet(builder, inp_desc, repo_info, build_cfgs) ],
+            test_example_results.prior)
+    finally:
+        asys.shutdown()
+    assert build_cfgs.cfg_build_configs
+    assert report[0] == 'report'
+    assert len(report[1]) > 1
+
+def test_inprocess_logic_analyses_results_in_order(tmp_path, monkeypatch):
+    swipl = tmp_path / 'swipl'
+    swipl.write_text('#!/bin/sh\n'
+                     'cat\n')
+    swipl.chmod(0o755)
+    monkeypatch.setenv('PATH', str(tmp_path) + os.pathsep + os.environ['PATH'])
+    asys = InProcessActorSystem()
+    fact_sets = [ [ Fact('project("P%d", "R%d")' % (n, n)) ] for n in range(7) ]
+    try:
+        rs = run_logic_analyses('partition_analysis', fact_sets, actor_system=asys,
+                                max_workers=3)
+    finally:
+        asys.shutdown()
+    assert rs == [ 'project("P%d", "R%d").' % (n, n) for n in range(7) ]
+
+
+class LateReply(ActorTypeDispatcher):
+    def receiveMsg_str(self, msg, sender):
+        self.send(sender, 'late reply to ' + msg)
+
+def test_actor_logic_analyses_ignore_other_messages(tmp_path, monkeypatch):
+    swipl = tmp_path / 'swipl'
+    swipl.write_text('#!/bin/sh\n'
+                     'head -n 1\n')  # RunCommand leaves stdin open here
+    swipl.chmod(0o755)
+    monkeypatch.setenv('PATH', str(tmp_path) + os.pathsep + os.environ['PATH'])
+    asys = ActorSystem('simpleSystemBase', transientUnique=True)
+    fact_sets = [ [ Fact('project("P%d", "R%d")' % (n, n)) ] for n in range(3) ]
+    try:
+        # e.g. the response to an earlier ask that timed out
+        asys.tell(asys.createActor(LateReply), 'an earlier request')
+        rs = run_logic_analyses('partition_analysis', fact_sets, actor_system=asys,
+                                max_workers=2)
+    finally:
+        asys.shutdown()
+    assert rs == [ 'project("P%d", "R%d").' % (n, n) for n in range(3) ]
@@ -0,0 +1,41 @@
+import json
+import pytest
+from Briareus.Input.Description import RepoDesc, RepoLoc, BranchDesc
+from Briareus.VCS.InternalMessages import *
+
+
+gathered = GatheredInfo({
+    'pullreqs': set([ PRInfo('R1', 'r1_fork_url', 'b1', '7', 'b1 changes', 'frog', '') ]),
+    'submodules': set([ SubModuleInfo('R1', 'master', None, 'R2', 'r2_ref') ]),
+    'subrepos': set([ RepoDesc('R2', 'r2_url', 'master', False) ]),
+    'branches': set([ ('R1', 'master'), ('R2', 'b1') ]),
+})
+
+def test_json_roundtrip():
+    assert fromJSON(toJSON(gathered)) == gathered
+    req = GatherInfo([ RepoDesc('R1', 'r1_url', project_repo=True) ],
+                     [ RepoLoc('git@r1', 'https://r1') ],
+                     [ BranchDesc('b1') ])
+    assert fromJSON(toJSON(req)) == req
+
+def test_json_encoding():
+    assert json.loads(toJSON(GatheredInfo({ 'branches': set([ ('R1', 'master') ]) }))) == {
+        '__type__': 'GatheredInfo',
+        'error': None,
+        'info': { 'branches': { '__type__': 'set',
+                                '__value__': [ { '__type__': 'tuple',
+                                                 '__value__': [ 'R1', 'master' ] } ] } },
+        'stale_repos': [],
+    }
+    assert toJSON(HasBranch('R1', 'b1', gather_id=3)) == \
+        '{"reponame": "R1", "gather_id": 3, "branch_name": "b1", "__type__": "HasBranch"}'
+
+def test_json_unknown_types():
+    with pytest.raises(TypeError):
+        toJSON(GatheredInfo({ 'x': object() }))
+    with pytest.raises(ValueError):
+        fromJSON('{"__type__": "os.system", "command": "true"}')
+
+def test_msgpack_roundtrip():
+    pytest.importorskip('msgpack')
+    assert fromMsgpack(toMsgpack(gathered)) == gathered
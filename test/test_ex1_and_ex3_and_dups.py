@@ -144,10 +144,12 @@ def test_exampledups_bldcfg_count(generated_inp_config_bldconfigs):
 # n.b to see builder (hydra) jobset names, see test_example_bldcfg_count above
 
 @pytest.fixture(scope="module")
-def example_empty_report(testing_dir, generated_inp_config_bldconfigs):
+def example_empty_report(testing_dir, generated_inp_config_bldconfigs, report_engine,
+                         partition_analysis):
     for each in generated_inp_config_bldconfigs.result_sets:
         each.builder._build_results = []
-    return generate_report(testing_dir, generated_inp_config_bldconfigs, [])
+    return generate_report(testing_dir, report_engine, partition_analysis,
+                           generated_inp_config_bldconfigs, [])
 
 
 def test_example_empty_report_summary(example_empty_report):
@@ -183,14 +185,16 @@ def make_fail(bldres):
     return new_bldres
 
 @pytest.fixture(scope="module")
-def all_failed_report(testing_dir, generated_inp_config_bldconfigs):
+def all_failed_report(testing_dir, generated_inp_config_bldconfigs, report_engine,
+                      partition_analysis):
     for each in generated_inp_config_bldconfigs.result_sets:
         each.builder._build_results = {
             "R1": [make_fail(r) for r in texres.build_results],
             "R10": [make_fail(r) for r in tex3.build_results],
             "Repo1": [make_fail(r) for r in tdups.build_results],
         }[[R.repo_name for R in each.inp_desc.RL if R.project_repo][0]]
-    return generate_report(testing_dir, generated_inp_config_bldconfigs, [])
+    return generate_report(testing_dir, report_engine, partition_analysis,
+                           generated_inp_config_bldconfigs, [])
 
 def test_example_fail_report_complete_failures(all_failed_report):
     reps = all_failed_report
@@ -202,18 +206,23 @@ def test_example_fail_report_complete_failures(all_failed_report):
 # ----------------------------------------
 
 @pytest.fixture(scope="module")
-def example_report(testing_dir, generated_inp_config_bldconfigs):
+def example_report(testing_dir, generated_inp_config_bldconfigs, report_engine,
+                   partition_analysis):
     for each in generated_inp_config_bldconfigs.result_sets:
         each.builder._build_results = {
             "R1": texres.build_results,
             "R10": [],
             "Repo1": tdups.build_results,
         }[[R.repo_name for R in each.inp_desc.RL if R.project_repo][0]]
-    return generate_report(testing_dir, generated_inp_config_bldconfigs, tdups.prior + texres.prior)
+    return generate_report(testing_dir, report_engine, partition_analysis,
+                           generated_inp_config_bldconfigs, tdups.prior + texres.prior)
 
-def generate_report(testdir, inp_config_bldconfigs, prior, reporting_logic_defs=''):
+def generate_report(testdir, report_engine, partition_analysis, inp_config_bldconfigs,
+                    prior, reporting_logic_defs=''):
     params = hh.Params(verbose=True, up_to=None,
-                       report_file=testdir.join("ex1_ex3_dups.hhr"))
+                       report_file=testdir.join("ex1_ex3_dups.hhr"),
+                       report_engine=report_engine,
+                       partition_analysis=partition_analysis)
     starttime = datetime.now()
     rep = hh.run_hh_report(params, inp_config_bldconfigs, prior,
                            reporting_logic_defs=reporting_logic_defs)
@@ -261,7 +270,8 @@ def test_example_report_do_list(example_report):
                                          params='master'),
                      sent_to=[]) in reps
 
-def test_example_report_do_list_wwb(testing_dir, generated_inp_config_bldconfigs):
+def test_example_report_do_list_wwb(testing_dir, generated_inp_config_bldconfigs, report_engine,
+                                    partition_analysis):
     "Demonstrate that email whitelists and blacklists can be combined"
     for each in generated_inp_config_bldconfigs.result_sets:
         each.builder._build_results = {
@@ -269,7 +279,8 @@ def test_example_report_do_list_wwb(testing_dir, generated_inp_config_bldconfigs
             "R10": [],
             "Repo1": tdups.build_results,
         }[[R.repo_name for R in each.inp_desc.RL if R.project_repo][0]]
-    reps = generate_report(testing_dir, generated_inp_config_bldconfigs,
+    reps = generate_report(testing_dir, report_engine, partition_analysis,
+                           generated_inp_config_bldconfigs,
                            tdups.prior + texres.prior + [
                                SendEmail(recipients=['fred@nocompany.com'],
                                          notification=Notify(what='variable_failing',
@@ -316,7 +327,8 @@ def test_example_report_do_list_wwb(testing_dir, generated_inp_config_bldconfigs
                                          params='master'),
                      sent_to=[]) in reps
 
-def test_example_report_do_list_w(testing_dir, generated_inp_config_bldconfigs):
+def test_example_report_do_list_w(testing_dir, generated_inp_config_bldconfigs, report_engine,
+                                  partition_analysis):
     "Check email whitelist auto-disable all and only allow whitelisted."
     for each in generated_inp_config_bldconfigs.result_sets:
         each.builder._build_results = {
@@ -324,7 +336,8 @@ def test_example_report_do_list_w(testing_dir, generated_inp_config_bldconfigs):
             "R10": [],
             "Repo1": tdups.build_results,
         }[[R.repo_name for R in each.inp_desc.RL if R.project_repo][0]]
-    reps = generate_report(testing_dir, generated_inp_config_bldconfigs,
+    reps = generate_report(testing_dir, report_engine, partition_analysis,
+                           generated_inp_config_bldconfigs,
                            tdups.prior + texres.prior,
                            reporting_logic_defs='''
                              email_domain_whitelist("_company.com").
@@ -344,7 +357,8 @@ def test_example_report_do_list_w(testing_dir, generated_inp_config_bldconfigs):
                                          params=BldVariable(project='Project #1', varname='c_compiler', varvalue='clang')),
                      sent_to=[]) in reps
 
-def test_example_report_do_list_b(testing_dir, generated_inp_config_bldconfigs):
+def test_example_report_do_list_b(testing_dir, generated_inp_config_bldconfigs, report_engine,
+                                  partition_analysis):
     "Check email blacklist only disables blacklisted."
     for each in generated_inp_config_bldconfigs.result_sets:
         each.builder._build_results = {
@@ -352,7 +366,8 @@ def test_example_report_do_list_b(testing_dir, generated_inp_config_bldconfigs):
             "R10": [],
             "Repo1": tdups.build_results,
         }[[R.repo_name for R in each.inp_desc.RL if R.project_repo][0]]
-    reps = generate_report(testing_dir, generated_inp_config_bldconfigs,
+    reps = generate_report(testing_dir, report_engine, partition_analysis,
+                           generated_inp_config_bldconfigs,
                            tdups.prior + texres.prior,
                            reporting_logic_defs='''
                              email_domain_blacklist("not_a_company.com").
@@ -384,7 +399,8 @@ def test_example_report_do_list_b(testing_dir, generated_inp_config_bldconfigs):
                                          params='master'),
                      sent_to=[]) in reps
 
-def test_example_report_do_list_userb(testing_dir, generated_inp_config_bldconfigs):
+def test_example_report_do_list_userb(testing_dir, generated_inp_config_bldconfigs, report_engine,
+                                      partition_analysis):
     "Check email blacklist only disables blacklisted."
     for each in generated_inp_config_bldconfigs.result_sets:
         each.builder._build_results = {
@@ -392,7 +408,8 @@ def test_example_report_do_list_userb(testing_dir, generated_inp_config_bldconfi
             "R10": [],
             "Repo1": tdups.build_results,
         }[[R.repo_name for R in each.inp_desc.RL if R.project_repo][0]]
-    reps = generate_report(testing_dir, generated_inp_config_bldconfigs,
+    reps = generate_report(testing_dir, report_engine, partition_analysis,
+                           generated_inp_config_bldconfigs,
                            tdups.prior + texres.prior,
                            reporting_logic_defs='''
                              email_user_blacklist("fred@nocompany.com").
@@ -0,0 +1,60 @@
+from Briareus.AnaRep.Prior import read_report_from, iter_report_from, write_report_output
+from Briareus.AnaRep.Export import select_entries, jsonl_export, csv_export
+from Briareus.Types import *
+import io
+import json
+
+
+vars = [ BldVariable('proj', 'ghcver', 'ghc881') ]
+
+report = [
+    PendingStatus('proj', 'regular', 'pullreq', 'b1', 'PR1-b1.regular-ghc881', vars),
+    StatusReport('succeeded', 'proj', 'regular', 'pullreq', 'b1', 'PR1-b1.regular-ghc881', vars),
+    StatusReport(3, 'proj', 'HEADs', 'regular', 'master', 'master.HEADs-ghc881', vars),
+    StatusReport('bad_config', 'other', 'regular', 'regular', 'master', 'master.regular-ghc881', vars),
+    Notify('main_submodules_broken', 'proj', []),
+]
+
+def written_report():
+    repf = io.StringIO()
+    write_report_output(repf, report)
+    repf.seek(0)
+    return repf
+
+def test_iter_report_matches_read_report():
+    assert list(iter_report_from(written_report())) == read_report_from(written_report())
+
+def test_jsonl_export():
+    out = io.StringIO()
+    assert jsonl_export(iter_report_from(written_report()), out) == len(report)
+    recs = [ json.loads(l) for l in out.getvalue().splitlines() ]
+    assert recs[0]['type'] == 'PendingStatus'
+    assert recs[0]['result'] == 'pending'
+    assert recs[2] == { 'type': 'StatusReport',
+                        'project': 'proj',
+                        'status': 3,
+                        'result': 'FAIL',
+                        'branchtype': 'regular',
+                        'branch': 'master',
+                        'strategy': 'HEADs',
+                        'buildname': 'master.HEADs-ghc881',
+                        'variables': { 'ghcver': 'ghc881' },
+    }
+    assert recs[4]['type'] == 'Notify'
+    assert recs[4]['subject'] == 'proj'
+
+def test_csv_export():
+    out = io.StringIO()
+    assert csv_export(report, out) == 4
+    lines = out.getvalue().splitlines()
+    assert lines[0] == 'project,result,status,branchtype,branch,strategy,buildname,variables'
+    assert lines[3] == 'proj,FAIL,3,regular,master,HEADs,master.HEADs-ghc881,ghcver=ghc881'
+
+def test_select_by_project():
+    sel = list(select_entries(report, projects=['other']))
+    assert sel == [ report[3] ]
+
+def test_select_by_status_or_result():
+    assert list(select_entries(report, statuses=['FAIL', 'badcfg'])) == report[2:4]
+    assert list(select_entries(report, statuses=['3'])) == [ report[2] ]
+    assert list(select_entries(report, projects=['proj'], statuses=['pending'])) == [ report[0] ]
@@ -0,0 +1,29 @@
+from Briareus.Logic.Evaluation import (DeclareFact, Fact, fact_formatter,
+                                       fact_strings, varvalues_term)
+from Briareus.Types import BldVariable
+
+
+def test_fact_formatter():
+    submodule = fact_formatter('submodule', '"%s"', '%s', '"%s"', '"%s"', '"%s"')
+    assert submodule('R1', 'project_primary', 'master', 'R2', 'r2_ref') == \
+        Fact('submodule("R1", project_primary, "master", "R2", "r2_ref")')
+
+def test_fact_formatter_interned():
+    branch = fact_formatter('branch', '"%s"', '"%s"')
+    assert branch('R1', ''.join(['fe', 'at1'])).fact is \
+        branch('R1', ''.join(['fea', 't1'])).fact
+
+def test_varvalues_term():
+    vars = (BldVariable('P', 'c', 'gcc'), BldVariable('P', 'ghc', '881'))
+    assert varvalues_term('P', vars) == \
+        '[ varvalue("P", "c", "gcc"), varvalue("P", "ghc", "881") ]'
+    assert varvalues_term('P', vars) is varvalues_term('P', vars)
+    assert varvalues_term(None, ()) == '[  ]'
+
+def test_fact_strings_sorted_unique():
+    facts = [ Fact('branch("R1", "b1")'), DeclareFact('branch/2'),
+              Fact('branch("R1", "b")'), Fact('branch("R1", "b1")') ]
+    assert fact_strings(facts) == [ ':- discontiguous branch/2.',
+                                    'branch("R1", "b").',
+                                    'branch("R1", "b1").' ]
+    assert fact_strings(facts) == [ str(f) for f in sorted(set(facts), key=str) ]
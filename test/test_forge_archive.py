@@ -0,0 +1,117 @@
+from Briareus.VCS.ForgeArchive import (RECORD_ENV, REPLAY_ENV, LATENCY_ENV,
+                                       RecordingSession, ReplaySession, ReplayMissing,
+                                       archive_file, parse_latency, read_archive)
+from Briareus.VCS.Freshness import FreshnessPolicy
+from Briareus.VCS.GitRepo import GitHubInfo
+from Briareus.VCS.InternalMessages import RepoAPI_Location
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+import datetime
+import json
+import requests
+import time
+import pytest
+
+
+API = 'https://api.github.com/repos/o/r'
+BRANCHES = API + '/branches?per_page=100'
+
+class FakeForge(BaseAdapter):
+    "Transport adapter serving the branch pages, with an ETag for each"
+    def __init__(self):
+        super(FakeForge, self).__init__()
+        self.requested = []
+    def send(self, request, **kw):
+        self.requested.append(request.url)
+        rsp = requests.Response()
+        rsp.url = request.url
+        rsp.request = request
+        page = 2 if request.url.endswith('&page=2') else 1
+        etag = '"p%d"' % page
+        if request.headers.get('If-None-Match', None) == etag:
+            rsp.status_code = 304
+            rsp.headers = CaseInsensitiveDict({ 'ETag': etag })
+            rsp._content = b''
+            return rsp
+        rsp.status_code = 200
+        rsp.headers = CaseInsensitiveDict({ 'ETag': etag, 'Server': 'fake' })
+        if page == 1:
+            rsp.headers['Link'] = ('<%s&page=2>; rel="next", <%s&page=2>; rel="last"'
+                                   % (BRANCHES, BRANCHES))
+        rsp._content = json.dumps([ { 'name': 'b%d_%d' % (page, n), 'protected': False }
+                                    for n in range(3) ]).encode('utf-8')
+        return rsp
+    def close(self):
+        pass
+
+
+def ghinfo():
+    return GitHubInfo(RepoAPI_Location('https://github.com/o/r', None))
+
+def record(tmpdir):
+    gh = ghinfo()
+    gh._request_session = RecordingSession(archive_file(str(tmpdir), gh._url))
+    forge = FakeForge()
+    gh._request_session.mount('https://', forge)
+    names = [ b['name'] for b in gh.get_branches() ]
+    gh._freshness = FreshnessPolicy(rules=[], default=datetime.timedelta(0))
+    assert [ b['name'] for b in gh.get_branches() ] == names  # revalidated: 304s
+    return names, forge
+
+
+def test_record_compact_archive(tmpdir):
+    names, forge = record(tmpdir)
+    assert names == [ 'b%d_%d' % (p, n) for p in [1, 2] for n in range(3) ]
+    exchanges = read_archive(archive_file(str(tmpdir), API))
+    assert len(exchanges) == len(forge.requested) == 4
+    assert [ (e['status'], e['req']) for e in exchanges ][-2:] == \
+        [ (304, { 'If-None-Match': '"p1"' }), (304, { 'If-None-Match': '"p2"' }) ]
+    assert 'Server' not in exchanges[0]['headers']
+    assert 'Link' in exchanges[0]['headers']
+
+def test_replay_gather_without_network(tmpdir, monkeypatch):
+    names, _ = record(tmpdir)
+    monkeypatch.setenv(REPLAY_ENV, str(tmpdir))
+    monkeypatch.setenv(LATENCY_ENV, '0.001')
+    gh = ghinfo()
+    assert isinstance(gh._request_session, ReplaySession)
+    assert gh._request_session.latency == 0.001
+    assert [ b['name'] for b in gh.get_branches() ] == names
+    gh._freshness = FreshnessPolicy(rules=[], default=datetime.timedelta(0))
+    assert [ b['name'] for b in gh.get_branches() ] == names
+    assert gh._request_session.replayed == 4
+    assert gh.stats()['remote_refreshes'] == 2
+
+def test_unrecorded_conditional_request_matches_validators(tmpdir):
+    gh = ghinfo()
+    gh._request_session = RecordingSession(archive_file(str(tmpdir), gh._url))
+    gh._request_session.mount('https://', FakeForge())
+    list(gh.get_branches())
+    replay = ReplaySession(archive_file(str(tmpdir), API))
+    assert replay.get(BRANCHES, headers={ 'If-None-Match': '"p1"' }).status_code == 304
+    rsp = replay.get(BRANCHES, headers={ 'If-None-Match': '"old"' })
+    assert rsp.status_code == 200
+    assert rsp.links['next']['url'] == BRANCHES + '&page=2'
+
+def test_replay_missing(tmpdir):
+    replay = ReplaySession(archive_file(str(tmpdir), API))
+    with pytest.raises(ReplayMissing):
+        replay.get(BRANCHES, headers={})
+
+def test_replay_latency(tmpdir):
+    record(tmpdir)
+    replay = ReplaySession(archive_file(str(tmpdir), API), latency=0.05, jitter=0.02)
+    start = time.monotonic()
+    replay.get(BRANCHES, headers={})
+    assert time.monotonic() - start >= 0.05
+
+def test_parse_latency():
+    assert parse_latency(None) == (0.0, 0.0)
+    assert parse_latency('0.1') == (0.1, 0.0)
+    assert parse_latency('0.08,0.04') == (0.08, 0.04)
+
+def test_record_env(tmpdir, monkeypatch):
+    monkeypatch.setenv(RECORD_ENV, str(tmpdir.join('rec')))
+    gh = ghinfo()
+    assert isinstance(gh._request_session, RecordingSession)
+    assert gh._request_session.fname == archive_file(str(tmpdir.join('rec')), API)
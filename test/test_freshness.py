@@ -0,0 +1,38 @@
+from Briareus.VCS.Freshness import FreshnessPolicy, LocalCachePeriod
+import datetime
+import pytest
+
+sha = '0123456789abcdef0123456789abcdef01234567'
+
+@pytest.mark.parametrize('url,rsrc', [
+    ('https://api.github.com/repos/o/r/contents/.gitmodules?ref=' + sha, 'by_sha'),
+    ('https://gitlab.co/api/v4/projects/o%2Fr/repository/files/.gitmodules/raw?ref=' + sha, 'by_sha'),
+    ('https://api.github.com/repos/o/r/contents/.gitmodules?ref=master', 'other'),
+    ('https://api.github.com/repos///user/someone', 'user'),
+    ('https://gitlab.co/api/v4///users/14', 'user'),
+    ('https://api.github.com/repos/o/r', 'project'),
+    ('https://api.github.com/repos/o/r/pulls', 'pullreqs'),
+    ('https://api.github.com/repositories/1234/pulls?page=3', 'pullreqs'),
+    ('https://gitlab.co/api/v4/projects/o%2Fr/merge_requests', 'pullreqs'),
+    ('https://gitlab.co/api/v4/projects/o%2Fr/repository/branches', 'branches'),
+])
+def test_freshness_classification(url, rsrc):
+    assert FreshnessPolicy().classify(url)[0] == rsrc
+
+def test_freshness_periods():
+    policy = FreshnessPolicy()
+    now = datetime.datetime.now()
+    long_ago = now - datetime.timedelta(days=365)
+    recent = now - datetime.timedelta(seconds=10)
+    branches = 'https://api.github.com/repos/o/r/branches'
+    assert policy.is_fresh(branches, recent, now)
+    assert not policy.is_fresh(branches, now - LocalCachePeriod, now)
+    assert policy.is_fresh('https://api.github.com/repos/o/r/contents/x?ref=' + sha, long_ago, now)
+    # Not found (yet) content is re-checked, even by sha
+    assert policy.is_fresh('https://api.github.com/repos/o/r/contents/x?ref=' + sha,
+                           recent, now, found=False)
+    assert not policy.is_fresh('https://api.github.com/repos/o/r/contents/x?ref=' + sha,
+                               now - LocalCachePeriod, now, found=False)
+    user = 'https://api.github.com/repos///user/someone'
+    assert policy.is_fresh(user, now - datetime.timedelta(hours=2), now)
+    assert not policy.is_fresh(user, long_ago, now)
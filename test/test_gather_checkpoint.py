@@ -0,0 +1,211 @@
+from Briareus.Input.Description import RepoDesc, BranchDesc
+from Briareus.VCS.GatherCheckpoint import (CHECKPOINTS_ENV, checkpoint_file, load_checkpoint,
+                                           merge_prior, request_key, save_checkpoint)
+from Briareus.VCS.InternalMessages import *
+import Briareus.VCS.ManagedRepo as ManagedRepo
+from thespian.actors import *
+import datetime
+import pytest
+
+
+RL = [ RepoDesc('R1', 'r1_url', project_repo=True), RepoDesc('R2', 'r2_url') ]
+BL = [ BranchDesc('feat1') ]
+
+
+class GitControlled(ActorTypeDispatcher):
+    """Responds for R1 and R2 (each with master and feat1 branches and
+       one pull request), except that requests for a "failing" repo
+       get an InvalidRepo and requests for a "stalled" repo (or
+       request key) are held until released.
+    """
+    def __init__(self, *args, **kw):
+        super(GitControlled, self).__init__(*args, **kw)
+        self.failing = None
+        self.stalled = None
+        self.held = []
+        self.requests = []
+
+    def receiveMsg_tuple(self, msg, sender):
+        if msg[0] == 'fail':
+            self.failing = msg[1]
+        elif msg[0] == 'stall':
+            self.stalled = msg[1]
+        elif msg[0] == 'release':
+            self.stalled = None
+            for held in self.held:
+                self.receiveMessage(*held)
+            self.held = []
+        elif msg[0] == 'requests':
+            self.send(sender, self.requests)
+            self.requests = []
+            return
+        self.send(sender, 'ok')
+
+    def _respond(self, msg, sender, rsp):
+        if self.stalled in (msg.reponame, request_key(msg)):
+            self.held.append((msg, sender))
+            return
+        self.requests.append(request_key(msg))
+        if msg.reponame == self.failing and not isinstance(msg, DeclareRepo):
+            rsp = InvalidRepo(msg.reponame, 'git', msg.reponame + '_url', 'api_url',
+                              'boom', request=msg)
+        self.send(sender, rsp)
+
+    def receiveMsg_DeclareRepo(self, msg, sender):
+        self._respond(msg, sender, RepoDeclared(msg.reponame))
+
+    def receiveMsg_GetPullReqs(self, msg, sender):
+        self._respond(msg, sender,
+                      PullReqsData(msg.reponame,
+                                   [ PullReqInfo(1, 'PR for ' + msg.reponame,
+                                                 msg.reponame.lower() + '_url', 'feat1',
+                                                 'ref', 'user', '') ]))
+
+    def receiveMsg_HasBranch(self, msg, sender):
+        self._respond(msg, sender, BranchPresent(msg.reponame, msg.branch_name,
+                                                 msg.branch_name in ['master', 'feat1']))
+
+    def receiveMsg_GitmodulesData(self, msg, sender):
+        self._respond(msg, sender,
+                      GitmodulesRepoVers(msg.reponame, msg.branch_name, msg.pullreq_id, []))
+
+
+@pytest.fixture
+def asys(monkeypatch):
+    monkeypatch.setattr(ManagedRepo, 'REPO_INFO_TIMEOUT', datetime.timedelta(seconds=1))
+    asys = ActorSystem('simpleSystemBase', transientUnique=True)
+    yield asys
+    asys.shutdown()
+
+def start_git(asys):
+    return asys.createActor(GitControlled, globalName="GetGitInfo")
+
+def gather(asys):
+    return ManagedRepo.gather_repo_info(RL, [], BL, actor_system=asys)
+
+def control(asys, git, *msg):
+    return asys.ask(git, msg, datetime.timedelta(seconds=1))
+
+def repo_info(info, reponame):
+    return (set([ p for p in info['pullreqs'] if p.pr_target_repo == reponame ]),
+            set([ b for b in info['branches'] if b[0] == reponame ]))
+
+
+def test_invalid_repo_without_prior_gather(asys):
+    git = start_git(asys)
+    control(asys, git, 'fail', 'R2')
+    with pytest.raises(RuntimeError, match='Invalid git repo "R2".*boom'):
+        gather(asys)
+
+def test_invalid_repo_uses_prior_gather(asys):
+    git = start_git(asys)
+    complete = gather(asys)
+    assert repo_info(complete, 'R2')[1] == set([ ('R2', 'master'), ('R2', 'feat1') ])
+    control(asys, git, 'fail', 'R2')
+    partial = gather(asys)
+    assert partial == complete
+
+def test_invalid_repo_uses_prior_gather_checkpoint(asys, tmpdir, monkeypatch):
+    monkeypatch.setenv(CHECKPOINTS_ENV, str(tmpdir))
+    git = start_git(asys)
+    complete = gather(asys)
+    # Only the last complete gather is retained in memory; the prior
+    # for the first gather now comes from its checkpoint file.
+    ManagedRepo.gather_repo_info(RL, [], [ BranchDesc('dev') ], actor_system=asys)
+    control(asys, git, 'fail', 'R2')
+    assert gather(asys) == complete
+
+def test_timeout_returns_partial_info_and_resumes(asys):
+    git = start_git(asys)
+    complete = gather(asys)
+    control(asys, git, 'requests')
+    control(asys, git, 'stall', 'R2')
+    partial = gather(asys)
+    # R1 is fresh, R2 comes from the previous gather
+    assert repo_info(partial, 'R1') == repo_info(complete, 'R1')
+    assert repo_info(partial, 'R2') == repo_info(complete, 'R2')
+    first_requests = control(asys, git, 'requests')
+    assert ('declare', 'R1') in first_requests
+    # The next gather resumes the suspended gather instead of
+    # restarting it.
+    gather(asys)
+    assert control(asys, git, 'requests') == []
+    # Once the held requests are answered, the gather is completed
+    control(asys, git, 'release')
+    assert gather(asys) == complete
+
+def test_resume_from_saved_checkpoint(asys, tmpdir, monkeypatch):
+    monkeypatch.setenv(CHECKPOINTS_ENV, str(tmpdir))
+    git = start_git(asys)
+    control(asys, git, 'stall', 'R2')
+    with pytest.raises(RuntimeError, match='Timed out waiting for the information for R2'):
+        gather(asys)
+    request = GatherInfo(RL, [], BL)
+    state = load_checkpoint(checkpoint_file(request, 'progress'))
+    assert set([ request_key(r)[1] for r in state['outstanding'] ]) == set([ 'R2' ])
+    assert repo_info(state, 'R1')[1] == set([ ('R1', 'master'), ('R1', 'feat1') ])
+    asys.shutdown()
+
+    # A new actor system (e.g. the next inprocess run) resumes from the
+    # checkpoint, re-issuing only the outstanding requests for R2.
+    asys2 = ActorSystem('simpleSystemBase', transientUnique=True)
+    try:
+        git = start_git(asys2)
+        info = gather(asys2)
+        requests = control(asys2, git, 'requests')
+        assert ('pullreqs', 'R1') not in requests
+        assert ('pullreqs', 'R2') in requests
+        assert repo_info(info, 'R2')[1] == set([ ('R2', 'master'), ('R2', 'feat1') ])
+        assert repo_info(info, 'R1') == repo_info(state, 'R1')
+        assert load_checkpoint(checkpoint_file(request, 'progress')) is None
+        assert load_checkpoint(checkpoint_file(request, 'complete')) == info
+    finally:
+        asys2.shutdown()
+
+
+def test_response_from_earlier_gather_ignored(asys, tmpdir, monkeypatch):
+    monkeypatch.setenv(CHECKPOINTS_ENV, str(tmpdir))
+    git = start_git(asys)
+    complete = gather(asys)
+    control(asys, git, 'stall', ('branch', 'R2', 'feat1'))
+    gather(asys)  # times out waiting for the R2 feat1 branch
+    # Late responses to the same request from an earlier gather must
+    # not be taken as the answers for the suspended gather
+    gatherer = asys.createActor('Briareus.VCS.InternalOps.GatherRepoInfo',
+                                globalName='GatherRepoInfo')
+    # (the branch is requested both for the branch list and for the
+    # pull request).
+    for _ in range(2):
+        asys.tell(gatherer, BranchPresent('R2', 'feat1', False, gather_id=0))
+    control(asys, git, 'release')
+    assert load_checkpoint(checkpoint_file(GatherInfo(RL, [], BL), 'complete')) == complete
+
+
+def test_checkpoint_roundtrip_and_age(tmpdir):
+    fname = str(tmpdir.join('ck.json'))
+    altreq = Repo_AltLoc_ReqMsg(RepoAPI_Location('https://forge/o/r', None),
+                                GitmodulesData('R1', 'b1', '3', 'ref'))
+    save_checkpoint(fname, { 'outstanding': [ altreq ],
+                             'branches': set([ ('R1', 'b1') ]) })
+    state = load_checkpoint(fname)
+    assert state == { 'outstanding': [ altreq ], 'branches': set([ ('R1', 'b1') ]) }
+    assert load_checkpoint(fname, max_age=datetime.timedelta(0),
+                           now=datetime.datetime.now() + datetime.timedelta(seconds=1)) is None
+
+def test_merge_prior():
+    pr = lambda repo: PRInfo(repo, 'url', 'b', '1', 'title', 'user', '')
+    sm = lambda repo, sub: SubModuleInfo(repo, 'master', None, sub, 'v_' + repo)
+    info = { 'pullreqs': set([ pr('R1') ]),
+             'branches': set([ ('R1', 'master'), ('R2', 'old') ]),
+             'submodules': set(),
+             'subrepos': set() }
+    prior = { 'pullreqs': set([ pr('R1'), pr('R2') ]),
+              'branches': set([ ('R2', 'master') ]),
+              'submodules': set([ sm('R2', 'S1') ]),
+              'subrepos': set([ RepoDesc('S1', 's1_url'), RepoDesc('S2', 's2_url') ]) }
+    assert merge_prior(info, prior, set([ 'R2' ])) == {
+        'pullreqs': set([ pr('R1'), pr('R2') ]),
+        'branches': set([ ('R1', 'master'), ('R2', 'master') ]),
+        'submodules': set([ sm('R2', 'S1') ]),
+        'subrepos': set([ RepoDesc('S1', 's1_url') ]),
+    }
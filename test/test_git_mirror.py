@@ -0,0 +1,122 @@
+from Briareus.VCS.GitMirror import GitMirrorInfo
+from Briareus.VCS.InternalMessages import (BranchPresent, DeclareRepo, HasBranch,
+                                           RepoAPI_Location, RepoDeclared, SubRepoVers)
+from Briareus.VCS.InternalOps import GetGitInfo
+from thespian.actors import *
+import datetime
+import subprocess
+import pytest
+
+
+def git(*args, cwd=None):
+    return subprocess.run(['git'] + list(args), cwd=cwd, check=True,
+                          stdout=subprocess.PIPE,
+                          env={ 'GIT_AUTHOR_NAME': 'T', 'GIT_AUTHOR_EMAIL': 't@e.com',
+                                'GIT_COMMITTER_NAME': 'T', 'GIT_COMMITTER_EMAIL': 't@e.com',
+                                'HOME': str(cwd or '/'), 'PATH': '/usr/bin:/bin',
+                          }).stdout.decode('utf-8').strip()
+
+SUB_SHA = '1234567890abcdef1234567890abcdef12345678'
+
+gitmodules = '''[submodule "sub1"]
+	path = deps/sub1
+	url = https://github.com/o/sub1
+[submodule "sub2"]
+	path = sub2
+	url = https://github.com/o/sub2
+'''
+
+@pytest.fixture
+def remote(tmp_path):
+    "A bare repository with a master branch, a dev branch, and a pull request"
+    work = tmp_path / 'work'
+    work.mkdir()
+    git('init', '--quiet', '-b', 'master', cwd=work)
+    (work / '.gitmodules').write_text(gitmodules)
+    (work / 'README').write_text('master readme\n')
+    git('add', '.gitmodules', 'README', cwd=work)
+    git('update-index', '--add', '--cacheinfo', '160000,%s,deps/sub1' % SUB_SHA, cwd=work)
+    git('commit', '--quiet', '-m', 'master', cwd=work)
+    git('checkout', '--quiet', '-b', 'dev', cwd=work)
+    (work / 'README').write_text('dev readme\n')
+    git('commit', '--quiet', '-am', 'dev', cwd=work)
+    git('checkout', '--quiet', '-b', 'pr', cwd=work)
+    git('rm', '--quiet', '.gitmodules', cwd=work)
+    git('commit', '--quiet', '-m', 'pr', cwd=work)
+    bare = tmp_path / 'remote.git'
+    git('init', '--quiet', '--bare', str(bare), cwd=tmp_path)
+    git('push', '--quiet', str(bare), 'master', 'dev', 'pr:refs/pull/3/head', cwd=work)
+    return (work, bare)
+
+@pytest.fixture
+def mirror(tmp_path, remote):
+    return GitMirrorInfo(RepoAPI_Location(str(remote[1]), None), str(tmp_path / 'mirrors'))
+
+def test_mirror_branches(mirror):
+    assert [ b['name'] for b in mirror.get_branches() ] == [ 'dev', 'master' ]
+    assert 'refs/pull/3/head' in mirror.refs()
+    # No forge for the pull request details
+    assert mirror.get_pullreqs('R').pullreqs == []
+    assert mirror.stats()['mirror_fetches'] == 0
+
+def test_mirror_gitmodules(mirror):
+    r = mirror.get_gitmodules('R', 'master', None)
+    assert r.gitmodules_repovers == [
+        SubRepoVers('sub1', 'https://github.com/o/sub1', SUB_SHA),
+        SubRepoVers('sub2', 'https://github.com/o/sub2', 'unknownRemoteRefForPullReq'),
+    ]
+    # The pull request head is read from the pull request ref
+    assert mirror.get_gitmodules('R', 'pr', '3').gitmodules_repovers == []
+    assert mirror.get_gitmodules('R', 'nosuch', None).gitmodules_repovers == []
+    assert mirror.stats()['mirror_fetches'] == 1
+
+def test_mirror_file_contents(mirror, remote):
+    assert mirror.get_file_contents_raw('README', 'dev') == 'dev readme\n'
+    master = git('rev-parse', 'master', cwd=remote[0])
+    assert mirror.get_file_contents_raw('README', master) == 'master readme\n'
+    assert mirror.get_file_contents_raw('MISSING', 'dev') == mirror.NotFound
+    assert mirror.get_file_contents_raw('README', 'nosuch') == mirror.NotFound
+
+def test_mirror_incremental(mirror, remote):
+    work, bare = remote
+    assert mirror.get_file_contents_raw('README', 'dev') == 'dev readme\n'
+    (work / 'README').write_text('new readme\n')
+    git('commit', '--quiet', '-am', 'new', cwd=work)
+    git('push', '--quiet', str(bare), 'pr:feat', cwd=work)
+    # The remote refs are re-used while fresh
+    assert 'feat' not in [ b['name'] for b in mirror.get_branches() ]
+    mirror.refs_fresh_period = datetime.timedelta(0)
+    assert 'feat' in [ b['name'] for b in mirror.get_branches() ]
+    # Existing commits do not need a fetch
+    assert mirror.get_file_contents_raw('README', 'dev') == 'dev readme\n'
+    assert mirror.stats()['mirror_fetches'] == 1
+    assert mirror.get_file_contents_raw('README', 'feat') == 'new readme\n'
+    assert mirror.stats()['mirror_fetches'] == 2
+
+def test_mirror_token_not_in_command_line(tmp_path, monkeypatch):
+    commands = []
+    def recording_run(args, **kw):
+        commands.append((args, kw['env']))
+        return subprocess.CompletedProcess(args, 0, stdout=b'', stderr=b'')
+    monkeypatch.setattr(subprocess, 'run', recording_run)
+    mirror = GitMirrorInfo(RepoAPI_Location('https://github.com/o/r', 'u:sekrit'),
+                           str(tmp_path / 'mirrors'))
+    assert mirror.refs() == {}
+    args, env = commands[-1]
+    assert args[-1] == 'https://github.com/o/r'
+    assert not [ a for a in args if 'sekrit' in a ]
+    idx = int(env['GIT_CONFIG_COUNT']) - 1
+    assert env['GIT_CONFIG_KEY_%d' % idx] == 'http.https://github.com/o/r.extraHeader'
+    assert env['GIT_CONFIG_VALUE_%d' % idx] == 'Authorization: Basic dTpzZWtyaXQ='
+
+def test_mirror_gitinfo_actor(tmp_path, remote, monkeypatch):
+    monkeypatch.setenv('BRIAREUS_MIRRORS', str(tmp_path / 'mirrors'))
+    asys = ActorSystem('simpleSystemBase', transientUnique=True)
+    try:
+        gitinfo = asys.createActor(GetGitInfo)
+        assert asys.ask(gitinfo, DeclareRepo('R', str(remote[1])),
+                        datetime.timedelta(seconds=5)) == RepoDeclared('R')
+        rsp = asys.ask(gitinfo, HasBranch('R', 'dev'), datetime.timedelta(seconds=5))
+        assert rsp == BranchPresent('R', 'dev', True, known_branches=[ 'dev', 'master' ])
+    finally:
+        asys.shutdown()
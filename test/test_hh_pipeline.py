@@ -0,0 +1,139 @@
+from Briareus.VCS.InternalMessages import *
+import Briareus.hh as hh
+import Briareus.Backend
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from thespian.actors import *
+import json
+import threading
+import time
+import pytest
+
+
+def test_stage_ordering():
+    order = []
+    with hh.Pipeline(hh.Params()) as pipeline:
+        pipeline.start('b', lambda: order.append('b'), after=['a'])
+        pipeline.start('a', lambda: time.sleep(0.05) or order.append('a'))
+        pipeline.start('c', lambda: order.append('c') or 'c result', after=['a', 'b'])
+        assert pipeline.join('c') == 'c result'
+    # b was started before a, so it did not wait for it
+    assert order[-1] == 'c'
+
+def test_stage_after_dependency():
+    order = []
+    with hh.Pipeline(hh.Params()) as pipeline:
+        pipeline.start('a', lambda: time.sleep(0.05) or order.append('a'))
+        pipeline.start('b', lambda: order.append('b'), after=['a'])
+        pipeline.join('b')
+    assert order == ['a', 'b']
+
+def test_stage_failure():
+    def fail():
+        raise ValueError('no such jobsets')
+    with hh.Pipeline(hh.Params()) as pipeline:
+        pipeline.start('a', fail)
+        pipeline.start('b', lambda: 'never', after=['a'])
+        with pytest.raises(ValueError, match='no such jobsets'):
+            pipeline.join('a')
+        with pytest.raises(ValueError, match='no such jobsets'):
+            pipeline.join('b')
+
+def test_join_unstarted_stage():
+    with hh.Pipeline(hh.Params()) as pipeline:
+        assert 'a' not in pipeline
+        assert pipeline.join('a', 'default') == 'default'
+
+def test_stages_overlap():
+    with hh.Pipeline(hh.Params()) as pipeline:
+        start = time.monotonic()
+        for n in range(3):
+            pipeline.start(str(n), time.sleep, 0.2)
+        for n in range(3):
+            pipeline.join(str(n))
+        assert time.monotonic() - start < 0.5
+
+
+# ----------------------------------------------------------------------
+# The builder results are fetched while the VCS information is gathered.
+
+input_spec = '''
+{
+  "Repos" : [ ("TheRepo", "the_repo_url") ]
+, "Branches" : [ "feat1" ]
+}
+'''
+
+jobsets_requested = threading.Event()
+
+
+class JobsetsHandler(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        JobsetsHandler.requests.append(self.path)
+        jobsets_requested.set()
+        body = json.dumps([ { 'name': 'master.standard', 'nrtotal': 2, 'nrsucceeded': 2,
+                              'nrfailed': 0, 'nrscheduled': 0, 'haserrormsg': False,
+                              'fetcherrormsg': '' } ]).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class GitWaitsForBuilder(ActorTypeDispatcher):
+    "Does not declare the repo until the builder results are requested"
+    def receiveMsg_DeclareRepo(self, msg, sender):
+        self.send(sender, RepoDeclared(msg.reponame)
+                  if jobsets_requested.wait(5) else
+                  InvalidRepo(msg.reponame, 'git', 'the_repo_url', None,
+                              'builder results were not requested'))
+
+    def receiveMsg_GetPullReqs(self, msg, sender):
+        self.send(sender, PullReqsData(msg.reponame, []))
+
+    def receiveMsg_HasBranch(self, msg, sender):
+        self.send(sender, BranchPresent(msg.reponame, msg.branch_name,
+                                        msg.branch_name in ['master', 'feat1']))
+
+    def receiveMsg_GitmodulesData(self, msg, sender):
+        self.send(sender, GitmodulesRepoVers(msg.reponame, msg.branch_name,
+                                             msg.pullreq_id, []))
+
+
+@pytest.fixture
+def hydra():
+    server = HTTPServer(('127.0.0.1', 0), JobsetsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:%d' % server.server_address[1]
+    server.shutdown()
+
+
+def test_builder_results_fetched_during_gather(hydra, tmpdir, monkeypatch,
+                                               bcgen_engine, report_engine):
+    asys = ActorSystem('simpleSystemBase', transientUnique=True)
+    try:
+        asys.createActor(GitWaitsForBuilder, globalName='GetGitInfo')
+        monkeypatch.setattr(Briareus.Backend, 'new_actor_system', lambda backend: asys)
+        tmpdir.join('proj.hhd').write(input_spec)
+        tmpdir.join('proj.conf').write(json.dumps({ 'project_name': 'proj' }))
+        inpcfg = hh.InpConfig(hhd=str(tmpdir.join('proj.hhd')),
+                              builder_type='hydra',
+                              builder_conf=str(tmpdir.join('proj.conf')),
+                              builder_url=hydra,
+                              output_file=str(tmpdir.join('proj.hhc')))
+        params = hh.Params(report_file=str(tmpdir.join('proj.hhr')),
+                           backend='inprocess',
+                           bcgen_engine=bcgen_engine,
+                           report_engine=report_engine)
+        hh.run_hh(params, inpcfg=inpcfg)
+    finally:
+        asys.shutdown()
+    assert JobsetsHandler.requests == [ '/api/jobsets?project=proj' ]
+    assert 'master.standard' in tmpdir.join('proj.hhc').read()
+    assert "StatusReport(status='initial_success'" in tmpdir.join('proj.hhr').read()
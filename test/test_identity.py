@@ -0,0 +1,63 @@
+from Briareus.VCS.Identity import IdentityCache
+from Briareus.VCS.InternalMessages import *
+from Briareus.VCS.InternalOps import GetGitInfo
+from thespian.actors import *
+import datetime
+
+
+def test_identity_cache_period():
+    cache = IdentityCache(period=datetime.timedelta(hours=1))
+    now = datetime.datetime.now()
+    cache.put('github.com', 'alice', 'alice@e.com', now)
+    cache.put('github.com', 'bob', '', now)
+    assert cache.get('github.com', 'alice', now) == 'alice@e.com'
+    assert cache.get('github.com', 'bob', now) == ''
+    assert cache.get('gitlab.com', 'alice', now) is None
+    assert cache.get('github.com', 'alice', now + datetime.timedelta(hours=1)) is None
+
+
+def pullreq(num, user):
+    return PullReqInfo(str(num), 'PR %d' % num, 'src_url', 'b%d' % num, 'ref',
+                       user, None, pullreq_user_ref=user)
+
+
+class FakeRepoInfo(ActorTypeDispatcher):
+    "Sends ResolveEmails for two repos, as the GitRepoInfo actors would"
+    def receiveMsg_ActorAddress(self, msg, sender):
+        self.requestor = sender
+        self.requested = []
+        self.resolved = []
+        self.send(msg, ResolveEmails('github.com',
+                                     PullReqsData('R1', [ pullreq(1, 'alice') ]),
+                                     self.myAddress))
+        self.send(msg, ResolveEmails('github.com',
+                                     PullReqsData('R2', [ pullreq(2, 'alice'),
+                                                          pullreq(3, 'bob') ]),
+                                     self.myAddress))
+    def receiveMsg_GetUserEmails(self, msg, sender):
+        self.requested.append(msg.users)
+        self.send(sender, UserEmails('github.com',
+                                     dict([ (u, u + '@e.com') for u in msg.users ])))
+    def receiveMsg_PullReqsData(self, msg, sender):
+        self.resolved.append(msg)
+        if len(self.resolved) == 2:
+            self.send(self.requestor, (self.requested, self.resolved))
+
+
+def test_shared_email_lookups():
+    asys = ActorSystem('simpleSystemBase', transientUnique=True)
+    try:
+        gitinfo = asys.createActor(GetGitInfo)
+        requested, resolved = asys.ask(asys.createActor(FakeRepoInfo), gitinfo,
+                                       datetime.timedelta(seconds=5))
+        # alice is only looked up once for both repos
+        assert sorted(requested) == [ [ 'alice' ], [ 'bob' ] ]
+        assert dict([ (p.pullreq_number, p.pullreq_email)
+                      for r in resolved for p in r.pullreqs ]) == {
+            '1': 'alice@e.com', '2': 'alice@e.com', '3': 'bob@e.com' }
+        # Later lookups are answered from the cache
+        requested, resolved = asys.ask(asys.createActor(FakeRepoInfo), gitinfo,
+                                       datetime.timedelta(seconds=5))
+        assert requested == []
+    finally:
+        asys.shutdown()
@@ -0,0 +1,90 @@
+from Briareus.Input.Description import RepoDesc, BranchDesc
+import Briareus.VCS.Metrics as Metrics_
+from Briareus.VCS.Metrics import (METRICS_ENV, Metrics, MetricsReport, MetricsServer,
+                                  combine_snapshots, render_metrics)
+from Briareus.VCS.ManagedRepo import gather_repo_info
+from datetime import timedelta
+from thespian.actors import *
+from test_single import GitTestSingle
+import pytest
+import socket
+import urllib.request
+
+def test_metrics_counters_and_gauges():
+    m = Metrics()
+    m.incr('briareus_forge_requests_total', forge='github.com')
+    m.incr('briareus_forge_requests_total', forge='github.com')
+    m.incr('briareus_forge_requests_total', forge='gitlab.com')
+    m.set('briareus_forge_ratelimit_remaining', 42, forge='github.com')
+    assert m.value('briareus_forge_requests_total', forge='github.com') == 2
+    assert m.value('briareus_forge_requests_total', forge='gitlab.com') == 1
+    assert m.value('briareus_forge_ratelimit_remaining', forge='github.com') == 42
+    assert m.value('briareus_forge_requests_total', forge='other') is None
+
+def test_metrics_render():
+    m = Metrics()
+    m.incr('briareus_forge_errors_total', forge='github.com', status='403')
+    m.observe('briareus_forge_request_seconds', 0.3, forge='github.com')
+    show = render_metrics(m)
+    assert '# TYPE briareus_forge_errors_total counter' in show
+    assert 'briareus_forge_errors_total{forge="github.com",status="403"} 1' in show
+    assert '# TYPE briareus_forge_request_seconds histogram' in show
+    assert 'briareus_forge_request_seconds_bucket{forge="github.com",le="0.25"} 0' in show
+    assert 'briareus_forge_request_seconds_bucket{forge="github.com",le="0.5"} 1' in show
+    assert 'briareus_forge_request_seconds_bucket{forge="github.com",le="+Inf"} 1' in show
+    assert 'briareus_forge_request_seconds_count{forge="github.com"} 1' in show
+
+def test_metrics_combine_snapshots():
+    m1 = Metrics()
+    m1.incr('briareus_forge_requests_total', 3, forge='github.com')
+    m1.set('briareus_forge_ratelimit_remaining', 10, forge='github.com')
+    m2 = Metrics()
+    m2.incr('briareus_forge_requests_total', 4, forge='github.com')
+    m2.set('briareus_forge_ratelimit_remaining', 7, forge='github.com')
+    m2.gauges[('briareus_forge_ratelimit_remaining', (('forge', 'github.com'),))] = \
+        (7, m1.gauges[('briareus_forge_ratelimit_remaining', (('forge', 'github.com'),))][1] + 1)
+    combined = combine_snapshots([m1.snapshot(), m2.snapshot()])
+    assert combined.value('briareus_forge_requests_total', forge='github.com') == 7
+    # The most recently set gauge value wins
+    assert combined.value('briareus_forge_ratelimit_remaining', forge='github.com') == 7
+
+
+RL = [ RepoDesc('TheRepo', 'the_repo_url', project_repo=True) ]
+BL = [ BranchDesc('feat1'), BranchDesc('dev') ]
+
+@pytest.fixture
+def metrics_asys(monkeypatch):
+    monkeypatch.setattr(Metrics_, 'METRICS_REPORT_PERIOD', timedelta(milliseconds=10))
+    asys = ActorSystem('simpleSystemBase', transientUnique=True)
+    yield asys
+    asys.tell(asys.createActor(MetricsServer, globalName='BriareusMetrics'),
+              ActorExitRequest())
+    asys.shutdown()
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+def test_gather_metrics_served(metrics_asys, monkeypatch):
+    port = free_port()
+    monkeypatch.setenv(METRICS_ENV, 'localhost:%d' % port)
+    gitinfo = metrics_asys.createActor(GitTestSingle, globalName="GetGitInfo")
+    gather_repo_info(RL, [], BL, actor_system=metrics_asys)
+    metrics_asys.tell(gitinfo, ActorExitRequest())
+    metrics_asys.listen(timedelta(milliseconds=100))  # deliver the metrics reports
+    with urllib.request.urlopen('http://localhost:%d/metrics' % port) as rsp:
+        show = rsp.read().decode('utf-8')
+    assert 'briareus_gather_requests_total{type="GatherInfo"} 1' in show
+
+def test_metrics_listener_not_retried(metrics_asys, monkeypatch):
+    monkeypatch.setenv(METRICS_ENV, 'localhost:1')
+    attempts = []
+    def fail(location, metrics_text):
+        attempts.append(location)
+        raise OSError('address in use')
+    monkeypatch.setattr(Metrics_, 'start_metrics_listener', fail)
+    server = metrics_asys.createActor(MetricsServer, globalName='BriareusMetrics')
+    for n in range(3):
+        metrics_asys.tell(server, MetricsReport('test', Metrics().snapshot()))
+    assert attempts == [ 'localhost:1' ]
@@ -0,0 +1,50 @@
+import importlib
+import shutil
+import pytest
+from datetime import timedelta
+from thespian.actors import *
+import Briareus.BCGen.Generator as Generator
+import Briareus.Input.Operations as BInput
+
+
+# The test_example* modules providing an input_spec and a gitactor;
+# running the full suite with --bcgen-engine=compare checks all of
+# the tests for these scenarios as well.
+scenarios = [ 'test_example', 'test_example2', 'test_example3',
+              'test_example3_altloc', 'test_example3_overspec',
+              'test_example4', 'test_exampledups' ]
+
+@pytest.fixture
+def asys():
+    asys = ActorSystem('simpleSystemBase', transientUnique=True)
+    yield asys
+    asys.shutdown()
+
+def scenario_bldconfigs(asys, scenario, **generator_args):
+    module = importlib.import_module(scenario)
+    gitinfo = asys.createActor(module.gitactor, globalName="GetGitInfo")
+    for req, resp in getattr(module, 'gitactor_updates', []):
+        assert asys.ask(gitinfo, req, timedelta(seconds=1)) == resp
+    inp_desc, repo_info = BInput.input_desc_and_VCS_info(module.input_spec,
+                                                         actor_system=asys)
+    gen = Generator.Generator(actor_system=asys, **generator_args)
+    (rtype, cfgs) = gen.generate_build_configs(inp_desc, repo_info)
+    assert rtype == "build_configs"
+    return list(cfgs.cfg_build_configs)
+
+@pytest.mark.skipif(not shutil.which('swipl'), reason='requires swipl')
+@pytest.mark.parametrize('scenario', scenarios)
+def test_native_matches_prolog(asys, scenario):
+    # The compare engine raises an error for any differences
+    assert scenario_bldconfigs(asys, scenario, engine='compare')
+
+@pytest.mark.parametrize('scenario', scenarios)
+def test_native_lazy_variables(asys, scenario):
+    cfgs = scenario_bldconfigs(asys, scenario, engine='native')
+    lazy = scenario_bldconfigs(asys, scenario, engine='native', lazy_variables=True)
+    assert len(lazy) == len(cfgs)
+    assert all([ c in cfgs for c in lazy ])
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        Generator.Generator(engine='abacus')
@@ -0,0 +1,66 @@
+import pytest
+import Briareus.AnaRep.Operations as AnaRep
+from Briareus.AnaRep.Native import cmp_blddesc, read_reporting_logic
+from Briareus.Logic.Terms import (Atom, Term, UnsupportedLogic, Var,
+                                  read_facts, unify)
+from Briareus.Types import (Notify, PR_Grouped, PR_Repogroup,
+                            PR_Solo, VarFailure)
+
+
+# Running the full suite with --report-engine=compare checks the
+# native report engine against the logic for all of the test
+# examples.
+
+reporting_logic = '''
+project_owner("Project #1", "george@_company.com").  % the owner
+enable(email, "fred@nocompany.com", notify(_, "Project #1", _)).
+enable(email, 'anne@nocompany.com', notify(main_submodules_broken, "Project #1", _)).
+email_domain_blacklist("not_a_company.com").
+'''
+
+def test_read_facts():
+    facts = read_facts(reporting_logic)
+    assert facts[0] == Term('project_owner', ['Project #1', 'george@_company.com'])
+    assert facts[2].args[0] == Atom('email')
+    assert facts[2].args[1] == Atom('anne@nocompany.com')
+    assert read_facts('x([1, "a", b|[c]]).') == [ Term('x', [[1, 'a', Atom('b'), Atom('c')]]) ]
+
+def test_unify():
+    pattern = read_facts(reporting_logic)[1].args[2]
+    notify = Term('notify', [Atom('main_good'), 'Project #1', 'master'])
+    assert unify(pattern, notify) is not None
+    assert unify(pattern, Term('notify', [Atom('main_good'), 'R10', 'master'])) is None
+    assert unify(Term('f', [Var('X'), Var('X')]), Term('f', ['a', 'b'])) is None
+    assert unify(Term('f', [Var('X'), Var('X')]), Term('f', ['a', 'a'])) == { Var('X'): 'a' }
+    # strings and atoms are distinct
+    assert unify('a', Atom('a')) is None
+
+@pytest.mark.parametrize('logic', [ 'owner(X) :- member(X, ["a"]).',
+                                    ':- dynamic enable/3.',
+                                    'enable(email, X, Y) .. ',
+                                    'email([], notify(a, "b", c), []).' ])
+def test_unsupported_reporting_logic(logic):
+    with pytest.raises(UnsupportedLogic):
+        read_reporting_logic(logic)
+
+def test_cmp_blddesc():
+    solo = PR_Solo('R2', '1')
+    group = PR_Repogroup('1', ['R1', 'R2'])
+    assert cmp_blddesc(solo, solo) == solo
+    assert cmp_blddesc(solo, group) == group
+    assert cmp_blddesc(group, solo) == group
+    assert cmp_blddesc(PR_Solo('R3', '1'), group) is None
+    assert cmp_blddesc(PR_Grouped('b'), solo) is None
+
+def test_compare_reports():
+    var = VarFailure('P', 'ghcver', 'ghc844')
+    note = Notify('main_broken', 'P', ['a', 'b'])
+    AnaRep.compare_reports([var, note, note], [note, var, note])
+    with pytest.raises(RuntimeError):
+        AnaRep.compare_reports([var, note, note], [var, note])
+    with pytest.raises(RuntimeError):
+        AnaRep.compare_reports([var], [VarFailure('P', 'ghcver', 'ghc865')])
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        AnaRep.AnaRep(engine='abacus')
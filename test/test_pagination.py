@@ -0,0 +1,73 @@
+from Briareus.VCS.GitRepo import GitHubInfo
+from Briareus.VCS.InternalMessages import RepoAPI_Location
+from requests.structures import CaseInsensitiveDict
+import json
+import requests
+import threading
+import pytest
+
+
+def mkrsp(data, link=None, status=200):
+    rsp = requests.Response()
+    rsp.status_code = status
+    rsp.headers = CaseInsensitiveDict({ 'Link': link } if link else {})
+    rsp._content = json.dumps(data).encode('utf-8')
+    return rsp
+
+
+class FakeSession(object):
+    def __init__(self, pages):
+        self.pages = pages
+        self.requested = []
+        self._lock = threading.Lock()
+    def get(self, url, headers):
+        with self._lock:
+            self.requested.append(url)
+        return self.pages[url]
+
+
+BASE = 'https://api.github.com/repos/o/r/branches'
+
+def branch_pages(npages, with_last=True):
+    pages = {}
+    for pnum in range(1, npages + 1):
+        links = []
+        if pnum < npages:
+            links.append('<%s?per_page=100&page=%d>; rel="next"' % (BASE, pnum + 1))
+            if with_last:
+                links.append('<%s?per_page=100&page=%d>; rel="last"' % (BASE, npages))
+        url = BASE + '?per_page=100' + ('' if pnum == 1 else '&page=%d' % pnum)
+        pages[url] = mkrsp([ { 'name': 'b%d_%d' % (pnum, n) } for n in range(3) ],
+                           ', '.join(links))
+    return pages
+
+
+@pytest.fixture
+def ghinfo():
+    return GitHubInfo(RepoAPI_Location('https://github.com/o/r', None))
+
+
+@pytest.mark.parametrize('with_last', [True, False])
+def test_paged_branches_in_order(ghinfo, with_last):
+    ghinfo._request_session = FakeSession(branch_pages(7, with_last=with_last))
+    names = [ b['name'] for b in ghinfo.get_branches() ]
+    assert names == [ 'b%d_%d' % (p, n) for p in range(1, 8) for n in range(3) ]
+    assert len(ghinfo._request_session.requested) == 7
+    assert all([ 'per_page=100' in u for u in ghinfo._request_session.requested ])
+
+def test_single_page(ghinfo):
+    ghinfo._request_session = FakeSession(branch_pages(1))
+    assert [ b['name'] for b in ghinfo.get_branches() ] == [ 'b1_0', 'b1_1', 'b1_2' ]
+
+def test_dict_pages_later_pages_supercede(ghinfo):
+    url = 'https://api.github.com/repos/o/r/info'
+    ghinfo._request_session = FakeSession({
+        url: mkrsp({ 'a': 1, 'b': 1 }, '<%s?page=2>; rel="next"' % url),
+        url + '?page=2': mkrsp({ 'b': 2 }),
+    })
+    assert ghinfo.api_req('/info') == { 'a': 1, 'b': 2 }
+
+def test_not_found(ghinfo):
+    url = 'https://api.github.com/repos/o/r/nothing'
+    ghinfo._request_session = FakeSession({ url: mkrsp({}, status=404) })
+    assert ghinfo.api_req('/nothing', notFoundOK=True) == ghinfo.NotFound
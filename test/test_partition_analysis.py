@@ -0,0 +1,67 @@
+import Briareus.AnaRep.Operations as AnaRep
+from Briareus.Input.Description import BranchDesc, InputDesc, RepoDesc
+from Briareus.Logic.InpFacts import get_other_project_facts
+from Briareus.Types import (BldVariable, Notify, ProjectSummary, SendEmail,
+                            StatusReport)
+from Briareus.VCS.InternalMessages import PRInfo
+
+
+# The partitioned analysis is only used with --partition-analysis.
+# Running the full suite with swipl, --partition-analysis, and
+# --report-engine=compare checks the partitioned analysis of the
+# multi-project tests (test_ex1_and_ex3_and_dups) against the native
+# report engine.
+
+def result_set(pname, RL):
+    return AnaRep.ResultSet(inp_desc=InputDesc(RL=RL, PNAME=pname))
+
+def test_partitionable():
+    R1 = RepoDesc('R1', 'r1_url', project_repo=True)
+    R2 = RepoDesc('R2', 'r2_url', project_repo=True)
+    assert AnaRep.partitionable([ result_set('P1', [R1]), result_set('P2', [R2]) ])
+    assert not AnaRep.partitionable([ result_set('P1', [R1]) ])
+    assert not AnaRep.partitionable([ result_set('P1', [R1]), result_set('P1', [R2]) ])
+    assert not AnaRep.partitionable([ result_set('P1', [R1]), result_set('P2', []) ])
+
+def test_partitioned_only_when_enabled():
+    R1 = RepoDesc('R1', 'r1_url', project_repo=True)
+    R2 = RepoDesc('R2', 'r2_url', project_repo=True)
+    result_sets = [ result_set('P1', [R1]), result_set('P2', [R2]) ]
+    assert not AnaRep.AnaRep().partitioned(result_sets)
+    assert AnaRep.AnaRep(partition=True).partitioned(result_sets)
+    assert not AnaRep.AnaRep(partition=True,
+                             up_to='raw_built_analysis').partitioned(result_sets)
+
+def test_prior_project():
+    status = StatusReport('succeeded', 'P1', 'standard', 'regular', 'master', 'bld',
+                          [ BldVariable('P1', 'ghcver', 'ghc865') ])
+    email = SendEmail([ 'a@b.com' ], Notify('main_good', 'P2', []), [])
+    assert AnaRep.prior_project(status) == 'P1'
+    assert AnaRep.prior_project(email) == 'P2'
+    assert AnaRep.prior_project(ProjectSummary('P1+P2', 1, 0, 0)) is None
+
+def test_other_project_facts():
+    RL = [ RepoDesc('R1', 'r1_url', project_repo=True),
+           RepoDesc('R2', 'r2_url', main_branch='develop') ]
+    repo_info = { 'subrepos': [ RepoDesc('R3', 'r3_url') ],
+                  'branches': [ ('R1', 'master'), ('R2', 'develop') ],
+                  'pullreqs': [ PRInfo('R2', 'r2_fork_url', 'feat', '7', 'Feature', 'u', 'u@e.com') ],
+                  'submodules': [],
+    }
+    facts = [ str(f) for f in get_other_project_facts('P1', RL, [ BranchDesc('feat') ],
+                                                      repo_info) ]
+    assert 'other_project("P1", "R1").' in facts
+    assert 'repo("P1", "R2").' in facts
+    assert 'main_branch("R2", "develop").' in facts
+    assert 'subrepo("R1", "R3").' in facts
+    assert 'branchreq("P1", "feat").' in facts
+    assert 'branch("R2", "develop").' in facts
+    assert 'pullreq("R2", "7", "feat", "u", "u@e.com").' in facts
+    # The other project must not generate any configurations
+    assert not [ f for f in facts if f.startswith(('project(', 'submodule(', 'varname(')) ]
+
+def test_merge_partition_results():
+    assert AnaRep.merge_partition_results([ '[[],[],[],[]]', '[[],["a"],[],[]]' ]) == []
+    assert AnaRep.merge_partition_results([ '[["r1"],["a1"],["n1"],["d1"]]',
+                                            '[["r2","r1"],["a2"],[],["d2"]]' ]) == \
+        [ "r1", "r2", "a1", "a2", "n1", "d1", "d2" ]
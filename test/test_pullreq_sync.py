@@ -0,0 +1,86 @@
+from Briareus.VCS.Freshness import FreshnessPolicy
+from Briareus.VCS.GitRepo import GitHubInfo
+from Briareus.VCS.InternalMessages import RepoAPI_Location
+from requests.structures import CaseInsensitiveDict
+import datetime
+import json
+import requests
+import pytest
+
+
+def mkrsp(data, link=None):
+    rsp = requests.Response()
+    rsp.status_code = 200
+    rsp.headers = CaseInsensitiveDict({ 'Link': link } if link else {})
+    rsp._content = json.dumps(data).encode('utf-8')
+    return rsp
+
+
+class FakeSession(object):
+    def __init__(self):
+        self.pages = {}
+        self.requested = []
+    def get(self, url, headers):
+        self.requested.append(url)
+        return self.pages[url]
+
+
+API = 'https://api.github.com/repos/o/r'
+OPEN = API + '/pulls?state=open&sort=updated&direction=desc&per_page=100'
+UPDATED = API + '/pulls?state=all&sort=updated&direction=desc&per_page=100'
+
+def pr(num, updated, state='open'):
+    return { 'number': num, 'title': 'PR %d' % num, 'state': state, 'merged_at': None,
+             'updated_at': '2020-01-%02dT00:00:00Z' % updated, 'merge_commit_sha': 'm',
+             'head': { 'ref': 'b%d' % num, 'sha': 's%d' % num,
+                       'repo': { 'html_url': 'https://github.com/u/r' } },
+             'user': { 'login': 'u' } }
+
+def set_pages(session, url, pages):
+    for n, page in enumerate(pages):
+        link = (('<%s&page=%d>; rel="next", <%s&page=%d>; rel="last"'
+                 % (url, n + 2, url, len(pages)))
+                if n + 1 < len(pages) else None)
+        session.pages[url + ('&page=%d' % (n + 1) if n else '')] = mkrsp(page, link)
+
+@pytest.fixture
+def ghinfo():
+    info = GitHubInfo(RepoAPI_Location('https://github.com/o/r', None))
+    info._request_session = FakeSession()
+    info._freshness = FreshnessPolicy(rules=[], default=datetime.timedelta(0))
+    return info
+
+def pr_numbers(ghinfo):
+    return [ p.pullreq_number for p in ghinfo.get_pullreqs('R').pullreqs ]
+
+def test_incremental_pullreq_sync(ghinfo):
+    session = ghinfo._request_session
+    set_pages(session, OPEN, [ [ pr(3, 5), pr(2, 4) ], [ pr(1, 3) ] ])
+    assert pr_numbers(ghinfo) == [ '3', '2', '1' ]
+    assert session.requested == [ OPEN, OPEN + '&page=2' ]
+
+    # PR 4 is opened and PR 2 is closed; the sync stops on the first
+    # page at the PR that was not updated since the previous sync.
+    set_pages(session, UPDATED, [ [ pr(2, 7, state='closed'), pr(4, 6), pr(3, 5), pr(1, 3) ],
+                                  [ pr(9, 1, state='closed') ] ])
+    session.requested = []
+    assert pr_numbers(ghinfo) == [ '4', '3', '1' ]
+    assert session.requested == [ UPDATED ]
+
+    # Periodically, there is a full sync again
+    ghinfo.full_sync_period = datetime.timedelta(0)
+    set_pages(session, OPEN, [ [ pr(4, 6), pr(3, 5) ] ])
+    assert pr_numbers(ghinfo) == [ '4', '3' ]
+
+def test_pullreq_snapshot_saved(ghinfo, tmp_path, monkeypatch):
+    monkeypatch.setenv('BRIAREUS_PR_SNAPSHOTS', str(tmp_path))
+    set_pages(ghinfo._request_session, OPEN, [ [ pr(3, 5), pr(1, 3) ] ])
+    assert pr_numbers(ghinfo) == [ '3', '1' ]
+
+    # A new GitHubInfo (e.g. after the actor exits) continues from the
+    # saved snapshot.
+    info = GitHubInfo(RepoAPI_Location('https://github.com/o/r', None))
+    info._request_session = FakeSession()
+    set_pages(info._request_session, UPDATED, [ [ pr(1, 8) ] ])
+    assert pr_numbers(info) == [ '1', '3' ]
+    assert info._request_session.requested == [ UPDATED ]
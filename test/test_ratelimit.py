@@ -0,0 +1,93 @@
+from Briareus.VCS.ManagedRepo import PARTIAL_INFO_TIMEOUT
+from Briareus.VCS.RateLimit import ForgeScheduler, RateLimited
+import attr
+import pytest
+
+
+class FakeTime(object):
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+    def clock(self):
+        return self.now
+    def wallclock(self):
+        return 1500000000.0 + self.now
+    def sleep(self, secs):
+        self.slept.append(secs)
+        self.now += secs
+
+@attr.s
+class FakeResponse(object):
+    status_code = attr.ib(default=200)
+    headers = attr.ib(factory=dict)
+    text = attr.ib(default='')
+
+
+@pytest.fixture
+def faketime():
+    return FakeTime()
+
+def scheduler(faketime, **kw):
+    return ForgeScheduler('api.forge.test',
+                          clock=faketime.clock, wallclock=faketime.wallclock,
+                          sleep=faketime.sleep, **kw)
+
+
+def test_burst_then_paced_by_token_bucket(faketime):
+    sched = scheduler(faketime, rate=2.0, burst=3)
+    for _ in range(3):
+        assert sched.wait_for_turn()
+    assert faketime.slept == []
+    assert sched.wait_for_turn()
+    assert faketime.slept == [0.5]
+
+def test_reserve_held_for_conditional_requests(faketime):
+    sched = scheduler(faketime, reserve=10)
+    sched.update(FakeResponse(headers={ 'X-RateLimit-Remaining': '5',
+                                        'X-RateLimit-Reset': str(int(faketime.wallclock()) + 3600) }))
+    # A new fetch would need to wait for the reset
+    assert sched.delay() == pytest.approx(3600)
+    with pytest.raises(RateLimited):
+        sched.wait_for_turn()
+    # ... or use stale data if there is some
+    assert not sched.wait_for_turn(stale_ok=True)
+    # but a conditional refresh can proceed immediately
+    assert sched.wait_for_turn(conditional=True)
+    assert faketime.slept == []
+
+def test_paced_when_allowance_is_low(faketime):
+    sched = scheduler(faketime, reserve=0, pace_below=100)
+    sched.update(FakeResponse(headers={ 'RateLimit-Remaining': '51',
+                                        'RateLimit-Reset': str(int(faketime.wallclock()) + 100) }))
+    assert sched.wait_for_turn()
+    assert sched.wait_for_turn()
+    assert faketime.slept == [pytest.approx(2.0)]
+
+def test_retry_after_blocks_all_requests(faketime):
+    sched = scheduler(faketime, max_wait=60)
+    assert sched.update(FakeResponse(status_code=429, headers={ 'Retry-After': '30' })) == 30
+    assert sched.delay(conditional=True) == pytest.approx(30)
+    assert sched.wait_for_turn()
+    assert faketime.slept == [pytest.approx(30)]
+
+def test_secondary_limit_exponential_backoff(faketime):
+    sched = scheduler(faketime, backoff=10)
+    rsp = FakeResponse(status_code=403, text='You have exceeded a secondary rate limit.')
+    assert sched.update(rsp) == 10
+    assert sched.update(rsp) == 20
+    assert sched.update(FakeResponse()) is None
+    assert sched.update(rsp) == 10
+
+def test_forbidden_is_not_rate_limit(faketime):
+    sched = scheduler(faketime)
+    assert sched.update(FakeResponse(status_code=403, text='Resource not accessible')) is None
+    assert sched.delay() == 0
+
+def test_long_retry_not_waited_for_in_actor(faketime):
+    sched = scheduler(faketime)
+    assert sched.max_wait * 4 <= PARTIAL_INFO_TIMEOUT.total_seconds()
+    assert sched.update(FakeResponse(status_code=429, headers={ 'Retry-After': '60' })) == 60
+    with pytest.raises(RateLimited):
+        sched.wait_for_turn()
+    assert not sched.wait_for_turn(stale_ok=True)
+    assert faketime.slept == []
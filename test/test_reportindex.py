@@ -0,0 +1,28 @@
+from Briareus.AnaRep.ReportIndex import ReportIndex
+from Briareus.Types import *
+
+
+vars = [ BldVariable('proj', 'ghcver', 'ghc881') ]
+
+report = [
+    PendingStatus('proj', 'regular', 'pullreq', 'b1', 'PR1-b1.regular-ghc881', vars),
+    StatusReport('succeeded', 'proj', 'regular', 'pullreq', 'b1', 'PR1-b1.regular-ghc881', vars),
+    StatusReport('3', 'proj', 'regular', 'regular', 'master', 'master.regular-ghc881', vars),
+    StatusReport('fixed', 'other', 'regular', 'pullreq', 'b2', 'PR2-b2.regular-ghc881', vars),
+    Notify('main_good', 'proj', []),
+]
+
+def test_reportindex_entries_in_order():
+    idx = ReportIndex(report)
+    assert list(idx) == report
+    assert len(idx) == len(report)
+    assert ReportIndex.of(idx) is idx
+
+def test_reportindex_lookup():
+    idx = ReportIndex(report)
+    assert idx.projects == set(['proj', 'other'])
+    assert idx.pullreq_branches() == set(['b1', 'b2'])
+    assert idx.status_report('proj', 'PR1-b1.regular-ghc881') == report[1]
+    assert idx.status_report('other', 'PR1-b1.regular-ghc881') is None
+    assert idx.of_type(StatusReport) == report[1:4]
+    assert idx.of_type(Notify) == report[4:]
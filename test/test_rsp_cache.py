@@ -0,0 +1,99 @@
+from Briareus.VCS.GitRepo import GitHubInfo
+from Briareus.VCS.InternalMessages import RepoAPI_Location
+from Briareus.VCS.RspCache import ResponseCache, CachedResponse
+from Briareus.VCS.Freshness import LocalCachePeriod
+from requests.structures import CaseInsensitiveDict
+import datetime
+import json
+import requests
+import pytest
+
+
+def mkrsp(data, status=200, headers=None):
+    rsp = requests.Response()
+    rsp.status_code = status
+    rsp.headers = CaseInsensitiveDict(headers or {})
+    rsp._content = json.dumps(data).encode('utf-8')
+    return rsp
+
+
+class FakeSession(object):
+    def __init__(self, responses):
+        self.responses = responses
+        self.requested = []
+    def get(self, url, headers):
+        self.requested.append((url, headers))
+        rsp = self.responses[url]
+        return rsp(headers) if callable(rsp) else rsp
+
+
+PULLS = 'https://api.github.com/repos/o/r/pulls?per_page=100'
+
+pull = { 'number': 4, 'title': 'Fix', 'state': 'open', 'merged_at': None,
+         'merge_commit_sha': 'abc', 'body': 'long description ' * 100,
+         'head': { 'ref': 'fix', 'sha': 'def', 'label': 'u:fix',
+                   'repo': { 'html_url': 'https://github.com/u/r', 'owner': {} } },
+         'user': { 'login': 'u', 'avatar_url': 'https://x' },
+         '_links': { 'self': { 'href': 'https://x' } },
+}
+
+@pytest.fixture
+def ghinfo():
+    return GitHubInfo(RepoAPI_Location('https://github.com/o/r', None))
+
+def test_cached_pullreqs_trimmed(ghinfo):
+    ghinfo._request_session = FakeSession({ PULLS: mkrsp([ pull ]) })
+    assert list(ghinfo.api_req_iter('/pulls')) == [
+        { 'number': 4, 'title': 'Fix', 'state': 'open', 'merged_at': None,
+          'merge_commit_sha': 'abc',
+          'head': { 'ref': 'fix', 'sha': 'def', 'repo': { 'html_url': 'https://github.com/u/r' } },
+          'user': { 'login': 'u' },
+        } ]
+    # Cache hits re-use the decoded response
+    cached = ghinfo._rsp_cache.get(PULLS)[0]
+    assert isinstance(cached, CachedResponse)
+    assert list(ghinfo.api_req_iter('/pulls'))[0] is cached.data[0]
+    assert len(ghinfo._request_session.requested) == 1
+
+def test_cached_revalidated(ghinfo):
+    url = 'https://api.github.com/repos/o/r/info'
+    ghinfo._request_session = FakeSession({
+        url: lambda hdrs: (mkrsp(None, status=304) if hdrs.get('If-None-Match') == '"v1"'
+                           else mkrsp([ 1, 2 ], headers={ 'ETag': '"v1"' })) })
+    assert ghinfo.api_req('/info') == [ 1, 2 ]
+    # Make the entry stale
+    ghinfo._rsp_cache.put(url, ghinfo._rsp_cache.get(url)[0], datetime.datetime(2000, 1, 1))
+    result = ghinfo.api_req('/info')
+    assert result == [ 1, 2 ]
+    # The result is a copy, so the cached data is unchanged
+    result.append(3)
+    assert ghinfo._rsp_cache.get(url)[0].data == [ 1, 2 ]
+    assert ghinfo.stats()['remote_refreshes'] == 1
+    assert ghinfo._request_session.requested[1][1] == { 'If-None-Match': '"v1"' }
+
+def test_not_found_by_sha_refetched(ghinfo):
+    sha = '0123456789abcdef0123456789abcdef01234567'
+    url = 'https://api.github.com/repos/o/r/contents/.gitmodules?ref=' + sha
+    ghinfo._request_session = FakeSession({ url: mkrsp({ 'message': 'Not Found' }, status=404) })
+    assert ghinfo._get_file_contents_info('.gitmodules', sha) == ghinfo.NotFound
+    assert ghinfo._get_file_contents_info('.gitmodules', sha) == ghinfo.NotFound
+    assert len(ghinfo._request_session.requested) == 1
+    # Once the not found response is no longer fresh, the (now
+    # visible) content is retrieved
+    ghinfo._rsp_cache.put(url, ghinfo.NotFound, datetime.datetime.now() - LocalCachePeriod)
+    ghinfo._request_session.responses[url] = mkrsp({ 'encoding': 'base64', 'content': '' })
+    assert ghinfo._get_file_contents_info('.gitmodules', sha) == \
+        { 'encoding': 'base64', 'content': '' }
+    assert len(ghinfo._request_session.requested) == 2
+
+def test_cache_eviction():
+    cache = ResponseCache(max_bytes=3 * (ResponseCache.entry_overhead + 10))
+    now = datetime.datetime.now()
+    for n in range(3):
+        cache.put('u%d' % n, CachedResponse([n], size=10), now)
+    cache.get('u0')
+    cache.put('u3', CachedResponse([3], size=10), now)
+    assert 'u1' not in cache
+    assert all([ u in cache for u in [ 'u0', 'u2', 'u3' ] ])
+    assert cache.evictions == 1
+    assert cache.nbytes == 3 * (ResponseCache.entry_overhead + 10)
@@ -0,0 +1,57 @@
+from Briareus.Selection import Selection, merge_report
+from Briareus.BuildSys.Hydra import HydraBuilder
+from Briareus.VCS.InternalMessages import PRInfo
+from Briareus.Types import *
+import json
+
+
+vars = [ BldVariable('proj', 'ghcver', 'ghc881') ]
+
+prior = [
+    StatusReport('succeeded', 'proj', 'regular', 'pullreq', 'b1', 'PR-b1.regular-ghc881', vars),
+    StatusReport('succeeded', 'proj', 'regular', 'regular', 'master', 'master.regular-ghc881', vars),
+    StatusReport('fixed', 'other', 'regular', 'regular', 'master', 'master.regular-ghc881', vars),
+    Notify('main_good', 'proj', []),
+]
+
+new = [
+    StatusReport(2, 'proj', 'regular', 'pullreq', 'b1', 'PR-b1.regular-ghc881', vars),
+    StatusReport('succeeded', 'proj', 'regular', 'regular', 'master', 'master.regular-ghc881', vars),
+    Notify('main_broken', 'proj', []),
+]
+
+pullreqs = [ PRInfo(pr_target_repo='R1', pr_srcrepo_url='r1_fork_url',
+                    pr_branch='b1', pr_ident='7', pr_title='b1 changes',
+                    pr_user='frog', pr_email='frog@lilypond.org') ]
+
+def test_empty_selection():
+    assert not Selection()
+    assert Selection(projects=['proj'])
+
+def test_selection_pullreq_branches():
+    sel = Selection(pullreqs=['7']).for_pullreqs(pullreqs)
+    assert sel.branches == ['b1']
+    assert sel.has_branch('b1')
+    assert not sel.has_branch('master')
+    assert Selection(projects=['proj']).for_pullreqs(pullreqs).has_branch('master')
+
+def test_merge_report_by_branch():
+    sel = Selection(projects=['proj'], branches=['b1'])
+    assert merge_report(prior, new, sel) == prior[1:] + new[:1]
+
+def test_merge_report_by_project():
+    sel = Selection(projects=['proj'])
+    assert merge_report(prior, new, sel) == [ prior[2] ] + new
+
+def test_hydra_merge_build_configurations():
+    jobset = lambda branch, rev: { 'inputs': { 'variant': { 'value': '|branch=%s|strategy=regular' % branch },
+                                               'R1-src': { 'value': 'r1_url ' + rev } } }
+    prior_output = json.dumps({ 'master.regular': jobset('master', 'r1m'),
+                                'PR-b1.regular': jobset('b1', 'r1b1'),
+                                'PR-b2.regular': jobset('b2', 'r1b2') })
+    output = json.dumps({ 'PR-b1.regular': jobset('b1', 'r1b1new') })
+    merged = json.loads(HydraBuilder(None).merge_build_configurations(
+        prior_output, output, Selection(branches=['b1'])))
+    assert sorted(merged.keys()) == [ 'PR-b1.regular', 'PR-b2.regular', 'master.regular' ]
+    assert merged['PR-b1.regular'] == jobset('b1', 'r1b1new')
+    assert merged['master.regular'] == jobset('master', 'r1m')
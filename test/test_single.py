@@ -56,7 +56,7 @@ class GitTestSingle(ActorTypeDispatcher):
 
     def receiveMsg_GitmodulesData(self, msg, sender):
         branch = msg.branch_name
-        self.send(sender, GitmodulesRepoVers(msg.reponame, branch, []))
+        self.send(sender, GitmodulesRepoVers(msg.reponame, branch, msg.pullreq_id, []))
 
     def receiveMsg_Repo_AltLoc_ReqMsg(self, msg, sender):
         assert isinstance(msg.altloc_reqmsg, GitmodulesData)
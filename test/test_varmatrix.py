@@ -0,0 +1,112 @@
+import shutil
+import pytest
+from thespian.actors import *
+from Briareus.BCGen.Generator import Generator, VarMatrix, LazyBldConfigs
+import Briareus.Input.Operations as BInput
+from Briareus.Input.Description import RepoDesc, VariableDesc
+from Briareus.Logic.InpFacts import varfilter_patterns, get_input_facts
+from Briareus.Types import BldConfig, BldRepoRev, BldVariable
+import test_example
+
+
+variables = [ VariableDesc('ghcver', ['ghc844', 'ghc865', 'ghc881']),
+              VariableDesc('system', ['linux', 'darwin']),
+]
+
+def combos(matrix):
+    return [ tuple([ v.varvalue for v in c ]) for c in matrix ]
+
+def test_unfiltered_matrix():
+    m = VarMatrix('proj', variables)
+    assert len(m) == 6
+    assert combos(m)[0] == ('ghc844', 'linux')
+    assert list(m)[0] == [ BldVariable('proj', 'ghcver', 'ghc844'),
+                           BldVariable('proj', 'system', 'linux') ]
+
+def test_no_variables_is_single_combination():
+    assert list(VarMatrix('proj', [])) == [ [] ]
+
+def test_filter_patterns():
+    assert varfilter_patterns([ { 'system': 'darwin', 'ghcver': ['ghc844', 'ghc865'] } ]) == [
+        [ ('ghcver', 'ghc844'), ('system', 'darwin') ],
+        [ ('ghcver', 'ghc865'), ('system', 'darwin') ],
+    ]
+
+def test_exclude_filter():
+    m = VarMatrix('proj', variables,
+                  { 'exclude': [ { 'system': 'darwin', 'ghcver': ['ghc844', 'ghc865'] } ] })
+    assert combos(m) == [ ('ghc844', 'linux'), ('ghc865', 'linux'),
+                          ('ghc881', 'linux'), ('ghc881', 'darwin') ]
+
+def test_include_and_exclude_filter():
+    m = VarMatrix('proj', variables,
+                  { 'include': [ { 'ghcver': 'ghc881' }, { 'system': 'linux' } ],
+                    'exclude': [ { 'ghcver': 'ghc844' } ] })
+    assert combos(m) == [ ('ghc865', 'linux'), ('ghc881', 'linux'), ('ghc881', 'darwin') ]
+
+def test_lazy_bldconfigs_expand():
+    blds = [ BldRepoRev('R1', 'master', 'project_primary') ]
+    cfgs = [ BldConfig('proj', 'regular', 'master', 'standard', 'main', blds, []),
+             BldConfig('proj', 'regular', 'dev', 'standard', 'branchreq', blds, []) ]
+    m = VarMatrix('proj', variables, { 'exclude': [ { 'system': 'darwin' } ] })
+    lazy = LazyBldConfigs(cfgs, m)
+    assert len(lazy) == 6
+    expanded = list(lazy)
+    assert len(expanded) == 6
+    assert expanded[0] == BldConfig('proj', 'regular', 'master', 'standard', 'main', blds,
+                                    [ BldVariable('proj', 'ghcver', 'ghc844'),
+                                      BldVariable('proj', 'system', 'linux') ])
+    assert expanded[0] in lazy
+    assert BldConfig('proj', 'regular', 'master', 'standard', 'main', blds,
+                     [ BldVariable('proj', 'ghcver', 'ghc844'),
+                       BldVariable('proj', 'system', 'darwin') ]) not in lazy
+    assert list(lazy) == expanded  # re-iterable
+
+def test_varfilter_facts():
+    repo_info = { 'subrepos': [], 'pullreqs': [], 'submodules': [],
+                  'branches': [ ('R1', 'master') ] }
+    RL = [ RepoDesc('R1', 'r1_url', project_repo=True) ]
+    plain = get_input_facts('proj', RL, [], variables, repo_info)
+    assert not [ f for f in plain if 'varcomb' in str(f) ]
+    facts = [ str(f) for f in get_input_facts('proj', RL, [], variables, repo_info,
+                                              varfilter={ 'exclude': [ { 'system': 'darwin' } ] })
+              if 'varcomb' in str(f) ]
+    assert facts == [ ':- discontiguous varcomb_exclude/2.',
+                      ':- discontiguous varcomb_include/2.',
+                      'varcomb_exclude("proj", [varvalue("proj", "system", "darwin")]).' ]
+
+
+filtered_input_spec = test_example.input_spec.replace(
+    ', "Reporting"',
+    ''', "VariableFilter" : {
+      "exclude": [ { "c_compiler": "clang", "ghcver": [ "ghc844", "ghc865" ] } ],
+      "include": [ { "ghcver": [ "ghc844", "ghc881" ] }, { "c_compiler": "gnucc" } ],
+  }
+, "Reporting"''')
+
+def filtered_bldconfigs(lazy_variables):
+    asys = ActorSystem('simpleSystemBase', transientUnique=True)
+    try:
+        asys.createActor(test_example.gitactor, globalName="GetGitInfo")
+        inp_desc, repo_info = BInput.input_desc_and_VCS_info(filtered_input_spec,
+                                                             actor_system=asys)
+        gen = Generator(actor_system=asys, lazy_variables=lazy_variables)
+        (rtype, cfgs) = gen.generate_build_configs(inp_desc, repo_info)
+    finally:
+        asys.shutdown()
+    assert rtype == "build_configs"
+    return cfgs.cfg_build_configs
+
+@pytest.mark.skipif(not shutil.which('swipl'), reason='requires swipl')
+def test_eager_filter_matches_lazy():
+    eager = filtered_bldconfigs(lazy_variables=False)
+    lazy = filtered_bldconfigs(lazy_variables=True)
+    assert isinstance(lazy, LazyBldConfigs)
+    assert len(eager) == len(lazy)
+    assert sorted(map(repr, eager)) == sorted(map(repr, lazy))
+    assert all([ c in lazy for c in eager ])
+    # The filter excluded some of the combinations
+    assert not [ c for c in eager
+                 if set([ (v.varname, v.varvalue) for v in c.bldvars ]) ==
+                    set([ ('c_compiler', 'clang'), ('ghcver', 'ghc865') ]) ]
+    assert eager